@@ -16,7 +16,7 @@ setup(name='slybot',
       url='http://github.com/scrapy/slybot',
       packages=find_packages(exclude=('tests', 'tests.*')),
       platforms=['Any'],
-      scripts=['bin/slybot', 'bin/portiacrawl'],
+      scripts=['bin/slybot', 'bin/portiacrawl', 'bin/portiamigrate'],
       install_requires=install_requires,
       extras_require=extras,
       package_data={'': ['slybot/splash-script-combined.js']},
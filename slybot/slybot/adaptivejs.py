@@ -0,0 +1,59 @@
+"""
+Learn which pages need to be rendered with Splash to extract data from them
+
+Pages are grouped by url pattern. While a pattern is unknown, its pages are
+downloaded without rendering and only sent to Splash when no complete items
+could be extracted from the raw page. The outcome of every rendered retry is
+recorded until the pattern is known to either need rendering or not.
+"""
+import re
+
+from six.moves.urllib_parse import urlparse
+
+DEFAULT_THRESHOLD = 3
+_DIGITS = re.compile(r'\d+')
+
+
+def url_pattern(url):
+    """Reduce a url to its host and the shape of its path
+
+    >>> url_pattern('http://example.com/product/123/red-shoes.html?id=4')
+    'example.com/product/0'
+    >>> url_pattern('http://example.com/product/98/blue-shoes.html')
+    'example.com/product/0'
+    """
+    parsed = urlparse(url)
+    path = _DIGITS.sub('0', parsed.path).split('/')[:-1]
+    return parsed.netloc + '/'.join(path)
+
+
+class AdaptiveJsRendering(object):
+    """Keep track of which url patterns need javascript rendering.
+
+    `threshold` is the number of pages that need to agree on a pattern before
+    the decision is considered final.
+    """
+
+    def __init__(self, threshold=DEFAULT_THRESHOLD):
+        self.threshold = threshold
+        self._outcomes = {}
+
+    def needs_js(self, url):
+        """Return whether `url` is known to need rendering"""
+        raw, rendered = self._outcomes.get(url_pattern(url), (0, 0))
+        return rendered >= self.threshold and rendered > raw
+
+    def should_retry(self, url):
+        """Return whether a raw page without items should be rendered"""
+        raw, rendered = self._outcomes.get(url_pattern(url), (0, 0))
+        return not (raw >= self.threshold and raw > rendered)
+
+    def record(self, url, needs_js):
+        """Record whether rendering was needed to extract data from `url`"""
+        pattern = url_pattern(url)
+        raw, rendered = self._outcomes.get(pattern, (0, 0))
+        if needs_js:
+            rendered += 1
+        else:
+            raw += 1
+        self._outcomes[pattern] = (raw, rendered)
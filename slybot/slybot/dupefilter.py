@@ -1,21 +1,135 @@
 """
 Duplicates filter middleware for autoscraping
+
+The versions of the items already scraped are kept in a version store, set
+with the SLYDUPEFILTER_STORE setting:
+
+* `slybot.dupefilter.DictVersionStore` (default) keeps the url of the first
+  item scraped for each version in memory.
+* `slybot.dupefilter.DigestVersionStore` only keeps the version digests.
+* `slybot.dupefilter.SqliteVersionStore` keeps the versions in a sqlite
+  database at SLYDUPEFILTER_STORE_PATH (or in JOBDIR) that is reused by later
+  crawls, so that only new or changed items are exported.
 """
+import os
+import sqlite3
+
 from scrapy.exceptions import NotConfigured
 from scrapy.exceptions import DropItem
+from scrapy.utils.misc import load_object
 
 from slybot.item import create_item_version
 
+DEFAULT_STORE = 'slybot.dupefilter.DictVersionStore'
+
+
+class DictVersionStore(object):
+    """Keep the url where each version was first seen in memory"""
+
+    def __init__(self):
+        self._versions = {}
+
+    @classmethod
+    def from_settings(cls, settings):
+        return cls()
+
+    def __contains__(self, version):
+        return version in self._versions
+
+    def __len__(self):
+        return len(self._versions)
+
+    def get_url(self, version):
+        return self._versions.get(version)
+
+    def add(self, version, url):
+        self._versions[version] = url
+
+    def close(self):
+        pass
+
+
+class DigestVersionStore(DictVersionStore):
+    """Keep only the fixed size version digests in memory"""
+
+    def __init__(self):
+        self._versions = set()
+
+    def get_url(self, version):
+        return None
+
+    def add(self, version, url):
+        self._versions.add(version)
+
+
+class SqliteVersionStore(object):
+    """Keep version digests in a sqlite database that persists across runs"""
+    commit_every = 1000
+
+    def __init__(self, path):
+        self._db = sqlite3.connect(path)
+        self._db.execute('CREATE TABLE IF NOT EXISTS versions '
+                         '(digest BLOB PRIMARY KEY, url TEXT)')
+        self._size = self._db.execute(
+            'SELECT COUNT(*) FROM versions').fetchone()[0]
+        self._pending = 0
+
+    @classmethod
+    def from_settings(cls, settings):
+        path = settings.get('SLYDUPEFILTER_STORE_PATH')
+        if not path and settings.get('JOBDIR'):
+            path = os.path.join(settings['JOBDIR'], 'item_versions.db')
+        if not path:
+            raise ValueError('SqliteVersionStore requires either the '
+                             'SLYDUPEFILTER_STORE_PATH or JOBDIR setting')
+        return cls(path)
+
+    def __contains__(self, version):
+        return self._lookup(version) is not None
+
+    def __len__(self):
+        return self._size
+
+    def get_url(self, version):
+        row = self._lookup(version)
+        return row[0] if row else None
+
+    def _lookup(self, version):
+        return self._db.execute('SELECT url FROM versions WHERE digest = ?',
+                                (sqlite3.Binary(version),)).fetchone()
+
+    def add(self, version, url):
+        self._db.execute('INSERT OR REPLACE INTO versions VALUES (?, ?)',
+                         (sqlite3.Binary(version), url))
+        self._size += 1
+        self._pending += 1
+        if self._pending >= self.commit_every:
+            self._db.commit()
+            self._pending = 0
+
+    def close(self):
+        self._db.commit()
+        self._db.close()
+
 
 class DupeFilterPipeline(object):
-    def __init__(self, settings):
+    def __init__(self, settings, stats=None):
         if not settings.getbool('SLYDUPEFILTER_ENABLED'):
             raise NotConfigured
-        self._itemversion_cache = {}
+        store_cls = load_object(settings.get('SLYDUPEFILTER_STORE') or
+                                DEFAULT_STORE)
+        self._itemversion_cache = store_cls.from_settings(settings)
+        self.stats = stats
 
     @classmethod
     def from_crawler(cls, crawler):
-        return cls(crawler.settings)
+        return cls(crawler.settings, crawler.stats)
+
+    def close_spider(self, spider):
+        if self.stats is not None:
+            self.stats.set_value('slydupefilter/store_size',
+                                 len(self._itemversion_cache), spider=spider)
+        self._itemversion_cache.close()
 
     def process_item(self, item, spider):
         """Checks whether a scrapy item is a dupe, based on version (not vary)
@@ -24,7 +138,16 @@ class DupeFilterPipeline(object):
             return item
         version = create_item_version(item)
         if version in self._itemversion_cache:
-            old_url = self._itemversion_cache[version]
+            self._inc_stats('hits', spider)
+            old_url = self._itemversion_cache.get_url(version)
+            if old_url is None:
+                raise DropItem("Duplicate product scraped at <%s>" %
+                               item["url"])
             raise DropItem("Duplicate product scraped at <%s>, first one was scraped at <%s>" % (item["url"], old_url))
-        self._itemversion_cache[version] = item["url"]
+        self._inc_stats('misses', spider)
+        self._itemversion_cache.add(version, item["url"])
         return item
+
+    def _inc_stats(self, key, spider):
+        if self.stats is not None:
+            self.stats.inc_value('slydupefilter/%s' % key, spider=spider)
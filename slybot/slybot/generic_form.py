@@ -54,8 +54,12 @@ class GenericForm:
                      not field_descriptor['file_values'])):
                 yield i, field_descriptor
 
-    def fill_generic_form(self, url, body, form_descriptor):
+    def fill_generic_form(self, url, body, form_descriptor, start=0):
+        """Generate the arguments for every combination of field values.
 
+        Combinations are produced lazily, skipping the first `start` ones so
+        that an interrupted crawl can resume where it left off.
+        """
         doc = html.document_fromstring(body, base_url=url)
         form = self._pick_node(doc, form_descriptor)
         if form is None:
@@ -65,8 +69,12 @@ class GenericForm:
         values = [self._get_field_values(form, field)
                   for field in form_descriptor['fields']]
 
-        for params in itertools.product(*values):
-            form_values = dict(_get_inputs(form, None, False, None, None))
+        # Inputs not being filled are the same for every combination
+        base_inputs = list(_get_inputs(form, None, False, None, None))
+        action, method = form.action or form.base_url, form.method
+        combinations = itertools.islice(itertools.product(*values), start, None)
+        for params in combinations:
+            form_values = dict(base_inputs)
             for name, option in params:
                 form_values[name] = option
-            yield list(form_values.items()), form.action or form.base_url, form.method
+            yield list(form_values.items()), action, method
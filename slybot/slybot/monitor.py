@@ -0,0 +1,176 @@
+"""
+This extension monitors the throughput and latency of a crawl.
+
+Over a sliding window of SLYMONITOR_WINDOW seconds it tracks the pages and
+items per second, the items extracted per page and the latency of raw and
+Splash downloads and of every extraction stage. Each
+SLYMONITOR_LOG_INTERVAL seconds the figures are logged and written to the
+stats.
+
+When SLYCLOSE_SPIDER_MIN_EFFICIENCY is set, the spider is closed if fewer
+items than that were extracted per 1000 pages crawled in the last window,
+once at least SLYCLOSE_SPIDER_EFFICIENCY_PAGES pages are in the window.
+"""
+import logging
+import math
+
+from collections import deque, defaultdict
+from time import time
+
+from twisted.internet import task
+
+from scrapy import signals
+from scrapy.exceptions import NotConfigured
+
+DEFAULT_WINDOW = 300
+DEFAULT_LOG_INTERVAL = 60
+DEFAULT_EFFICIENCY_PAGES = 1000
+PERCENTILES = (50, 95, 99)
+
+# Sent by the spider with the time taken by each extraction stage
+stage_latency = object()
+
+logger = logging.getLogger(__name__)
+
+
+def percentile(values, percent):
+    """Nearest rank percentile of a sorted list of values
+
+    >>> percentile([1, 2, 3, 4, 5, 6, 7, 8, 9, 10], 50)
+    5
+    >>> percentile([1, 2, 3, 4, 5, 6, 7, 8, 9, 10], 95)
+    10
+    """
+    if not values:
+        return None
+    rank = int(math.ceil(percent / 100.0 * len(values))) - 1
+    return values[min(max(rank, 0), len(values) - 1)]
+
+
+class SlidingWindow(object):
+    """Values recorded in the last `size` seconds"""
+
+    def __init__(self, size, clock=time):
+        self.size = size
+        self.clock = clock
+        self._events = deque()
+
+    def add(self, value=1):
+        self._events.append((self.clock(), value))
+
+    def values(self):
+        limit = self.clock() - self.size
+        events = self._events
+        while events and events[0][0] <= limit:
+            events.popleft()
+        return [value for _, value in events]
+
+    def __len__(self):
+        return len(self.values())
+
+
+class SlybotMonitor(object):
+
+    def __init__(self, crawler, clock=time):
+        settings = crawler.settings
+        if not settings.getbool('SLYMONITOR_ENABLED', True):
+            raise NotConfigured
+        self.crawler = crawler
+        self.clock = clock
+        self.window = settings.getint('SLYMONITOR_WINDOW', DEFAULT_WINDOW)
+        self.log_interval = settings.getint('SLYMONITOR_LOG_INTERVAL',
+                                            DEFAULT_LOG_INTERVAL)
+        self.min_efficiency = settings.getfloat(
+            'SLYCLOSE_SPIDER_MIN_EFFICIENCY', 0)
+        self.efficiency_pages = settings.getint(
+            'SLYCLOSE_SPIDER_EFFICIENCY_PAGES', DEFAULT_EFFICIENCY_PAGES)
+        self.pages = SlidingWindow(self.window, clock)
+        self.items = SlidingWindow(self.window, clock)
+        self.latencies = defaultdict(
+            lambda: SlidingWindow(self.window, clock))
+        self.started = None
+        self.task = None
+
+        crawler.signals.connect(self.spider_opened, signals.spider_opened)
+        crawler.signals.connect(self.spider_closed, signals.spider_closed)
+        crawler.signals.connect(self.response_received,
+                                signals.response_received)
+        crawler.signals.connect(self.item_scraped, signals.item_scraped)
+        crawler.signals.connect(self.stage_latency, stage_latency)
+
+    @classmethod
+    def from_crawler(cls, crawler):
+        return cls(crawler)
+
+    def spider_opened(self, spider):
+        self.started = self.clock()
+        self.task = task.LoopingCall(self.check, spider)
+        self.task.start(self.log_interval, now=False)
+
+    def spider_closed(self, spider):
+        if self.task is not None and self.task.running:
+            self.task.stop()
+        self.write_stats(spider)
+
+    def response_received(self, response, request, spider):
+        self.pages.add()
+        latency = request.meta.get('download_latency')
+        if latency is not None:
+            splash = '_splash_processed' in request.meta
+            self.latencies['download/%s' % ('splash' if splash else 'raw')
+                           ].add(latency)
+
+    def item_scraped(self, item, spider):
+        self.items.add()
+
+    def stage_latency(self, stage, latency, spider):
+        self.latencies[stage].add(latency)
+
+    def summary(self):
+        """Throughput and latency percentiles in the current window"""
+        elapsed = min(self.window, max(self.clock() - self.started, 1))
+        pages, items = len(self.pages), len(self.items)
+        summary = {
+            'pages_per_second': pages / float(elapsed),
+            'items_per_second': items / float(elapsed),
+            'items_per_1000_pages': (1000.0 * items / pages if pages
+                                     else None),
+            'pages_in_window': pages,
+        }
+        for stage, window in self.latencies.items():
+            values = sorted(window.values())
+            for percent in PERCENTILES:
+                key = '%s/p%d' % (stage, percent)
+                summary[key] = percentile(values, percent)
+        return summary
+
+    def write_stats(self, spider):
+        summary = self.summary()
+        for key, value in summary.items():
+            if value is not None:
+                self.crawler.stats.set_value('slybot/monitor/%s' % key,
+                                             value, spider=spider)
+        return summary
+
+    def check(self, spider):
+        summary = self.write_stats(spider)
+        efficiency = summary['items_per_1000_pages']
+        logger.info('Crawled %.2f pages/s, scraped %.2f items/s '
+                    '(%s items per 1000 pages) in the last %ds',
+                    summary['pages_per_second'], summary['items_per_second'],
+                    '-' if efficiency is None else '%.1f' % efficiency,
+                    self.window, extra={'spider': spider})
+        for stage in sorted(self.latencies):
+            if summary['%s/p50' % stage] is None:
+                continue
+            logger.info('%s latency: p50=%.3fs p95=%.3fs p99=%.3fs', stage,
+                        *[summary['%s/p%d' % (stage, p)] for p in PERCENTILES],
+                        extra={'spider': spider})
+        if (self.min_efficiency and efficiency is not None and
+                summary['pages_in_window'] >= self.efficiency_pages and
+                efficiency < self.min_efficiency):
+            logger.info('Closing spider because of low extraction efficiency:'
+                        ' %.1f items per 1000 pages', efficiency,
+                        extra={'spider': spider})
+            self.crawler.engine.close_spider(spider,
+                                             'slybot_low_efficiency')
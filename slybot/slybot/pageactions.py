@@ -24,6 +24,12 @@ function main(splash) {
 }
 """
 
+# Backreferences and inline flags change meaning when patterns are combined
+_UNCOMBINABLE = re.compile(r'\\[1-9]|\(\?P=|\(\?[iLmsux]+\)')
+# Python 2 regexes can't have more than 100 groups
+_MAX_GROUPS = 99
+
+
 def filter_for_url(url):
     def _filter(page_action):
         accept = page_action.get('accept')
@@ -35,21 +41,121 @@ def filter_for_url(url):
         return True
     return _filter
 
+
+def _combine_patterns(patterns):
+    """Return a function that finds which of `patterns` match a url using a
+    single regex made of optional lookaheads, one per pattern, or None if
+    they can't be combined.
+    """
+    if any(_UNCOMBINABLE.search(p) for p in patterns):
+        return None
+    combined = ''.join('(?:(?=.*?(?P<_pa%d>%s)))?' % (i, p)
+                       for i, p in enumerate(patterns))
+    try:
+        match = re.compile(combined, re.S).match
+    except (re.error, AssertionError):  # sre raises AssertionError on
+        return None                     # too many groups
+    groups = ['_pa%d' % i for i in range(len(patterns))]
+
+    def _matches(url):
+        found = match(url)
+        return [found.group(g) is not None for g in groups]
+    return _matches
+
+
+def _compile_patterns(patterns):
+    """Return a function that finds which of `patterns` match a url.
+
+    When possible patterns are combined in as few regexes as the limit of
+    groups per regex allows, so a url is only scanned a few times.
+    """
+    matchers, chunk, groups = [], [], 0
+    for pattern in patterns:
+        # Each pattern adds its own groups plus the one wrapping it
+        pattern_groups = re.compile(pattern).groups + 1
+        if chunk and groups + pattern_groups > _MAX_GROUPS:
+            matchers.append(_compile_chunk(chunk))
+            chunk, groups = [], 0
+        chunk.append(pattern)
+        groups += pattern_groups
+    if chunk:
+        matchers.append(_compile_chunk(chunk))
+    if len(matchers) == 1:
+        return matchers[0]
+    return lambda url: [found for matcher in matchers
+                        for found in matcher(url)]
+
+
+def _compile_chunk(patterns):
+    matcher = _combine_patterns(patterns)
+    if matcher is None:
+        searches = [re.compile(p).search for p in patterns]
+        matcher = lambda url: [search(url) is not None for search in searches]
+    return matcher
+
+
+class PageActions(object):
+    """Page actions of a spider prepared to be matched against urls.
+
+    The splash arguments are built once for each distinct set of actions.
+    """
+    def __init__(self, page_actions):
+        self.page_actions = page_actions
+        patterns = []
+        for action in page_actions:
+            for key in ('accept', 'reject'):
+                if action.get(key) and action[key] not in patterns:
+                    patterns.append(action[key])
+        self._match_patterns = _compile_patterns(patterns)
+        index = lambda pattern: patterns.index(pattern) if pattern else None
+        self._rules = [(index(a.get('accept')), index(a.get('reject')))
+                       for a in page_actions]
+        self._events = [json.dumps(action) for action in page_actions]
+        self._splash_args = {}
+
+    def matching(self, url):
+        """Return the indexes of the page actions to run in `url`"""
+        if not self.page_actions:
+            return ()
+        matches = self._match_patterns(url)
+        return tuple(i for i, (accept, reject) in enumerate(self._rules)
+                     if (reject is None or not matches[reject]) and
+                     (accept is None or matches[accept]))
+
+    def splash_args(self, url):
+        actions = self.matching(url)
+        if not actions:
+            return
+        try:
+            return self._splash_args[actions]
+        except KeyError:
+            events = '[%s]' % ', '.join(self._events[i] for i in actions)
+            args = self._splash_args[actions] = {
+                "lua_source": LUA_SOURCE,
+                "slybot_actions_source": (JS_SOURCE % events),
+            }
+            return args
+
+
 class PageActionsMiddleware(object):
+    def __init__(self):
+        self._page_actions = PageActions([])
+
     def process_request(self, request, spider):
         splash_options = request.meta.get('splash', None)
         if not splash_options: # Already processed or JS disabled
             return
         splash_args = splash_options.get('args', {})
-        events = spider.page_actions
-        url = splash_args['url']
-        events = filter(filter_for_url(url), events)
-        if len(events):
+        page_actions = self._get_page_actions(spider)
+        args = page_actions.splash_args(splash_args['url'])
+        if args:
             splash_options['endpoint'] = 'execute'
-            splash_args.update({
-                "lua_source": LUA_SOURCE,
-                "slybot_actions_source": (JS_SOURCE % json.dumps(events)),
-            })
+            splash_args.update(args)
 
-__all__ = ['PageActionsMiddleware']
+    def _get_page_actions(self, spider):
+        page_actions = spider.page_actions
+        if self._page_actions.page_actions is not page_actions:
+            self._page_actions = PageActions(page_actions)
+        return self._page_actions
 
+__all__ = ['PageActionsMiddleware']
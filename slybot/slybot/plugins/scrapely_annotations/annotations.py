@@ -32,7 +32,9 @@ class Annotations(object):
         """
         Perform any initialization needed for crawling using this plugin
         """
-        templates = map(self._get_annotated_template, spec['templates'])
+        cache = settings.get('SLYSAMPLE_CACHE')
+        templates = [self._get_annotated_template(t, cache)
+                     for t in spec['templates']]
 
         _item_template_pages = sorted((
             [t.get('scrapes'), dict_to_page(t, 'annotated_body'),
@@ -94,9 +96,9 @@ class Annotations(object):
 
         self.build_url_filter(spec)
 
-    def _get_annotated_template(self, template):
+    def _get_annotated_template(self, template, cache=None):
         if template.get('version', '0.12.0') >= '0.13.0':
-            _build_sample(template)
+            _build_sample(template, cache)
         return template
 
     def handle_html(self, response, seen=None):
@@ -1,20 +1,161 @@
+import hashlib
 import json
+import os
 
 from scrapy import Selector
 from scrapely.htmlpage import parse_html, HtmlTag, HtmlDataFragment
 
-from collections import defaultdict
-from itertools import tee, count, chain, groupby
+from collections import defaultdict, OrderedDict
+from copy import deepcopy
+from itertools import count, chain, groupby
 from operator import itemgetter
 from uuid import uuid4
 
-from .utils import (serialize_tag, add_tagids, remove_tagids, TAGID,
-                    OPEN_TAG, CLOSE_TAG, UNPAIRED_TAG, GENERATEDTAGID)
+from .utils import (serialize_tag, _must_add_tagid, TAGID, OPEN_TAG,
+                    CLOSE_TAG, UNPAIRED_TAG, GENERATEDTAGID)
+
+
+class AnnotatedBodyCache(object):
+    """Content addressed cache of annotated bodies.
+
+    Entries are keyed by a hash of the original body and the annotations
+    applied to it and hold the annotated body along with the annotations as
+    they were left by the build. The most recently used entries are kept in
+    memory, up to `max_memory` bytes, and, when `path` is set, every entry
+    is also stored in that directory so it can be reused by later processes.
+    When the stored entries take more than `max_size` bytes the least
+    recently used ones are deleted. The directory is only listed the first
+    time it is used, the size of the entries written afterwards is tracked
+    as they are written.
+    """
+    max_memory = 64 * 1024 * 1024
+    max_size = 256 * 1024 * 1024
+
+    def __init__(self, path=None, max_size=None, max_memory=None):
+        self.path = path
+        if max_size is not None:
+            self.max_size = max_size
+        if max_memory is not None:
+            self.max_memory = max_memory
+        self._entries = OrderedDict()
+        self._memory = 0
+        self._files = None
+        self._disk_size = 0
+
+    @staticmethod
+    def key(annotations, body):
+        if not isinstance(body, bytes):
+            body = body.encode('utf-8')
+        digest = hashlib.sha1(body)
+        digest.update(json.dumps(annotations, sort_keys=True).encode('utf-8'))
+        return digest.hexdigest()
+
+    def get(self, key):
+        """Return the annotated body and built annotations for `key` or None.
+
+        The annotations are a copy that the caller is free to modify.
+        """
+        entry = self._entries.pop(key, None)
+        if entry is not None:
+            self._memory -= entry[2]
+        else:
+            entry = self._read(key)
+            if entry is None:
+                return None
+        self._remember(key, entry)
+        body, annotations, _ = entry
+        return body, deepcopy(annotations)
+
+    def set(self, key, body, annotations):
+        data = self._serialize(body, annotations)
+        self._remember(key, (body, deepcopy(annotations), len(data)))
+        if self.path:
+            self._write(key, data)
+
+    @staticmethod
+    def _serialize(body, annotations):
+        data = json.dumps({'body': body, 'annotations': annotations})
+        if not isinstance(data, bytes):
+            data = data.encode('utf-8')
+        return data
+
+    def _remember(self, key, entry):
+        self._entries[key] = entry
+        self._memory += entry[2]
+        while self._memory > self.max_memory and len(self._entries) > 1:
+            _, evicted = self._entries.popitem(last=False)
+            self._memory -= evicted[2]
+
+    def _read(self, key):
+        if not self.path:
+            return None
+        path = os.path.join(self.path, key)
+        try:
+            with open(path, 'rb') as f:
+                data = f.read()
+            entry = json.loads(data.decode('utf-8'))
+            body, annotations = entry['body'], entry['annotations']
+            os.utime(path, None)  # Mark as recently used
+        except (IOError, OSError, ValueError, KeyError, TypeError):
+            return None
+        self._track(key, len(data))
+        return body, annotations, len(data)
+
+    def _write(self, key, data):
+        path = os.path.join(self.path, key)
+        # Write and rename so other processes never read a partial entry
+        tmp_path = '%s.%s.tmp' % (path, os.getpid())
+        try:
+            if not os.path.isdir(self.path):
+                os.makedirs(self.path)
+            with open(tmp_path, 'wb') as f:
+                f.write(data)
+            os.rename(tmp_path, path)
+        except (IOError, OSError):
+            return
+        self._track(key, len(data))
+        self._evict()
+
+    def _stored_files(self):
+        """Sizes of the stored entries from the least recently used"""
+        if self._files is None:
+            files = []
+            try:
+                filenames = os.listdir(self.path)
+            except OSError:
+                filenames = []
+            for filename in filenames:
+                if filename.endswith('.tmp'):
+                    continue
+                try:
+                    stat = os.stat(os.path.join(self.path, filename))
+                except OSError:
+                    continue
+                files.append((stat.st_mtime, filename, stat.st_size))
+            self._files = OrderedDict((filename, size)
+                                      for _, filename, size in sorted(files))
+            self._disk_size = sum(self._files.values())
+        return self._files
+
+    def _track(self, key, size):
+        files = self._stored_files()
+        self._disk_size += size - files.pop(key, 0)
+        files[key] = size
+
+    def _evict(self):
+        files = self._stored_files()
+        while self._disk_size > self.max_size and files:
+            filename, size = files.popitem(last=False)
+            self._disk_size -= size
+            try:
+                os.remove(os.path.join(self.path, filename))
+            except OSError:
+                pass
 
 
 class Annotations(object):
 
-    def save_extraction_data(self, data, template, options={}):
+    def save_extraction_data(self, data, template, options={}, cache=None):
         """
         data = {
             extracts: [
@@ -42,9 +183,20 @@ class Annotations(object):
         """
         annotation_data = _clean_annotation_data(data.get('extracts', []))
         data['extracts'] = annotation_data
-        template['annotated_body'] = apply_annotations(
-            annotation_data,
-            template[options.get('body', 'original_body')])
+        body = template[options.get('body', 'original_body')]
+        if cache is None:
+            template['annotated_body'] = apply_annotations(annotation_data,
+                                                           body)
+            return data
+        key = cache.key(annotation_data, body)
+        cached = cache.get(key)
+        if cached is None:
+            annotated_body = apply_annotations(annotation_data, body)
+            cache.set(key, annotated_body, annotation_data)
+        else:
+            # Leave the annotations as a build would have left them
+            annotated_body, data['extracts'] = cached
+        template['annotated_body'] = annotated_body
         return data
 
 
@@ -317,15 +469,70 @@ def apply_selector_annotations(annotations, target_page):
     return converted_annotations
 
 
+class _TokenStream(object):
+    """Iterator over parsed tokens that can be looked ahead of"""
+
+    def __init__(self, tokens):
+        self.tokens = tokens
+        self.position = 0
+
+    def __iter__(self):
+        return self
+
+    def __next__(self):
+        if self.position >= len(self.tokens):
+            raise StopIteration
+        token = self.tokens[self.position]
+        self.position += 1
+        return token
+    next = __next__
+
+    def lookahead(self):
+        """Iterate over the next tokens without consuming them"""
+        tokens = self.tokens
+        return (tokens[i] for i in range(self.position, len(tokens)))
+
+
+def _number_tags(html):
+    """Parse `html` and number its tags like `add_tagids` does"""
+    elements = list(parse_html(html))
+    tagcount = count()
+    for element in elements:
+        if _must_add_tagid(element):
+            element.attributes[TAGID] = str(next(tagcount))
+            # Same attribute order as if the numbered tag had been parsed
+            element.attributes = dict(element.attributes.items())
+    return elements
+
+
+def _numbered_html(elements, html):
+    return ''.join(serialize_tag(element) if _must_add_tagid(element)
+                   else html[element.start:element.end]
+                   for element in elements)
+
+
+def _source(element, html):
+    """Source of `element` in the annotated body"""
+    if _must_add_tagid(element):
+        return serialize_tag(element, exclude=(TAGID,))
+    return html[element.start:element.end]
+
+
 def apply_annotations(annotations, target_page):
+    """Add the annotations to `target_page` and return the annotated body.
+
+    The page is tokenized once. Tags are numbered on the tokens, CSS
+    selectors are resolved against a single lxml tree of the numbered page
+    and the annotated body is written from the tokens without the numbers.
+    """
     selector_annotations, tagid_annotations = _filter_annotations(annotations)
     inserts = defaultdict(list)
-    numbered_html = add_tagids(target_page)
+    elements = _number_tags(target_page)
     if selector_annotations:
         converted_annotations = apply_selector_annotations(
-            selector_annotations, numbered_html)
+            selector_annotations, _numbered_html(elements, target_page))
         tagid_annotations += converted_annotations
-    target = iter(parse_html(numbered_html))
+    target = _TokenStream(elements)
     output, tag_stack = [], []
     element = next(target)
     last_id = 0
@@ -342,7 +549,7 @@ def apply_annotations(annotations, target_page):
             # Move target until replacement/insertion point
             while True:
                 while not isinstance(element, HtmlTag) or element.tag == 'ins':
-                    output.append(numbered_html[element.start:element.end])
+                    output.append(_source(element, target_page))
                     element = next(target)
                 if element.tag_type in {OPEN_TAG, UNPAIRED_TAG}:
                     last_id = element.attributes.get(TAGID)
@@ -351,7 +558,7 @@ def apply_annotations(annotations, target_page):
                     if ('__added' not in element.attributes and
                             last_id is not None and aid is not None and
                             int(last_id) < int(aid)):
-                        output.append(numbered_html[element.start:element.end])
+                        output.append(_source(element, target_page))
                         element.attributes['__added'] = True
                     last_inserted = tag_stack.pop()
                     to_insert = inserts.pop(last_inserted, None)
@@ -372,7 +579,7 @@ def apply_annotations(annotations, target_page):
                 if (last_id is not None and aid is not None and
                         int(last_id) < int(aid)):
                     if '__added' not in element.attributes:
-                        output.append(numbered_html[element.start:element.end])
+                        output.append(_source(element, target_page))
                         element.attributes['__added'] = True
                     element = next(target)
                 else:
@@ -394,20 +601,22 @@ def apply_annotations(annotations, target_page):
                         element.attributes[key] = val
             next_text_section = ''
             if generated:
-                inner_data, target = tee(target)
-                nodes = _get_inner_nodes(inner_data)
+                nodes = _get_inner_nodes(target.lookahead())
                 next_text_section = _get_generated_annotation(
-                    element, generated, nodes, numbered_html, inserts)
+                    element, generated, nodes, target_page, inserts)
             if next_generated:
-                inner_data, target = tee(target)
                 open_tags = 0 if element.tag_type == UNPAIRED_TAG else 1
-                nodes = _get_inner_nodes(inner_data, open_tags=open_tags,
+                nodes = _get_inner_nodes(target.lookahead(),
+                                         open_tags=open_tags,
                                          insert_after=True)
                 next_text_section = _get_generated_annotation(
-                    element, next_generated, nodes, numbered_html, inserts)
+                    element, next_generated, nodes, target_page, inserts)
 
             if '__added' not in element.attributes:
-                output.append(serialize_tag(element))
+                # Keep the attribute order annotated tags had when they were
+                # parsed again to remove the tag numbers
+                element.attributes = dict(element.attributes.items())
+                output.append(serialize_tag(element, exclude=(TAGID,)))
                 element.attributes['__added'] = True
             # If an <ins> tag has been inserted we need to move forward
             if next_text_section:
@@ -416,12 +625,12 @@ def apply_annotations(annotations, target_page):
                     if (isinstance(elem, HtmlDataFragment) and
                             elem.is_text_content):
                         break
-                    output.append(numbered_html[elem.start:elem.end])
+                    output.append(_source(elem, target_page))
                 output.append(next_text_section)
     # Reached the end of the document
     except StopIteration:
-        output.append(numbered_html[element.start:element.end])
+        output.append(_source(element, target_page))
     else:
         for element in target:
-            output.append(numbered_html[element.start:element.end])
-    return remove_tagids(''.join(output))
+            output.append(_source(element, target_page))
+    return ''.join(output)
@@ -22,11 +22,17 @@ Handle generated annotations
     3. Remove extra annotation metadata
 """
 import json
+import os
+import re
 
 import slybot
 
+from collections import Counter
+from copy import deepcopy
 from itertools import chain, groupby
+from multiprocessing import Pool
 from operator import itemgetter
+from time import time
 from urllib import unquote
 from uuid import uuid4
 
@@ -36,6 +42,68 @@ from scrapy import Selector
 from slybot.plugins.scrapely_annotations.utils import add_tagids
 SLYBOT_VERSION = slybot.__version__
 IGNORE_ATTRIBUTES = ['data-scrapy-ignore', 'data-scrapy-ignore-beneath']
+# Names that can be looked up in a DocumentIndex, selectors using any other
+# name are checked with a CSS query
+_CSS_IDENT = re.compile(r'^-?[_a-zA-Z][_a-zA-Z0-9-]*$')
+_CSS_NAME = re.compile(r'^[_a-zA-Z0-9-]+$')
+_CLASS_SEPARATOR = re.compile(r'[ \t\r\n]+')
+
+
+class DocumentIndex(object):
+    """Elements by tagid and frequency of ids and classes in a document.
+
+    Allows checking whether the selectors built by `find_css_selector` are
+    unique with dictionary lookups instead of querying the whole document.
+    """
+
+    def __init__(self, sel):
+        self.sel = sel
+        self.tagids = {}
+        self._counts = Counter()
+        root = sel._root
+        self._add(root, 1)
+        for parent in root.iter():
+            if not isinstance(parent.tag, basestring):
+                continue
+            tagid = parent.get('data-tagid')
+            if tagid is not None and tagid not in self.tagids:
+                self.tagids[tagid] = parent
+            position = 0
+            for child in parent:
+                if isinstance(child.tag, basestring):
+                    position += 1
+                    self._add(child, position)
+
+    def _add(self, elem, position):
+        counts = self._counts
+        elem_id = elem.get('id')
+        if elem_id:
+            counts['#%s' % elem_id] += 1
+        for class_name in set(_CLASS_SEPARATOR.split(elem.get('class', ''))):
+            if class_name:
+                selector = '.%s' % class_name
+                counts[selector] += 1
+                counts[elem.tag + selector] += 1
+                counts['%s%s:nth-child(%s)' % (elem.tag, selector,
+                                               position)] += 1
+
+    def is_unique(self, selector, tag=None, class_name=None, elem_id=None):
+        """Whether `selector`, built from the given tag name, class name or
+        id, matches a single element"""
+        if ((tag is None or _CSS_IDENT.match(tag)) and
+                (class_name is None or _CSS_IDENT.match(class_name)) and
+                (elem_id is None or _CSS_NAME.match(elem_id))):
+            return self._counts[selector] == 1
+        return len(self.sel.css(selector)) == 1
+
+    def find(self, tagid):
+        return self.tagids.get(str(tagid))
+
+
+def _document_index(sel):
+    if isinstance(sel, DocumentIndex):
+        return sel
+    return DocumentIndex(sel)
 
 
 def short_guid():
@@ -63,7 +131,7 @@ def port_sample(sample):
 
     # Group annotations by type
     annotations = sample['plugins']['annotations-plugin']['extracts']
-    sel = Selector(text=add_tagids(sample['original_body']))
+    sel = DocumentIndex(Selector(text=add_tagids(sample['original_body'])))
     annotations = port_standard(annotations, sel, sample)
     standard_annos, generated_annos, variant_annos = [], [], []
     for a in annotations:
@@ -85,12 +153,84 @@ def port_sample(sample):
     return sample
 
 
+def needs_migration(sample):
+    return sample.get('version', '0.12.0') < '0.13.0'
+
+
+def migrate_project(project_dir, processes=None):
+    """Port every sample in `project_dir` made before slybot 0.13 in place.
+
+    Spider files are migrated in parallel by a pool of `processes` workers
+    (one per CPU by default). Yields `(sample, seconds, error)` for each
+    sample ported, `error` being None if it was ported successfully.
+    """
+    spec_base = os.path.join(project_dir, 'spiders')
+    paths = []
+    for fname in sorted(os.listdir(spec_base)):
+        path = os.path.join(spec_base, fname)
+        if fname.endswith('.json'):
+            paths.append(path)
+        elif os.path.isdir(path):
+            paths.extend(os.path.join(path, template)
+                         for template in sorted(os.listdir(path))
+                         if template.endswith('.json'))
+    if processes == 1:
+        for path in paths:
+            for result in migrate_file(path):
+                yield result
+        return
+    pool = Pool(processes)
+    try:
+        for file_results in pool.imap_unordered(migrate_file, paths):
+            for result in file_results:
+                yield result
+    finally:
+        # Workers are left behind if the caller stops early or one fails
+        pool.terminate()
+        pool.join()
+
+
+def migrate_file(path):
+    """Port the legacy samples stored in the spider or sample at `path`.
+
+    The file is only written if a sample was ported. Returns a list of
+    `(sample, seconds, error)` for each of them.
+    """
+    with open(path) as f:
+        spec = json.load(f)
+    name = os.path.splitext(path)[0]
+    if 'original_body' in spec:
+        samples = [(name, spec)]
+    else:
+        samples = [('%s#%s' % (name, sample.get('page_id') or i), sample)
+                   for i, sample in enumerate(spec.get('templates', []))]
+    results = []
+    for sample_name, sample in samples:
+        if not needs_migration(sample):
+            continue
+        start, error = time(), None
+        try:
+            ported = port_sample(deepcopy(sample))
+        except Exception as e:
+            error = '%s: %s' % (e.__class__.__name__, e)
+        else:
+            sample.clear()
+            sample.update(ported)
+        results.append((sample_name, time() - start, error))
+    if any(error is None for _, _, error in results):
+        with open(path, 'w') as f:
+            json.dump(spec, f, sort_keys=True, indent=4)
+    return results
+
+
 def find_element(tagid, sel):
     """Find an element by its tagid."""
     if isinstance(tagid, _Element):
         return tagid
     if isinstance(tagid, dict):
         tagid = tagid.get('tagid')
+    if isinstance(sel, DocumentIndex):
+        return sel.find(tagid)
     elements = sel.xpath('//*[@data-tagid="%s"]' % tagid)
     if elements:
         return elements[0]._root
@@ -112,8 +252,10 @@ def find_css_selector(elem, sel, depth=0, previous_tbody=False):
             index = 0
         return index
 
+    sel = _document_index(sel)
     elem_id = elem.attrib.get('id')
-    if elem_id and len(sel.css('#%s' % elem_id)) == 1 and depth > 1:
+    if (elem_id and depth > 1 and
+            sel.is_unique('#%s' % elem_id, elem_id=elem_id)):
         return '#%s' % elem_id
 
     # Inherently unique by tag name
@@ -127,18 +269,15 @@ def find_css_selector(elem, sel, depth=0, previous_tbody=False):
     if classes:
         for class_name in classes:
             selector = '.%s' % class_name
-            matches = sel.css(selector)
-            if len(matches) == 1:
+            if sel.is_unique(selector, class_name=class_name):
                 return selector
             # Maybe it's unique with a tag name?
             selector = tag_name + selector
-            matches = sel.css(selector)
-            if len(matches) == 1:
+            if sel.is_unique(selector, tag_name, class_name):
                 return selector
             # Maybe it's unique using a tag name and nth-child
             selector = '%s:nth-child(%s)' % (selector, children_index(elem))
-            matches = sel.css(selector)
-            if len(matches) == 1:
+            if sel.is_unique(selector, tag_name, class_name):
                 return selector
 
     # Not unique enough yet.  As long as it's not a child of the document,
@@ -41,10 +41,11 @@ def _quotify(mystr):
     return quote + mystr + quote
 
 
-def serialize_tag(tag):
+def serialize_tag(tag, exclude=()):
     """
     Converts a tag into a string when a slice [tag.start:tag.end]
-    over the source can't be used because tag has been modified
+    over the source can't be used because tag has been modified.
+    Attributes in `exclude` are left out.
     """
     out = "<"
     if tag.tag_type == HtmlTagType.CLOSE_TAG:
@@ -53,6 +54,8 @@ def serialize_tag(tag):
 
     attributes = []
     for key, val in tag.attributes.items():
+        if key in exclude:
+            continue
         aout = key
         if val is not None:
             aout += "=" + _quotify(val)
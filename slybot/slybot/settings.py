@@ -1,6 +1,9 @@
 from __future__ import absolute_import
 SPIDER_MANAGER_CLASS = 'slybot.spidermanager.SlybotSpiderManager'
-EXTENSIONS = {'slybot.closespider.SlybotCloseSpider': 1}
+EXTENSIONS = {
+    'slybot.closespider.SlybotCloseSpider': 1,
+    'slybot.monitor.SlybotMonitor': 2
+}
 ITEM_PIPELINES = {'slybot.dupefilter.DupeFilterPipeline': 1}
 SPIDER_MIDDLEWARES = {'slybot.spiderlets.SpiderletsMiddleware': 999}  # as close as possible to spider output
 DOWNLOADER_MIDDLEWARES = {
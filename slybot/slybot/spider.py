@@ -3,6 +3,7 @@ import json
 import six
 
 from copy import deepcopy
+from time import time
 import itertools
 from six.moves.urllib_parse import urlparse
 
@@ -18,12 +19,15 @@ from slybot.utils import (
     iter_unique_scheme_hostname, load_plugins, load_plugin_names, IndexedDict,
     include_exclude_filter
 )
+from slybot.adaptivejs import AdaptiveJsRendering, DEFAULT_THRESHOLD
 from slybot.linkextractor import create_linkextractor_from_specs
+from slybot.monitor import stage_latency
 from slybot.starturls import StartUrls, UrlGenerator
 from slybot.generic_form import GenericForm
 STRING_KEYS = ['start_urls', 'exclude_patterns', 'follow_patterns',
                'allowed_domains', 'js_enabled', 'js_enable_patterns',
                'js_disable_patterns']
+DEFAULT_FORM_BATCH_SIZE = 100
 
 
 class IblSpider(SitemapSpider):
@@ -34,6 +38,7 @@ class IblSpider(SitemapSpider):
             'generated_urls': UrlGenerator(settings, kw)
         }
         self.generic_form = GenericForm(**kw)
+        self._form_generators = {}
         super(IblSpider, self).__init__(name, **kw)
         spec = deepcopy(spec)
         self._add_spider_args_to_spec(spec, kw)
@@ -125,21 +130,76 @@ class IblSpider(SitemapSpider):
         yield self.get_generic_form_start_request(form_descriptor)
 
     def parse_form_page(self, response):
-        fill_form = self.generic_form.fill_generic_form
+        """Schedule the first batch of form submissions for this form.
+
+        The rest of the combinations are generated as the submitted forms
+        are downloaded so that at most `SLYFORM_BATCH_SIZE` of them are
+        pending at any time.
+        """
+        key = response.url
+        progress = self._get_form_progress()
         try:
-            for (args, url, method) in fill_form(response.url, response.body,
-                                                 response.request.meta):
-                yield FormRequest(url, method=method, formdata=args,
-                                  callback=self.after_form_page,
-                                  dont_filter=True)
+            forms = self.generic_form.fill_generic_form(
+                response.url, response.body, response.request.meta,
+                progress.get(key, 0))
+            self._form_generators[key] = forms
+            for _ in range(self.form_batch_size):
+                request = self._next_form_request(key)
+                if request is None:
+                    break
+                yield request
         except Exception as e:
+            self._form_generators.pop(key, None)
             self.logger.warning(str(e))
         for req in self._start_requests:
             yield req
 
     def after_form_page(self, response):
+        key = response.meta.get('form_key')
+        self._form_request_done(key)
         for result in self.parse(response):
             yield result
+        request = self._next_form_request(key)
+        if request is not None:
+            yield request
+
+    def _form_request_failed(self, failure):
+        self.logger.warning(failure.getErrorMessage())
+        key = failure.request.meta.get('form_key')
+        self._form_request_done(key)
+        return self._next_form_request(key)
+
+    def _form_request_done(self, key):
+        # Only finished submissions are counted so that a restarted crawl
+        # submits again those that were pending. They may finish out of
+        # order, so a few may be submitted twice but none is skipped.
+        progress = self._get_form_progress()
+        progress[key] = progress.get(key, 0) + 1
+
+    def _next_form_request(self, key):
+        forms = self._form_generators.get(key)
+        if forms is None:
+            return
+        try:
+            args, url, method = next(forms)
+        except StopIteration:
+            del self._form_generators[key]
+            return
+        except Exception as e:
+            del self._form_generators[key]
+            self.logger.warning(str(e))
+            return
+        return FormRequest(url, method=method, formdata=args,
+                           meta={'form_key': key},
+                           callback=self.after_form_page,
+                           errback=self._form_request_failed,
+                           dont_filter=True)
+
+    def _get_form_progress(self):
+        # `state` is persisted across restarts by scrapy when JOBDIR is set
+        if getattr(self, 'state', None) is None:
+            self.state = {}
+        return self.state.setdefault('generic_form_progress', {})
 
     def _get_allowed_domains(self, templates):
         urls = [x['url'] for x in templates]
@@ -182,6 +242,8 @@ class IblSpider(SitemapSpider):
                 response._url = url
         content_type = response.headers.get('Content-Type', '')
         if isinstance(response, HtmlResponse):
+            if request and request.meta.get('js_adaptive'):
+                return self._handle_adaptive_js(response)
             return self.handle_html(response)
         if (isinstance(response, XmlResponse) or
                 response.url.endswith(('.xml', '.xml.gz'))):
@@ -210,7 +272,10 @@ class IblSpider(SitemapSpider):
         return results
 
     def _handle(self, hook, response, *extrasrgs):
-        generators = self._plugin_hook(hook, response, *extrasrgs)
+        generators = [self._timed('%s/%s' % (hook, name),
+                                  getattr(plugin, hook)(response, *extrasrgs))
+                      for name, plugin in self.plugins.items()
+                      if hasattr(plugin, hook)]
         for item_or_request in itertools.chain(*generators):
             if isinstance(item_or_request, Request):
                 self._plugin_hook('process_request', item_or_request, response)
@@ -220,6 +285,27 @@ class IblSpider(SitemapSpider):
                 item_or_request = self._add_splash_meta(item_or_request)
             yield item_or_request
 
+    def _timed(self, stage, results):
+        """Report the time spent producing `results` as `stage` latency"""
+        crawler = getattr(self, 'crawler', None)
+        if crawler is None:
+            for result in results:
+                yield result
+            return
+        elapsed = 0
+        results = iter(results)
+        while True:
+            start = time()
+            try:
+                result = next(results)
+            except StopIteration:
+                break
+            finally:
+                elapsed += time() - start
+            yield result
+        crawler.signals.send_catch_log(stage_latency, stage=stage,
+                                       latency=elapsed, spider=self)
+
     def handle_xml(self, response):
         return self._handle('handle_xml', response, set([]))
 
@@ -239,7 +325,13 @@ class IblSpider(SitemapSpider):
                 settings.get('SPLASH_USER', ''),
                 settings.get('SPLASH_PASS', ''))
         self.splash_wait = settings.getint('SPLASH_WAIT', 5)
+        self.form_batch_size = settings.getint('SLYFORM_BATCH_SIZE',
+                                               DEFAULT_FORM_BATCH_SIZE)
         self._filter_js_urls = self._build_js_url_filter(spec)
+        self.js_adaptive = None
+        if self.js_enabled and settings.getbool('SPLASH_ADAPTIVE'):
+            self.js_adaptive = AdaptiveJsRendering(settings.getint(
+                'SPLASH_ADAPTIVE_THRESHOLD', DEFAULT_THRESHOLD))
 
     def _build_js_url_filter(self, spec):
         if not self.js_enabled:
@@ -250,15 +342,67 @@ class IblSpider(SitemapSpider):
 
     def _add_splash_meta(self, request):
         if self.js_enabled and self._filter_js_urls(request.url):
-            cleaned_url = urlparse(request.url)._replace(params='', query='',
-                                                         fragment='').geturl()
-            request.meta['splash'] = {
-                'endpoint': 'render.html?job_id=%s' % self._job_id,
-                'args': {
-                    'wait': self.splash_wait,
-                    'images': 0,
-                    'url': request.url,
-                    'baseurl': cleaned_url
-                }
-            }
+            if self.js_adaptive is None:
+                self._set_splash_meta(request)
+            elif self.js_adaptive.needs_js(request.url):
+                request.meta['js_adaptive'] = 'render'
+                self._set_splash_meta(request)
+            else:
+                request.meta['js_adaptive'] = 'raw'
         return request
+
+    def _set_splash_meta(self, request):
+        cleaned_url = urlparse(request.url)._replace(params='', query='',
+                                                     fragment='').geturl()
+        request.meta['splash'] = {
+            'endpoint': 'render.html?job_id=%s' % self._job_id,
+            'args': {
+                'wait': self.splash_wait,
+                'images': 0,
+                'url': request.url,
+                'baseurl': cleaned_url
+            }
+        }
+
+    def _handle_adaptive_js(self, response):
+        """Extract from a page downloaded in adaptive JS mode.
+
+        Raw pages without complete items are requested again through Splash,
+        unless their url pattern is known not to need rendering. The outcome
+        is recorded to decide how to download pages with the same pattern.
+        """
+        stage = response.meta['js_adaptive']
+        results = list(self.handle_html(response))
+        has_items = self._has_complete_items(results)
+        if stage != 'raw':
+            self._inc_js_stat('rendered')
+            if stage == 'retry':
+                self.js_adaptive.record(response.url, has_items)
+            return results
+        self._inc_js_stat('raw')
+        if has_items:
+            self.js_adaptive.record(response.url, False)
+            return results
+        if not self.js_adaptive.should_retry(response.url):
+            return results
+        self._inc_js_stat('retried')
+        retry = response.request.replace(dont_filter=True)
+        retry.meta['js_adaptive'] = 'retry'
+        self._set_splash_meta(retry)
+        return [r for r in results if isinstance(r, Request)] + [retry]
+
+    def _has_complete_items(self, results):
+        for item in results:
+            if isinstance(item, Request):
+                continue
+            fields = getattr(item, 'fields', {})
+            if all(item.get(name) for name, meta in fields.items()
+                   if meta.get('required')):
+                return True
+        return False
+
+    def _inc_js_stat(self, name):
+        crawler = getattr(self, 'crawler', None)
+        if crawler is not None:
+            crawler.stats.inc_value('slybot/adaptive_js/%s' % name,
+                                    spider=self)
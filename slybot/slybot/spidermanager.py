@@ -1,8 +1,4 @@
 from __future__ import absolute_import
-import tempfile
-import shutil
-import atexit
-
 from zipfile import ZipFile
 
 from zope.interface import implements
@@ -10,8 +6,10 @@ from scrapy.interfaces import ISpiderManager
 from scrapy.utils.misc import load_object
 from scrapy.utils.project import get_project_settings
 
+from slybot.plugins.scrapely_annotations.builder import AnnotatedBodyCache
 from slybot.spider import IblSpider
-from slybot.utils import open_project_from_dir, load_plugins
+from slybot.utils import (open_project_from_dir, open_project_from_zip,
+                          load_plugins)
 
 
 class SlybotSpiderManager(object):
@@ -22,12 +20,22 @@ class SlybotSpiderManager(object):
         if settings is None:
             settings = get_project_settings()
         self.spider_cls = load_object(spider_cls) if spider_cls else IblSpider
-        self._specs = open_project_from_dir(datadir)
+        # Samples are built when the spiders are loaded and again by the
+        # annotations plugin, the second time they are found in the cache
+        self.sample_cache = AnnotatedBodyCache(
+            settings.get('SLYSAMPLE_CACHE_DIR'),
+            settings.getint('SLYSAMPLE_CACHE_SIZE') or None)
+        self._specs = self._open_project(datadir)
         settings = settings.copy()
         settings.frozen = False
         settings.set('LOADED_PLUGINS', load_plugins(settings))
+        settings.set('SLYSAMPLE_CACHE', self.sample_cache)
         self.settings = settings
 
+    def _open_project(self, datadir):
+        return open_project_from_dir(datadir, lazy=True,
+                                     cache=self.sample_cache)
+
     @classmethod
     def from_crawler(cls, crawler):
         # backwards compatibility with Scrapy < 0.25
@@ -72,13 +80,18 @@ class ZipfileSlybotSpiderManager(SlybotSpiderManager):
 
     def __init__(self, datadir, zipfile=None, spider_cls=None, settings=None,
                  **kwargs):
-        if zipfile:
-            datadir = tempfile.mkdtemp(prefix='slybot-')
-            ZipFile(zipfile).extractall(datadir)
-            atexit.register(shutil.rmtree, datadir)
+        self.zipfile = ZipFile(zipfile) if zipfile else None
         super(ZipfileSlybotSpiderManager, self).__init__(datadir, spider_cls,
                                                          settings=settings)
 
+    def _open_project(self, datadir):
+        if self.zipfile is None:
+            return super(ZipfileSlybotSpiderManager, self)._open_project(
+                datadir)
+        # Only the files needed by the spiders created are read from the zip
+        return open_project_from_zip(self.zipfile, lazy=True,
+                                     cache=self.sample_cache)
+
     @classmethod
     def from_settings(cls, settings):
         datadir = settings['PROJECT_DIR']
@@ -1,4 +1,6 @@
 from scrapyjs import SplashMiddleware
+import hashlib
+import logging
 import os
 
 js_file = os.path.join(os.path.dirname(__file__), 'splash-script-combined.js')
@@ -6,13 +8,59 @@ js_source = ""
 if os.path.exists(js_file):
     with open(js_file, 'r') as f:
         js_source = f.read()
+# Named after the script contents so that workers running different versions
+# of slybot never share a profile
+js_profile = 'slybot-%s' % hashlib.sha1(js_source).hexdigest()[:12]
+
+logger = logging.getLogger(__name__)
+
+
+def register_js_profile(profiles_path, profile=js_profile, source=js_source):
+    """Make `source` available to Splash as the JS profile `profile`.
+
+    Splash must be started with `--js-profiles-path` pointing to
+    `profiles_path`. The script is only written the first time.
+    """
+    profile_dir = os.path.join(profiles_path, profile)
+    path = os.path.join(profile_dir, 'slybot.js')
+    if not os.path.exists(path):
+        if not os.path.isdir(profile_dir):
+            os.makedirs(profile_dir)
+        # Write and rename so Splash never loads a partially written script
+        tmp_path = '%s.%s.tmp' % (path, os.getpid())
+        with open(tmp_path, 'w') as f:
+            f.write(source)
+        os.rename(tmp_path, path)
+    return profile
+
 
 class SlybotJsMiddleware(SplashMiddleware):
+    def __init__(self, crawler, splash_base_url, slot_policy, js_profile=None):
+        super(SlybotJsMiddleware, self).__init__(crawler, splash_base_url,
+                                                 slot_policy)
+        self.js_profile = js_profile
+
+    @classmethod
+    def from_crawler(cls, crawler):
+        mw = super(SlybotJsMiddleware, cls).from_crawler(crawler)
+        profiles_path = crawler.settings.get('SPLASH_JS_PROFILES_PATH')
+        if profiles_path and js_source:
+            try:
+                mw.js_profile = register_js_profile(profiles_path)
+            except (IOError, OSError) as e:
+                logger.warning('Could not register Splash JS profile, the '
+                               'script will be sent with every request: %s', e)
+        return mw
+
     def process_request(self, request, spider):
         splash_opts = request.meta.get('splash')
         if splash_opts and 'args' in splash_opts:
             args = splash_opts['args']
-            args['js_source'] = "%s;\n%s" % (js_source, args.get('js_source', ''))
+            if self._use_js_profile(splash_opts):
+                args['js'] = self.js_profile
+            else:
+                args['js_source'] = "%s;\n%s" % (js_source,
+                                                 args.get('js_source', ''))
 
         req = super(SlybotJsMiddleware, self).process_request(request, spider)
         splash_auth = getattr(spider, 'splash_auth', None)
@@ -25,6 +73,32 @@ class SlybotJsMiddleware(SplashMiddleware):
         response = super(SlybotJsMiddleware, self).process_response(
             request, response, spider)
         if splash_options:
+            if self._profile_missing(splash_options, response):
+                if self.js_profile is not None:
+                    logger.warning('Splash JS profile %s is not available, '
+                                   'sending the script with every request',
+                                   self.js_profile)
+                    self.js_profile = None
+                return self._inline_request(request, splash_options)
             url = splash_options['args'].get('url')
             response._set_url(url or response.url)
         return response
+
+    def _use_js_profile(self, splash_opts):
+        # JS profiles are not loaded when running Lua scripts
+        return (self.js_profile is not None and
+                not splash_opts.get('endpoint', '').startswith('execute'))
+
+    def _profile_missing(self, splash_options, response):
+        args = splash_options.get('args', {})
+        return (response.status == 400 and args.get('js') == js_profile and
+                'profile' in response.body.lower())
+
+    def _inline_request(self, request, splash_options):
+        splash_options['args'].pop('js', None)
+        meta = dict(request.meta)
+        del meta['_splash_processed']
+        meta['splash'] = splash_options
+        return request.replace(url=splash_options['args']['url'],
+                               method='GET', body='', meta=meta,
+                               dont_filter=True)
@@ -1,10 +1,14 @@
 from unittest import TestCase
-from os.path import dirname
+from os.path import dirname, exists, join
+from shutil import rmtree
+from tempfile import mkdtemp
 
 from scrapy.http import HtmlResponse
 from scrapy.settings import Settings
 from scrapy.item import DictItem
 from scrapy.exceptions import DropItem
+from scrapy.statscollectors import StatsCollector
+from scrapy.utils.test import get_crawler
 
 from slybot.spidermanager import SlybotSpiderManager
 from slybot.dupefilter import DupeFilterPipeline
@@ -14,6 +18,19 @@ _PATH = dirname(__file__)
 class DupeFilterTest(TestCase):
     smanager = SlybotSpiderManager("%s/data/SampleProject" % _PATH)
 
+    def _extract_items(self):
+        name = "seedsofchange2"
+        spider = self.smanager.create(name)
+        spec = self.smanager._specs["spiders"][name]
+        items = []
+        for template in spec["templates"]:
+            response = HtmlResponse(
+                url=template["url"],
+                body=template["original_body"].encode('utf-8'))
+            items.extend(item for item in spider.handle_html(response)
+                         if isinstance(item, DictItem))
+        return spider, items[0], items[1]
+
     def test_dupefilter(self):
         name = "seedsofchange2"
         spider = self.smanager.create(name)
@@ -39,3 +56,39 @@ class DupeFilterTest(TestCase):
         self.assertEqual(item2, dupefilter.process_item(item2, spider))
 
         self.assertRaises(DropItem, dupefilter.process_item, item1, spider)
+
+    def test_digest_store(self):
+        spider, item1, item2 = self._extract_items()
+        stats = StatsCollector(get_crawler())
+        dupefilter = DupeFilterPipeline(Settings({
+            "SLYDUPEFILTER_ENABLED": True,
+            "SLYDUPEFILTER_STORE": "slybot.dupefilter.DigestVersionStore"
+        }), stats)
+        self.assertEqual(item1, dupefilter.process_item(item1, spider))
+        self.assertRaises(DropItem, dupefilter.process_item, item1, spider)
+        self.assertEqual(item2, dupefilter.process_item(item2, spider))
+        dupefilter.close_spider(spider)
+        self.assertEqual(stats.get_value('slydupefilter/hits'), 1)
+        self.assertEqual(stats.get_value('slydupefilter/misses'), 2)
+        self.assertEqual(stats.get_value('slydupefilter/store_size'), 2)
+
+    def test_sqlite_store_persists(self):
+        spider, item1, item2 = self._extract_items()
+        jobdir = mkdtemp()
+        self.addCleanup(rmtree, jobdir)
+        settings = Settings({
+            "SLYDUPEFILTER_ENABLED": True,
+            "SLYDUPEFILTER_STORE": "slybot.dupefilter.SqliteVersionStore",
+            "JOBDIR": jobdir
+        })
+        dupefilter = DupeFilterPipeline(settings)
+        self.assertEqual(item1, dupefilter.process_item(item1, spider))
+        dupefilter.close_spider(spider)
+
+        # Items seen in previous runs are not exported again
+        dupefilter = DupeFilterPipeline(settings)
+        self.assertRaises(DropItem, dupefilter.process_item, item1, spider)
+        self.assertEqual(item2, dupefilter.process_item(item2, spider))
+        self.assertEqual(len(dupefilter._itemversion_cache), 2)
+        dupefilter.close_spider(spider)
+        self.assertTrue(exists(join(jobdir, 'item_versions.db')))
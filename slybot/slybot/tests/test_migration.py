@@ -0,0 +1,73 @@
+import json
+from multiprocessing import active_children
+from os.path import dirname, join
+from shutil import copytree, rmtree
+from tempfile import mkdtemp
+from unittest import TestCase
+
+from scrapy import Selector
+
+from slybot.plugins.scrapely_annotations.migration import (
+    DocumentIndex, find_css_selector, find_element, migrate_project)
+from slybot.plugins.scrapely_annotations.utils import add_tagids
+
+_PATH = dirname(__file__)
+
+html = u"""<html><body>
+<div id="main" class="content">
+    <ul class="items">
+        <li class="item"><a class="link" href="/1">1</a></li>
+        <!-- comment -->
+        <li class="item first"><a class="link" href="/2">2</a></li>
+        <li class="item"><span class="price x">3</span></li>
+    </ul>
+    <p class="item">Text</p>
+    <p class="item" id="dup">A</p><p id="dup">B</p>
+</div>
+</body></html>"""
+
+
+class MigrationTest(TestCase):
+    def test_document_index(self):
+        sel = Selector(text=add_tagids(html))
+        index = DocumentIndex(sel)
+        for elem in sel._root.iter():
+            if not isinstance(elem.tag, basestring):
+                continue
+            self.assertEqual(find_css_selector(elem, index),
+                             find_css_selector(elem, sel))
+            tagid = elem.get('data-tagid')
+            self.assertIs(find_element(tagid, index),
+                          find_element(tagid, sel))
+        self.assertTrue(index.is_unique('.first', class_name='first'))
+        self.assertFalse(index.is_unique('.item', class_name='item'))
+        self.assertTrue(index.is_unique('li.item:nth-child(3)', 'li',
+                                        'item'))
+        self.assertFalse(index.is_unique('#dup', elem_id='dup'))
+
+    def test_migrate_project(self):
+        project_dir = join(mkdtemp(), 'project')
+        self.addCleanup(rmtree, dirname(project_dir))
+        copytree(join(_PATH, 'data', 'SampleProject'), project_dir)
+        results = list(migrate_project(project_dir, processes=1))
+        self.assertEqual(
+            [(sample, error) for sample, _, error in results],
+            [(join(project_dir, 'spiders', 'networkhealth.com',
+                   'networkhealthtemplate'), None)])
+        with open(join(project_dir, 'spiders', 'networkhealth.com',
+                       'networkhealthtemplate.json')) as f:
+            sample = json.load(f)
+        self.assertNotIn('annotated_body', sample)
+        self.assertGreaterEqual(sample['version'], '0.13.0')
+        self.assertEqual(list(migrate_project(project_dir, processes=1)),
+                         [])
+
+    def test_migrate_project_workers(self):
+        project_dir = join(mkdtemp(), 'project')
+        self.addCleanup(rmtree, dirname(project_dir))
+        copytree(join(_PATH, 'data', 'SampleProject'), project_dir)
+        results = migrate_project(project_dir, processes=2)
+        self.assertIsNone(next(results)[2])
+        # Workers are stopped when the caller stops consuming the results
+        results.close()
+        self.assertEqual(active_children(), [])
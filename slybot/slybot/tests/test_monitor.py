@@ -0,0 +1,108 @@
+from unittest import TestCase
+
+from scrapy import Request, Spider
+from scrapy.http import Response
+from scrapy.utils.test import get_crawler
+
+from slybot.monitor import SlybotMonitor, SlidingWindow, percentile
+
+
+class Clock(object):
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self):
+        return self.now
+
+
+class FakeEngine(object):
+    closed = None
+
+    def close_spider(self, spider, reason):
+        self.closed = reason
+
+
+class MonitorTest(TestCase):
+    def setUp(self):
+        self.clock = Clock()
+        self.spider = Spider('test_spider')
+
+    def create_monitor(self, **settings):
+        crawler = get_crawler(settings_dict=settings)
+        crawler.engine = FakeEngine()
+        monitor = SlybotMonitor(crawler, clock=self.clock)
+        monitor.started = self.clock()
+        return monitor
+
+    def crawl(self, monitor, pages, items, splash=False):
+        for i in range(pages):
+            meta = {'download_latency': 0.1 * (i % 10 + 1)}
+            if splash:
+                meta['_splash_processed'] = {}
+            request = Request('http://example.com/%d' % i, meta=meta)
+            monitor.response_received(Response(request.url), request,
+                                      self.spider)
+        for i in range(items):
+            monitor.item_scraped({}, self.spider)
+
+    def test_sliding_window(self):
+        window = SlidingWindow(10, self.clock)
+        window.add(1)
+        self.clock.now += 5
+        window.add(2)
+        self.assertEqual(window.values(), [1, 2])
+        self.clock.now += 5
+        self.assertEqual(window.values(), [2])
+        self.assertEqual(len(window), 1)
+
+    def test_percentile(self):
+        values = list(range(1, 101))
+        self.assertEqual([percentile(values, p) for p in (50, 95, 99)],
+                         [50, 95, 99])
+        self.assertEqual(percentile([3], 99), 3)
+        self.assertIsNone(percentile([], 50))
+
+    def test_summary(self):
+        monitor = self.create_monitor(SLYMONITOR_WINDOW=100)
+        self.clock.now += 50
+        self.crawl(monitor, 100, 20)
+        self.crawl(monitor, 10, 0, splash=True)
+        monitor.stage_latency('handle_html/Annotations', 0.5, self.spider)
+        summary = monitor.write_stats(self.spider)
+        self.assertEqual(summary['pages_per_second'], 110 / 50.0)
+        self.assertEqual(summary['items_per_second'], 20 / 50.0)
+        self.assertAlmostEqual(summary['items_per_1000_pages'], 181.818, 3)
+        self.assertAlmostEqual(summary['download/raw/p50'], 0.5)
+        self.assertAlmostEqual(summary['download/raw/p99'], 1.0)
+        self.assertEqual(summary['handle_html/Annotations/p95'], 0.5)
+        stats = monitor.crawler.stats
+        self.assertEqual(stats.get_value('slybot/monitor/pages_in_window'),
+                         110)
+
+        # Old pages leave the window
+        self.clock.now += 100
+        self.assertEqual(monitor.summary()['pages_in_window'], 0)
+
+    def test_close_on_low_efficiency(self):
+        monitor = self.create_monitor(SLYCLOSE_SPIDER_MIN_EFFICIENCY=10,
+                                      SLYCLOSE_SPIDER_EFFICIENCY_PAGES=500)
+        self.crawl(monitor, 400, 1)
+        monitor.check(self.spider)
+        self.assertIsNone(monitor.crawler.engine.closed)
+        self.crawl(monitor, 600, 10)
+        monitor.check(self.spider)
+        self.assertIsNone(monitor.crawler.engine.closed)
+        self.crawl(monitor, 1000, 0)
+        monitor.check(self.spider)
+        self.assertEqual(monitor.crawler.engine.closed,
+                         'slybot_low_efficiency')
+
+    def test_no_efficiency_without_pages(self):
+        monitor = self.create_monitor(SLYCLOSE_SPIDER_MIN_EFFICIENCY=10,
+                                      SLYCLOSE_SPIDER_EFFICIENCY_PAGES=0)
+        monitor.check(self.spider)
+        self.assertIsNone(monitor.crawler.engine.closed)
+        self.crawl(monitor, 10, 0)
+        monitor.check(self.spider)
+        self.assertEqual(monitor.crawler.engine.closed,
+                         'slybot_low_efficiency')
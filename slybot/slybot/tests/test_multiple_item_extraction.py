@@ -1,6 +1,10 @@
 # -*- coding: utf-8 -*-
 import json
-from os.path import dirname
+import os
+from copy import deepcopy
+from os.path import dirname, exists, join
+from shutil import rmtree
+from tempfile import mkdtemp
 from unittest import TestCase
 from slybot.plugins.scrapely_annotations.extraction import (
     parse_template, BaseContainerExtractor, group_tree, ContainerExtractor,
@@ -9,7 +13,8 @@ from slybot.plugins.scrapely_annotations.extraction import (
 from slybot.extractors import add_extractors_to_descriptors
 from slybot.item import create_slybot_item_descriptor
 from slybot.plugins.scrapely_annotations.builder import (
-    apply_annotations, _clean_annotation_data
+    apply_annotations, _clean_annotation_data, Annotations,
+    AnnotatedBodyCache
 )
 from scrapely.extraction.pageobjects import TokenDict
 from scrapely.htmlpage import HtmlPage
@@ -265,3 +270,75 @@ class ContainerExtractorTest(TestCase):
         self.assertTrue(all('rank' in item and item['rank'] for item in data))
         self.assertTrue(all('description' in item and item['description']
                             for item in data))
+
+    def test_apply_annotations(self):
+        page = u'<html><body><p class="a">First</p><p>Second</p></body></html>'
+        annotated_body = apply_annotations(_clean_annotation_data([
+            {'id': 'first', 'selector': 'p.a',
+             'data': {1: {'attribute': 'content', 'field': 'first',
+                          'required': False, 'extractors': []}}},
+            {'id': 'second', 'tagid': 3,
+             'annotations': {'content': 'second'}}]), page)
+        self.assertNotIn('data-tagid', annotated_body)
+        tags = [e for e in HtmlPage(body=annotated_body).parsed_body
+                if getattr(e, 'tag', None) == 'p' and e.attributes]
+        self.assertEqual(
+            [json.loads(t.attributes['data-scrapy-annotate'])['id']
+             for t in tags], ['first', 'second'])
+        self.assertEqual(tags[0].attributes['class'], 'a')
+        self.assertIn('>Second</p></body></html>', annotated_body)
+
+    def test_annotated_body_cache(self):
+        path = mkdtemp()
+        self.addCleanup(rmtree, path)
+        page = u'<html><body><p class="a">First</p></body></html>'
+        extracts = _clean_annotation_data([
+            {'id': 'first', 'selector': 'p.a',
+             'data': {'1': {'attribute': 'content', 'field': 'first',
+                          'required': False, 'extractors': []}}}])
+        built = deepcopy(extracts)
+        built_body = apply_annotations(built, page)
+
+        def build(cache):
+            template = {'original_body': page}
+            data = {'extracts': deepcopy(extracts)}
+            Annotations().save_extraction_data(data, template, cache=cache)
+            return template['annotated_body'], data['extracts']
+
+        # Callers see the annotations as the build leaves them
+        self.assertEqual(build(AnnotatedBodyCache(path)), (built_body, built))
+        self.assertNotEqual(built, extracts)
+        key = AnnotatedBodyCache.key(extracts, page)
+        self.assertTrue(exists(join(path, key)))
+        cache = AnnotatedBodyCache(path)
+        self.assertEqual(build(cache), (built_body, built))
+        self.assertEqual(list(cache._entries), [key])
+        # Callers get their own copy of the cached annotations
+        build(cache)[1][0]['tagid'] = -1
+        self.assertEqual(build(cache), (built_body, built))
+
+        # Cached bodies are reused instead of being built again
+        with open(join(path, key), 'w') as f:
+            json.dump({'body': '<html>cached</html>', 'annotations': []}, f)
+        self.assertEqual(build(AnnotatedBodyCache(path)),
+                         (u'<html>cached</html>', []))
+
+        # The least recently used bodies are deleted from disk
+        cache = AnnotatedBodyCache(path)
+        cache.set(key, built_body, built)
+        os.utime(join(path, key), (0, 0))
+        cache.max_size = os.path.getsize(join(path, key))
+        cache.set('other', built_body, built)
+        self.assertEqual(os.listdir(path), ['other'])
+        # The directory is only listed once
+        with open(join(path, 'unknown'), 'w') as f:
+            f.write('x' * cache.max_size)
+        cache.set('new', built_body, built)
+        self.assertEqual(sorted(os.listdir(path)), ['new', 'unknown'])
+        self.assertEqual(cache._disk_size, cache.max_size)
+
+        # Memory is bounded by the size of the entries
+        cache = AnnotatedBodyCache(max_memory=cache.max_size * 2)
+        for key in ('a', 'b', 'c'):
+            cache.set(key, built_body, built)
+        self.assertEqual(list(cache._entries), ['b', 'c'])
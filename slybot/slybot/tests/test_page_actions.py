@@ -1,5 +1,6 @@
 from unittest import TestCase
-from slybot.pageactions import filter_for_url, PageActionsMiddleware
+from slybot.pageactions import (filter_for_url, PageActionsMiddleware,
+                                PageActions)
 from os.path import dirname
 from scrapy import Request
 from scrapy import Spider
@@ -54,3 +55,43 @@ class PATest(TestCase):
         m.process_request(req, spider)
         self.assertEqual(req.meta['splash']['endpoint'], 'render.html') # Page actions disabled
 
+    def test_compiled_page_actions(self):
+        actions = [
+            dict(type='click', selector='#a', accept="\\/\\/test.com", reject="baz"),
+            dict(type='click', selector='#b', accept=None, reject="baz"),
+            dict(type='click', selector='#c', accept='foo/bar', reject=None),
+            dict(type='click', selector='#d', accept="foo", reject="bar"),
+            dict(type='click', selector='#e', accept="(a)\\1", reject=None),
+        ]
+        # The backreference prevents combining the patterns in one regex
+        for actions in (actions[:-1], actions):
+            page_actions = PageActions(actions)
+            for url in ['http://test.com/path/foo/bar', 'http://test.com/baz',
+                        'http://example.com/foo/bar', 'http://example.com/aa',
+                        'http://example.com/foo']:
+                expected = tuple(i for i, action in enumerate(actions)
+                                 if filter_for_url(url)(action))
+                self.assertEqual(page_actions.matching(url), expected)
+
+        args = page_actions.splash_args('http://example.com/foo/bar')
+        self.assertIn('"#b"', args['slybot_actions_source'])
+        self.assertIn('"#c"', args['slybot_actions_source'])
+        self.assertNotIn('"#a"', args['slybot_actions_source'])
+        self.assertIs(page_actions.splash_args('http://example.com/foo/bar/'),
+                      args)
+        self.assertIsNone(PageActions([]).splash_args('http://test.com'))
+
+    def test_many_page_actions(self):
+        # More groups than a single regex can hold
+        actions = [dict(type='click', selector='#a%d' % i,
+                        accept='(p)(%d)/' % i if i % 2 else 'p%d/' % i,
+                        reject=None)
+                   for i in range(120)]
+        page_actions = PageActions(actions)
+        for url in ['http://test.com/p7/', 'http://test.com/p10/p119/',
+                    'http://test.com/']:
+            expected = tuple(i for i, action in enumerate(actions)
+                             if filter_for_url(url)(action))
+            self.assertEqual(page_actions.matching(url), expected)
+        self.assertEqual(page_actions.matching('http://test.com/p10/p119/'),
+                         (10, 119))
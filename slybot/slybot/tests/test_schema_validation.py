@@ -5,7 +5,7 @@ from unittest import TestCase
 from os.path import dirname, join
 
 from slybot.validation.schema import get_schema_validator, \
-            ValidationError, validate_project_schema
+            ValidationError, validate_project_schema, IncrementalValidator
 from slybot.utils import open_project_from_dir
 
 _TEST_PROJECT_DIR = join(dirname(__file__), "data/SampleProject")
@@ -83,3 +83,31 @@ class JsonSchemaTest(TestCase):
     def test_test_project(self):
         specs = open_project_from_dir(_TEST_PROJECT_DIR)
         self.assertTrue(validate_project_schema(specs))
+
+    def test_cached_validator(self):
+        self.assertIs(get_schema_validator("spider"),
+                      get_schema_validator("spider"))
+
+    def test_incremental_validation(self):
+        specs = open_project_from_dir(_TEST_PROJECT_DIR)
+        validator = IncrementalValidator()
+        self.assertTrue(validator.validate_project(specs))
+        self.assertFalse(validator.validate("spider", specs["spiders"]["ebay"],
+                                            "ebay"))
+        self.assertTrue(validator.validate("spider", specs["spiders"]["ebay"],
+                                           "ebay2"))
+        spider = dict(specs["spiders"]["ebay"], start_urls=['not a url'])
+        for _ in range(2):
+            with self.assertRaises(ValidationError):
+                validator.validate("spider", spider, "ebay")
+        spider["start_urls"] = ['http://www.ebay.com/']
+        self.assertTrue(validator.validate("spider", spider, "ebay"))
+        self.assertFalse(validator.validate("spider", spider, "ebay"))
+
+        # Only the most recently validated resources are remembered
+        validator = IncrementalValidator(max_entries=2)
+        for name in ("ebay", "ebay2", "ebay", "ebay3"):
+            validator.validate("spider", spider, name)
+        self.assertEqual(len(validator._validated), 2)
+        self.assertFalse(validator.validate("spider", spider, "ebay"))
+        self.assertTrue(validator.validate("spider", spider, "ebay2"))
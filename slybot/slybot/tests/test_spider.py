@@ -1,21 +1,28 @@
+import os
 from unittest import TestCase
 from os.path import dirname, join
+from tempfile import mkstemp
+from zipfile import ZipFile
 from contextlib import contextmanager
 
 from scrapy.http import (Response, HtmlResponse, XmlResponse, TextResponse,
                          Request)
 from scrapy.utils.project import get_project_settings
+from twisted.python.failure import Failure
 from scrapy.utils.reqser import request_to_dict
 
 from scrapely.htmlpage import HtmlPage
 
-from slybot.spidermanager import SlybotSpiderManager
+from slybot.spidermanager import (SlybotSpiderManager,
+                                  ZipfileSlybotSpiderManager)
 
 
 @contextmanager
-def splash_spider_manager(splash_url='http://localhost:8050'):
+def splash_spider_manager(splash_url='http://localhost:8050', **kwargs):
     settings = get_project_settings()
     settings.set('SPLASH_URL', splash_url)
+    for key, value in kwargs.items():
+        settings.set(key, value)
     yield SlybotSpiderManager("%s/data/SampleProject" % _PATH,
                               settings=settings)
 
@@ -31,6 +38,50 @@ class SpiderTest(TestCase):
                 "networkhealth.com", "allowed_domains", "any_allowed_domains", "example.com", "example2.com",
                 "example3.com", "example4.com", "sitemaps"]))
 
+    def test_spiders_loaded_lazily(self):
+        smanager = SlybotSpiderManager("%s/data/SampleProject" % _PATH)
+        spiders = smanager._specs["spiders"]
+        self.assertEqual(spiders._loaded, {})
+        self.assertIn("ebay", smanager.list())
+        self.assertEqual(spiders._loaded, {})
+        smanager.create("ebay")
+        self.assertEqual(list(spiders._loaded), ["ebay"])
+        spec = spiders["ebay"]
+        smanager.create("ebay")
+        self.assertIs(spiders["ebay"], spec)
+        self.assertRaises(KeyError, smanager.create, "missing")
+
+    def test_sample_cache(self):
+        smanager = SlybotSpiderManager("%s/data/SampleProject" % _PATH)
+        cache = smanager.sample_cache
+        # Samples are built through the same cache when the spiders are
+        # loaded and by the annotations plugin
+        self.assertIs(smanager._specs["spiders"].cache, cache)
+        self.assertIs(smanager.settings['SLYSAMPLE_CACHE'], cache)
+        self.assertIsNot(SlybotSpiderManager(
+            "%s/data/SampleProject" % _PATH).sample_cache, cache)
+
+    def test_zipfile_spider_manager(self):
+        project_dir = "%s/data/SampleProject" % _PATH
+        fd, path = mkstemp(suffix='.zip')
+        os.close(fd)
+        self.addCleanup(os.remove, path)
+        with ZipFile(path, 'w') as zipfile:
+            for root, _, files in os.walk(project_dir):
+                for fname in files:
+                    fpath = join(root, fname)
+                    zipfile.write(fpath, os.path.relpath(fpath, project_dir))
+        # Templates of this spider are stored in their own files
+        name = "networkhealth.com"
+        smanager = ZipfileSlybotSpiderManager('/nonexistent', path)
+        self.assertEqual(sorted(smanager.list()), sorted(self.smanager.list()))
+        spider = smanager.create(name)
+        self.assertEqual(smanager._specs["spiders"][name],
+                         self.smanager._specs["spiders"][name])
+        self.assertEqual(list(smanager._specs["spiders"]._loaded),
+                         [name])
+        self.assertEqual(spider.name, name)
+
     def test_spider_with_link_template(self):
         name = "seedsofchange"
         spider = self.smanager.create(name)
@@ -137,9 +188,60 @@ class SpiderTest(TestCase):
         request_list = [request_to_dict(req, spider)
                              for req in generic_form_request.callback(response)]
 
-        expected = [{'body': '', '_encoding': 'utf-8', 'cookies': {}, 'meta': {}, 'headers': {}, 'url': u'http://www.ebay.com/sch/i.html?_adv=1&_ex_kw=&_ftrv=1&_ftrt=901&_sabdlo=&_sabdhi=&_sop=12&_samihi=&_ipg=50&_salic=1&_sasl=&_udlo=&_okw=&_fsradio=%26LH_SpecificSeller%3D1&_udhi=&_in_kw=1&_nkw=Cars&_sacat=0&_oexkw=&_dmd=1&_saslop=1&_samilow=', 'dont_filter': True, 'priority': 0, 'callback': 'after_form_page', 'method': 'GET', 'errback': None}, {'body': '', '_encoding': 'utf-8', 'cookies': {}, 'meta': {}, 'headers': {}, 'url': u'http://www.ebay.com/sch/i.html?_adv=1&_ex_kw=&_ftrv=1&_ftrt=901&_sabdlo=&_sabdhi=&_sop=12&_samihi=&_ipg=50&_salic=1&_sasl=&_udlo=&_okw=&_fsradio=%26LH_SpecificSeller%3D1&_udhi=&_in_kw=2&_nkw=Cars&_sacat=0&_oexkw=&_dmd=1&_saslop=1&_samilow=', 'dont_filter': True, 'priority': 0, 'callback': 'after_form_page', 'method': 'GET', 'errback': None}, {'body': '', '_encoding': 'utf-8', 'cookies': {}, 'meta': {}, 'headers': {}, 'url': u'http://www.ebay.com/sch/i.html?_adv=1&_ex_kw=&_ftrv=1&_ftrt=901&_sabdlo=&_sabdhi=&_sop=12&_samihi=&_ipg=50&_salic=1&_sasl=&_udlo=&_okw=&_fsradio=%26LH_SpecificSeller%3D1&_udhi=&_in_kw=3&_nkw=Cars&_sacat=0&_oexkw=&_dmd=1&_saslop=1&_samilow=', 'dont_filter': True, 'priority': 0, 'callback': 'after_form_page', 'method': 'GET', 'errback': None}, {'body': '', '_encoding': 'utf-8', 'cookies': {}, 'meta': {}, 'headers': {}, 'url': u'http://www.ebay.com/sch/i.html?_adv=1&_ex_kw=&_ftrv=1&_ftrt=901&_sabdlo=&_sabdhi=&_sop=12&_samihi=&_ipg=50&_salic=1&_sasl=&_udlo=&_okw=&_fsradio=%26LH_SpecificSeller%3D1&_udhi=&_in_kw=4&_nkw=Cars&_sacat=0&_oexkw=&_dmd=1&_saslop=1&_samilow=', 'dont_filter': True, 'priority': 0, 'callback': 'after_form_page', 'method': 'GET', 'errback': None}, {'body': '', '_encoding': 'utf-8', 'cookies': {}, 'meta': {}, 'headers': {}, 'url': u'http://www.ebay.com/sch/ebayadvsearch/?rt=nc', 'dont_filter': True, 'priority': 0, 'callback': 'parse', 'method': 'GET', 'errback': None}]
+        expected = [{'body': '', '_encoding': 'utf-8', 'cookies': {}, 'meta': {'form_key': u'http://www.ebay.com/sch/ebayadvsearch/?rt=nc'}, 'headers': {}, 'url': u'http://www.ebay.com/sch/i.html?_adv=1&_ex_kw=&_ftrv=1&_ftrt=901&_sabdlo=&_sabdhi=&_sop=12&_samihi=&_ipg=50&_salic=1&_sasl=&_udlo=&_okw=&_fsradio=%26LH_SpecificSeller%3D1&_udhi=&_in_kw=1&_nkw=Cars&_sacat=0&_oexkw=&_dmd=1&_saslop=1&_samilow=', 'dont_filter': True, 'priority': 0, 'callback': 'after_form_page', 'method': 'GET', 'errback': '_form_request_failed'}, {'body': '', '_encoding': 'utf-8', 'cookies': {}, 'meta': {'form_key': u'http://www.ebay.com/sch/ebayadvsearch/?rt=nc'}, 'headers': {}, 'url': u'http://www.ebay.com/sch/i.html?_adv=1&_ex_kw=&_ftrv=1&_ftrt=901&_sabdlo=&_sabdhi=&_sop=12&_samihi=&_ipg=50&_salic=1&_sasl=&_udlo=&_okw=&_fsradio=%26LH_SpecificSeller%3D1&_udhi=&_in_kw=2&_nkw=Cars&_sacat=0&_oexkw=&_dmd=1&_saslop=1&_samilow=', 'dont_filter': True, 'priority': 0, 'callback': 'after_form_page', 'method': 'GET', 'errback': '_form_request_failed'}, {'body': '', '_encoding': 'utf-8', 'cookies': {}, 'meta': {'form_key': u'http://www.ebay.com/sch/ebayadvsearch/?rt=nc'}, 'headers': {}, 'url': u'http://www.ebay.com/sch/i.html?_adv=1&_ex_kw=&_ftrv=1&_ftrt=901&_sabdlo=&_sabdhi=&_sop=12&_samihi=&_ipg=50&_salic=1&_sasl=&_udlo=&_okw=&_fsradio=%26LH_SpecificSeller%3D1&_udhi=&_in_kw=3&_nkw=Cars&_sacat=0&_oexkw=&_dmd=1&_saslop=1&_samilow=', 'dont_filter': True, 'priority': 0, 'callback': 'after_form_page', 'method': 'GET', 'errback': '_form_request_failed'}, {'body': '', '_encoding': 'utf-8', 'cookies': {}, 'meta': {'form_key': u'http://www.ebay.com/sch/ebayadvsearch/?rt=nc'}, 'headers': {}, 'url': u'http://www.ebay.com/sch/i.html?_adv=1&_ex_kw=&_ftrv=1&_ftrt=901&_sabdlo=&_sabdhi=&_sop=12&_samihi=&_ipg=50&_salic=1&_sasl=&_udlo=&_okw=&_fsradio=%26LH_SpecificSeller%3D1&_udhi=&_in_kw=4&_nkw=Cars&_sacat=0&_oexkw=&_dmd=1&_saslop=1&_samilow=', 'dont_filter': True, 'priority': 0, 'callback': 'after_form_page', 'method': 'GET', 'errback': '_form_request_failed'}, {'body': '', '_encoding': 'utf-8', 'cookies': {}, 'meta': {}, 'headers': {}, 'url': u'http://www.ebay.com/sch/ebayadvsearch/?rt=nc', 'dont_filter': True, 'priority': 0, 'callback': 'parse', 'method': 'GET', 'errback': None}]
         self.assertEqual(request_list, expected)
 
+    def test_generic_form_requests_in_batches(self):
+        name = "ebay"
+        form_url = "http://www.ebay.com/sch/ebayadvsearch/?rt=nc"
+        body = open(join(_PATH, "data", "ebay_advanced_search.html")).read()
+        spider = self.smanager.create(name)
+        spider.form_batch_size = 2
+        generic_form_request = list(spider.start_requests())[0]
+        response = HtmlResponse(url=form_url, body=body)
+        response.request = generic_form_request
+        requests = list(generic_form_request.callback(response))
+        self.assertEqual([r.callback for r in requests],
+                         [spider.after_form_page, spider.after_form_page,
+                          spider.parse])
+        self.assertIn('_in_kw=1', requests[0].url)
+        self.assertIn('_in_kw=2', requests[1].url)
+        # Submissions count as done once they are downloaded
+        self.assertEqual(spider.state['generic_form_progress'], {})
+
+        # Each submitted form refills the batch with the next combination
+        form_response = HtmlResponse(url=requests[0].url, body='<html/>',
+                                     request=requests[0])
+        next_requests = list(spider.after_form_page(form_response))
+        self.assertEqual(len(next_requests), 1)
+        self.assertIn('_in_kw=3', next_requests[0].url)
+        self.assertEqual(spider.state['generic_form_progress'],
+                         {form_url: 1})
+        failure = Failure(IOError('Connection lost'))
+        failure.request = requests[1]
+        next_request = spider._form_request_failed(failure)
+        self.assertIn('_in_kw=4', next_request.url)
+        self.assertEqual(spider.state['generic_form_progress'],
+                         {form_url: 2})
+
+        # Errors generating the next combinations stop the form
+        def broken_forms():
+            raise ValueError('Broken form')
+            yield
+        spider._form_generators[form_url] = broken_forms()
+        self.assertEqual(list(spider.after_form_page(form_response)), [])
+        self.assertNotIn(form_url, spider._form_generators)
+
+        # A restarted spider resumes from the last generated combination
+        spider = self.smanager.create(name)
+        spider.state = {'generic_form_progress': {form_url: 3}}
+        generic_form_request = list(spider.start_requests())[0]
+        response.request = generic_form_request
+        requests = list(generic_form_request.callback(response))
+        self.assertEqual(len(requests), 2)
+        self.assertIn('_in_kw=4', requests[0].url)
+        self.assertEqual(requests[1].callback, spider.parse)
+
     def test_generic_form_requests_with_file_field(self):
         name = "ebay2"
         spider = self.smanager.create(name)
@@ -169,54 +271,54 @@ class SpiderTest(TestCase):
         response.request = generic_form_request
         request_list = [request_to_dict(req, spider)
                              for req in generic_form_request.callback(response)]
-        expected = [{'body': '', '_encoding': 'utf-8', 'cookies': {}, 'meta': {}, 'headers': {},
+        expected = [{'body': '', '_encoding': 'utf-8', 'cookies': {}, 'meta': {'form_key': u'http://www.ebay.com/sch/ebayadvsearch/?rt=nc'}, 'headers': {},
             'url': u'http://www.ebay.com/sch/i.html?_adv=1&_ex_kw=&_ftrv=1&_ftrt=901&_sabdlo=&_sabdhi=&_sop=12&_samihi=&_ipg=50&_salic=1&_sasl=&_udlo=&_okw=&_nkw2=Cars&_fsradio=%26LH_SpecificSeller%3D1&_udhi=&_in_kw=1&_nkw=Cars&_sacat=0&_oexkw=&_dmd=1&_saslop=1&_samilow=',
-            'dont_filter': True, 'priority': 0, 'callback': 'after_form_page', 'method': 'GET', 'errback': None},
-            {'body': '', '_encoding': 'utf-8', 'cookies': {}, 'meta': {}, 'headers': {},
+            'dont_filter': True, 'priority': 0, 'callback': 'after_form_page', 'method': 'GET', 'errback': '_form_request_failed'},
+            {'body': '', '_encoding': 'utf-8', 'cookies': {}, 'meta': {'form_key': u'http://www.ebay.com/sch/ebayadvsearch/?rt=nc'}, 'headers': {},
             'url': u'http://www.ebay.com/sch/i.html?_adv=1&_ex_kw=&_ftrv=1&_ftrt=901&_sabdlo=&_sabdhi=&_sop=12&_samihi=&_ipg=50&_salic=1&_sasl=&_udlo=&_okw=&_nkw2=Cars&_fsradio=%26LH_SpecificSeller%3D1&_udhi=&_in_kw=2&_nkw=Cars&_sacat=0&_oexkw=&_dmd=1&_saslop=1&_samilow=',
-            'dont_filter': True, 'priority': 0, 'callback': 'after_form_page', 'method': 'GET', 'errback': None},
-            {'body': '', '_encoding': 'utf-8', 'cookies': {}, 'meta': {}, 'headers': {},
+            'dont_filter': True, 'priority': 0, 'callback': 'after_form_page', 'method': 'GET', 'errback': '_form_request_failed'},
+            {'body': '', '_encoding': 'utf-8', 'cookies': {}, 'meta': {'form_key': u'http://www.ebay.com/sch/ebayadvsearch/?rt=nc'}, 'headers': {},
             'url': u'http://www.ebay.com/sch/i.html?_adv=1&_ex_kw=&_ftrv=1&_ftrt=901&_sabdlo=&_sabdhi=&_sop=12&_samihi=&_ipg=50&_salic=1&_sasl=&_udlo=&_okw=&_nkw2=Cars&_fsradio=%26LH_SpecificSeller%3D1&_udhi=&_in_kw=3&_nkw=Cars&_sacat=0&_oexkw=&_dmd=1&_saslop=1&_samilow=',
-            'dont_filter': True, 'priority': 0, 'callback': 'after_form_page', 'method': 'GET', 'errback': None},
-            {'body': '', '_encoding': 'utf-8', 'cookies': {}, 'meta': {}, 'headers': {},
+            'dont_filter': True, 'priority': 0, 'callback': 'after_form_page', 'method': 'GET', 'errback': '_form_request_failed'},
+            {'body': '', '_encoding': 'utf-8', 'cookies': {}, 'meta': {'form_key': u'http://www.ebay.com/sch/ebayadvsearch/?rt=nc'}, 'headers': {},
             'url': u'http://www.ebay.com/sch/i.html?_adv=1&_ex_kw=&_ftrv=1&_ftrt=901&_sabdlo=&_sabdhi=&_sop=12&_samihi=&_ipg=50&_salic=1&_sasl=&_udlo=&_okw=&_nkw2=Cars&_fsradio=%26LH_SpecificSeller%3D1&_udhi=&_in_kw=4&_nkw=Cars&_sacat=0&_oexkw=&_dmd=1&_saslop=1&_samilow=',
-            'dont_filter': True, 'priority': 0, 'callback': 'after_form_page', 'method': 'GET', 'errback': None},
-            {'body': '', '_encoding': 'utf-8', 'cookies': {}, 'meta': {}, 'headers': {},
+            'dont_filter': True, 'priority': 0, 'callback': 'after_form_page', 'method': 'GET', 'errback': '_form_request_failed'},
+            {'body': '', '_encoding': 'utf-8', 'cookies': {}, 'meta': {'form_key': u'http://www.ebay.com/sch/ebayadvsearch/?rt=nc'}, 'headers': {},
             'url': u'http://www.ebay.com/sch/i.html?_adv=1&_ex_kw=&_ftrv=1&_ftrt=901&_sabdlo=&_sabdhi=&_sop=12&_samihi=&_ipg=50&_salic=1&_sasl=&_udlo=&_okw=&_nkw2=Boats&_fsradio=%26LH_SpecificSeller%3D1&_udhi=&_in_kw=1&_nkw=Cars&_sacat=0&_oexkw=&_dmd=1&_saslop=1&_samilow=',
-            'dont_filter': True, 'priority': 0, 'callback': 'after_form_page', 'method': 'GET', 'errback': None},
-            {'body': '', '_encoding': 'utf-8', 'cookies': {}, 'meta': {}, 'headers': {},
+            'dont_filter': True, 'priority': 0, 'callback': 'after_form_page', 'method': 'GET', 'errback': '_form_request_failed'},
+            {'body': '', '_encoding': 'utf-8', 'cookies': {}, 'meta': {'form_key': u'http://www.ebay.com/sch/ebayadvsearch/?rt=nc'}, 'headers': {},
             'url': u'http://www.ebay.com/sch/i.html?_adv=1&_ex_kw=&_ftrv=1&_ftrt=901&_sabdlo=&_sabdhi=&_sop=12&_samihi=&_ipg=50&_salic=1&_sasl=&_udlo=&_okw=&_nkw2=Boats&_fsradio=%26LH_SpecificSeller%3D1&_udhi=&_in_kw=2&_nkw=Cars&_sacat=0&_oexkw=&_dmd=1&_saslop=1&_samilow=',
-            'dont_filter': True, 'priority': 0, 'callback': 'after_form_page', 'method': 'GET', 'errback': None},
-            {'body': '', '_encoding': 'utf-8', 'cookies': {}, 'meta': {}, 'headers': {},
+            'dont_filter': True, 'priority': 0, 'callback': 'after_form_page', 'method': 'GET', 'errback': '_form_request_failed'},
+            {'body': '', '_encoding': 'utf-8', 'cookies': {}, 'meta': {'form_key': u'http://www.ebay.com/sch/ebayadvsearch/?rt=nc'}, 'headers': {},
             'url': u'http://www.ebay.com/sch/i.html?_adv=1&_ex_kw=&_ftrv=1&_ftrt=901&_sabdlo=&_sabdhi=&_sop=12&_samihi=&_ipg=50&_salic=1&_sasl=&_udlo=&_okw=&_nkw2=Boats&_fsradio=%26LH_SpecificSeller%3D1&_udhi=&_in_kw=3&_nkw=Cars&_sacat=0&_oexkw=&_dmd=1&_saslop=1&_samilow=',
-            'dont_filter': True, 'priority': 0, 'callback': 'after_form_page', 'method': 'GET', 'errback': None},
-            {'body': '', '_encoding': 'utf-8', 'cookies': {}, 'meta': {}, 'headers': {},
+            'dont_filter': True, 'priority': 0, 'callback': 'after_form_page', 'method': 'GET', 'errback': '_form_request_failed'},
+            {'body': '', '_encoding': 'utf-8', 'cookies': {}, 'meta': {'form_key': u'http://www.ebay.com/sch/ebayadvsearch/?rt=nc'}, 'headers': {},
             'url': u'http://www.ebay.com/sch/i.html?_adv=1&_ex_kw=&_ftrv=1&_ftrt=901&_sabdlo=&_sabdhi=&_sop=12&_samihi=&_ipg=50&_salic=1&_sasl=&_udlo=&_okw=&_nkw2=Boats&_fsradio=%26LH_SpecificSeller%3D1&_udhi=&_in_kw=4&_nkw=Cars&_sacat=0&_oexkw=&_dmd=1&_saslop=1&_samilow=',
-            'dont_filter': True, 'priority': 0, 'callback': 'after_form_page', 'method': 'GET', 'errback': None},
-            {'body': '', '_encoding': 'utf-8', 'cookies': {}, 'meta': {}, 'headers': {},
+            'dont_filter': True, 'priority': 0, 'callback': 'after_form_page', 'method': 'GET', 'errback': '_form_request_failed'},
+            {'body': '', '_encoding': 'utf-8', 'cookies': {}, 'meta': {'form_key': u'http://www.ebay.com/sch/ebayadvsearch/?rt=nc'}, 'headers': {},
             'url': u'http://www.ebay.com/sch/i.html?_adv=1&_ex_kw=&_ftrv=1&_ftrt=901&_sabdlo=&_sabdhi=&_sop=12&_samihi=&_ipg=50&_salic=1&_sasl=&_udlo=&_okw=&_nkw2=Cars&_fsradio=%26LH_SpecificSeller%3D1&_udhi=&_in_kw=1&_nkw=Boats&_sacat=0&_oexkw=&_dmd=1&_saslop=1&_samilow=',
-            'dont_filter': True, 'priority': 0, 'callback': 'after_form_page', 'method': 'GET', 'errback': None},
-            {'body': '', '_encoding': 'utf-8', 'cookies': {}, 'meta': {}, 'headers': {},
+            'dont_filter': True, 'priority': 0, 'callback': 'after_form_page', 'method': 'GET', 'errback': '_form_request_failed'},
+            {'body': '', '_encoding': 'utf-8', 'cookies': {}, 'meta': {'form_key': u'http://www.ebay.com/sch/ebayadvsearch/?rt=nc'}, 'headers': {},
             'url': u'http://www.ebay.com/sch/i.html?_adv=1&_ex_kw=&_ftrv=1&_ftrt=901&_sabdlo=&_sabdhi=&_sop=12&_samihi=&_ipg=50&_salic=1&_sasl=&_udlo=&_okw=&_nkw2=Cars&_fsradio=%26LH_SpecificSeller%3D1&_udhi=&_in_kw=2&_nkw=Boats&_sacat=0&_oexkw=&_dmd=1&_saslop=1&_samilow=',
-            'dont_filter': True, 'priority': 0, 'callback': 'after_form_page', 'method': 'GET', 'errback': None},
-            {'body': '', '_encoding': 'utf-8', 'cookies': {}, 'meta': {}, 'headers': {}, 'url':
+            'dont_filter': True, 'priority': 0, 'callback': 'after_form_page', 'method': 'GET', 'errback': '_form_request_failed'},
+            {'body': '', '_encoding': 'utf-8', 'cookies': {}, 'meta': {'form_key': u'http://www.ebay.com/sch/ebayadvsearch/?rt=nc'}, 'headers': {}, 'url':
             u'http://www.ebay.com/sch/i.html?_adv=1&_ex_kw=&_ftrv=1&_ftrt=901&_sabdlo=&_sabdhi=&_sop=12&_samihi=&_ipg=50&_salic=1&_sasl=&_udlo=&_okw=&_nkw2=Cars&_fsradio=%26LH_SpecificSeller%3D1&_udhi=&_in_kw=3&_nkw=Boats&_sacat=0&_oexkw=&_dmd=1&_saslop=1&_samilow=',
-            'dont_filter': True, 'priority': 0, 'callback': 'after_form_page', 'method': 'GET', 'errback': None},
-            {'body': '', '_encoding': 'utf-8', 'cookies': {}, 'meta': {}, 'headers': {},
+            'dont_filter': True, 'priority': 0, 'callback': 'after_form_page', 'method': 'GET', 'errback': '_form_request_failed'},
+            {'body': '', '_encoding': 'utf-8', 'cookies': {}, 'meta': {'form_key': u'http://www.ebay.com/sch/ebayadvsearch/?rt=nc'}, 'headers': {},
             'url': u'http://www.ebay.com/sch/i.html?_adv=1&_ex_kw=&_ftrv=1&_ftrt=901&_sabdlo=&_sabdhi=&_sop=12&_samihi=&_ipg=50&_salic=1&_sasl=&_udlo=&_okw=&_nkw2=Cars&_fsradio=%26LH_SpecificSeller%3D1&_udhi=&_in_kw=4&_nkw=Boats&_sacat=0&_oexkw=&_dmd=1&_saslop=1&_samilow=',
-            'dont_filter': True, 'priority': 0, 'callback': 'after_form_page', 'method': 'GET', 'errback': None},
-            {'body': '', '_encoding': 'utf-8', 'cookies': {}, 'meta': {}, 'headers': {},
+            'dont_filter': True, 'priority': 0, 'callback': 'after_form_page', 'method': 'GET', 'errback': '_form_request_failed'},
+            {'body': '', '_encoding': 'utf-8', 'cookies': {}, 'meta': {'form_key': u'http://www.ebay.com/sch/ebayadvsearch/?rt=nc'}, 'headers': {},
             'url': u'http://www.ebay.com/sch/i.html?_adv=1&_ex_kw=&_ftrv=1&_ftrt=901&_sabdlo=&_sabdhi=&_sop=12&_samihi=&_ipg=50&_salic=1&_sasl=&_udlo=&_okw=&_nkw2=Boats&_fsradio=%26LH_SpecificSeller%3D1&_udhi=&_in_kw=1&_nkw=Boats&_sacat=0&_oexkw=&_dmd=1&_saslop=1&_samilow=',
-            'dont_filter': True, 'priority': 0, 'callback': 'after_form_page', 'method': 'GET', 'errback': None},
-            {'body': '', '_encoding': 'utf-8', 'cookies': {}, 'meta': {}, 'headers': {},
+            'dont_filter': True, 'priority': 0, 'callback': 'after_form_page', 'method': 'GET', 'errback': '_form_request_failed'},
+            {'body': '', '_encoding': 'utf-8', 'cookies': {}, 'meta': {'form_key': u'http://www.ebay.com/sch/ebayadvsearch/?rt=nc'}, 'headers': {},
             'url': u'http://www.ebay.com/sch/i.html?_adv=1&_ex_kw=&_ftrv=1&_ftrt=901&_sabdlo=&_sabdhi=&_sop=12&_samihi=&_ipg=50&_salic=1&_sasl=&_udlo=&_okw=&_nkw2=Boats&_fsradio=%26LH_SpecificSeller%3D1&_udhi=&_in_kw=2&_nkw=Boats&_sacat=0&_oexkw=&_dmd=1&_saslop=1&_samilow=',
-            'dont_filter': True, 'priority': 0, 'callback': 'after_form_page', 'method': 'GET', 'errback': None},
-            {'body': '', '_encoding': 'utf-8', 'cookies': {}, 'meta': {}, 'headers': {},
+            'dont_filter': True, 'priority': 0, 'callback': 'after_form_page', 'method': 'GET', 'errback': '_form_request_failed'},
+            {'body': '', '_encoding': 'utf-8', 'cookies': {}, 'meta': {'form_key': u'http://www.ebay.com/sch/ebayadvsearch/?rt=nc'}, 'headers': {},
             'url': u'http://www.ebay.com/sch/i.html?_adv=1&_ex_kw=&_ftrv=1&_ftrt=901&_sabdlo=&_sabdhi=&_sop=12&_samihi=&_ipg=50&_salic=1&_sasl=&_udlo=&_okw=&_nkw2=Boats&_fsradio=%26LH_SpecificSeller%3D1&_udhi=&_in_kw=3&_nkw=Boats&_sacat=0&_oexkw=&_dmd=1&_saslop=1&_samilow=',
-            'dont_filter': True, 'priority': 0, 'callback': 'after_form_page', 'method': 'GET', 'errback': None},
-            {'body': '', '_encoding': 'utf-8', 'cookies': {}, 'meta': {}, 'headers': {},
+            'dont_filter': True, 'priority': 0, 'callback': 'after_form_page', 'method': 'GET', 'errback': '_form_request_failed'},
+            {'body': '', '_encoding': 'utf-8', 'cookies': {}, 'meta': {'form_key': u'http://www.ebay.com/sch/ebayadvsearch/?rt=nc'}, 'headers': {},
             'url': u'http://www.ebay.com/sch/i.html?_adv=1&_ex_kw=&_ftrv=1&_ftrt=901&_sabdlo=&_sabdhi=&_sop=12&_samihi=&_ipg=50&_salic=1&_sasl=&_udlo=&_okw=&_nkw2=Boats&_fsradio=%26LH_SpecificSeller%3D1&_udhi=&_in_kw=4&_nkw=Boats&_sacat=0&_oexkw=&_dmd=1&_saslop=1&_samilow=',
-            'dont_filter': True, 'priority': 0, 'callback': 'after_form_page', 'method': 'GET', 'errback': None},
+            'dont_filter': True, 'priority': 0, 'callback': 'after_form_page', 'method': 'GET', 'errback': '_form_request_failed'},
             {'body': '', '_encoding': 'utf-8', 'cookies': {}, 'meta': {}, 'headers': {},
             'url': u'http://www.ebay.com/sch/ebayadvsearch/?rt=nc',
             'dont_filter': True, 'priority': 0, 'callback': 'parse', 'method': 'GET', 'errback': None}]
@@ -232,7 +334,7 @@ class SpiderTest(TestCase):
         response.request = generic_form_request
         request_list = [request_to_dict(req, spider)
                              for req in generic_form_request.callback(response)]
-        expected = [{'body': '', '_encoding': 'utf-8', 'cookies': {}, 'meta': {}, 'headers': {}, 'url': u'http://www.ebay.com/sch/i.html?_adv=1&_ex_kw=&_ftrv=1&_ftrt=901&_sabdlo=&_sabdhi=&_sop=12&_samihi=&_ipg=50&_salic=1&_sasl=&_udlo=&_okw=&_fsradio=%26LH_SpecificSeller%3D1&_udhi=&_in_kw=1&_nkw=Cars&_sacat=0&_oexkw=&_dmd=1&_saslop=1&_samilow=', 'dont_filter': True, 'priority': 0, 'callback': 'after_form_page', 'method': 'GET', 'errback': None}, {'body': '', '_encoding': 'utf-8', 'cookies': {}, 'meta': {}, 'headers': {}, 'url': u'http://www.ebay.com/sch/i.html?_adv=1&_ex_kw=&_ftrv=1&_ftrt=901&_sabdlo=&_sabdhi=&_sop=12&_samihi=&_ipg=50&_salic=1&_sasl=&_udlo=&_okw=&_fsradio=%26LH_SpecificSeller%3D1&_udhi=&_in_kw=2&_nkw=Cars&_sacat=0&_oexkw=&_dmd=1&_saslop=1&_samilow=', 'dont_filter': True, 'priority': 0, 'callback': 'after_form_page', 'method': 'GET', 'errback': None}, {'body': '', '_encoding': 'utf-8', 'cookies': {}, 'meta': {}, 'headers': {}, 'url': u'http://www.ebay.com/sch/i.html?_adv=1&_ex_kw=&_ftrv=1&_ftrt=901&_sabdlo=&_sabdhi=&_sop=12&_samihi=&_ipg=50&_salic=1&_sasl=&_udlo=&_okw=&_fsradio=%26LH_SpecificSeller%3D1&_udhi=&_in_kw=3&_nkw=Cars&_sacat=0&_oexkw=&_dmd=1&_saslop=1&_samilow=', 'dont_filter': True, 'priority': 0, 'callback': 'after_form_page', 'method': 'GET', 'errback': None}, {'body': '', '_encoding': 'utf-8', 'cookies': {}, 'meta': {}, 'headers': {}, 'url': u'http://www.ebay.com/sch/i.html?_adv=1&_ex_kw=&_ftrv=1&_ftrt=901&_sabdlo=&_sabdhi=&_sop=12&_samihi=&_ipg=50&_salic=1&_sasl=&_udlo=&_okw=&_fsradio=%26LH_SpecificSeller%3D1&_udhi=&_in_kw=4&_nkw=Cars&_sacat=0&_oexkw=&_dmd=1&_saslop=1&_samilow=', 'dont_filter': True, 'priority': 0, 'callback': 'after_form_page', 'method': 'GET', 'errback': None}, {'body': '', '_encoding': 'utf-8', 'cookies': {}, 'meta': {}, 'headers': {}, 'url': u'http://www.ebay.com/sch/ebayadvsearch/?rt=nc', 'dont_filter': True, 'priority': 0, 'callback': 'parse', 'method': 'GET', 'errback': None}]
+        expected = [{'body': '', '_encoding': 'utf-8', 'cookies': {}, 'meta': {'form_key': u'http://www.ebay.com/sch/ebayadvsearch/?rt=nc'}, 'headers': {}, 'url': u'http://www.ebay.com/sch/i.html?_adv=1&_ex_kw=&_ftrv=1&_ftrt=901&_sabdlo=&_sabdhi=&_sop=12&_samihi=&_ipg=50&_salic=1&_sasl=&_udlo=&_okw=&_fsradio=%26LH_SpecificSeller%3D1&_udhi=&_in_kw=1&_nkw=Cars&_sacat=0&_oexkw=&_dmd=1&_saslop=1&_samilow=', 'dont_filter': True, 'priority': 0, 'callback': 'after_form_page', 'method': 'GET', 'errback': '_form_request_failed'}, {'body': '', '_encoding': 'utf-8', 'cookies': {}, 'meta': {'form_key': u'http://www.ebay.com/sch/ebayadvsearch/?rt=nc'}, 'headers': {}, 'url': u'http://www.ebay.com/sch/i.html?_adv=1&_ex_kw=&_ftrv=1&_ftrt=901&_sabdlo=&_sabdhi=&_sop=12&_samihi=&_ipg=50&_salic=1&_sasl=&_udlo=&_okw=&_fsradio=%26LH_SpecificSeller%3D1&_udhi=&_in_kw=2&_nkw=Cars&_sacat=0&_oexkw=&_dmd=1&_saslop=1&_samilow=', 'dont_filter': True, 'priority': 0, 'callback': 'after_form_page', 'method': 'GET', 'errback': '_form_request_failed'}, {'body': '', '_encoding': 'utf-8', 'cookies': {}, 'meta': {'form_key': u'http://www.ebay.com/sch/ebayadvsearch/?rt=nc'}, 'headers': {}, 'url': u'http://www.ebay.com/sch/i.html?_adv=1&_ex_kw=&_ftrv=1&_ftrt=901&_sabdlo=&_sabdhi=&_sop=12&_samihi=&_ipg=50&_salic=1&_sasl=&_udlo=&_okw=&_fsradio=%26LH_SpecificSeller%3D1&_udhi=&_in_kw=3&_nkw=Cars&_sacat=0&_oexkw=&_dmd=1&_saslop=1&_samilow=', 'dont_filter': True, 'priority': 0, 'callback': 'after_form_page', 'method': 'GET', 'errback': '_form_request_failed'}, {'body': '', '_encoding': 'utf-8', 'cookies': {}, 'meta': {'form_key': u'http://www.ebay.com/sch/ebayadvsearch/?rt=nc'}, 'headers': {}, 'url': u'http://www.ebay.com/sch/i.html?_adv=1&_ex_kw=&_ftrv=1&_ftrt=901&_sabdlo=&_sabdhi=&_sop=12&_samihi=&_ipg=50&_salic=1&_sasl=&_udlo=&_okw=&_fsradio=%26LH_SpecificSeller%3D1&_udhi=&_in_kw=4&_nkw=Cars&_sacat=0&_oexkw=&_dmd=1&_saslop=1&_samilow=', 'dont_filter': True, 'priority': 0, 'callback': 'after_form_page', 'method': 'GET', 'errback': '_form_request_failed'}, {'body': '', '_encoding': 'utf-8', 'cookies': {}, 'meta': {}, 'headers': {}, 'url': u'http://www.ebay.com/sch/ebayadvsearch/?rt=nc', 'dont_filter': True, 'priority': 0, 'callback': 'parse', 'method': 'GET', 'errback': None}]
         self.assertEqual(request_list, expected)
 
     def test_allowed_domains(self):
@@ -409,3 +511,53 @@ Product B,http://www.example.com/path2,B"""
         self.assertEqual(request.meta.get('splash'), None)
         request = spider._add_splash_meta(Request(product_url))
         self.assertEqual(request.meta['splash']['args']['url'], product_url)
+
+    def test_js_adaptive_rendering(self):
+        with splash_spider_manager(SPLASH_ADAPTIVE=True,
+                                   SPLASH_ADAPTIVE_THRESHOLD=1) as manager:
+            spider = manager.create("seedsofchange", js_enabled=True)
+            spec = manager._specs["spiders"]["seedsofchange"]
+        product_body = spec["templates"][1]["original_body"]
+        product_url = spec["templates"][1]["url"]
+        empty_body = "<html><body><p>Loading...</p></body></html>"
+
+        # Pages are downloaded without rendering first
+        request = spider._add_splash_meta(Request(product_url))
+        self.assertEqual(request.meta.get('splash'), None)
+        self.assertEqual(request.meta['js_adaptive'], 'raw')
+        response = HtmlResponse(url=product_url, body=product_body,
+                                request=request, encoding='utf-8')
+        results = list(spider.parse(response))
+        self.assertEqual(len(results), 1)
+        self.assertNotIsInstance(results[0], Request)
+
+        # and rendered only when no items are found in the raw page
+        list_url = 'http://www.seedsofchange.com/garden_center/list/1'
+        request = spider._add_splash_meta(Request(list_url))
+        response = HtmlResponse(url=list_url, body=empty_body,
+                                request=request)
+        retry = list(spider.parse(response))[-1]
+        self.assertEqual(retry.meta['js_adaptive'], 'retry')
+        self.assertEqual(retry.meta['splash']['args']['url'], list_url)
+        response = HtmlResponse(url=list_url, body=product_body,
+                                request=retry, encoding='utf-8')
+        self.assertEqual(len(list(spider.parse(response))), 1)
+
+        # the pattern is now known to need rendering
+        request = spider._add_splash_meta(
+            Request('http://www.seedsofchange.com/garden_center/list/2'))
+        self.assertEqual(request.meta['js_adaptive'], 'render')
+        self.assertIn('splash', request.meta)
+
+        # patterns where rendering doesn't help are not retried again
+        empty_url = 'http://www.seedsofchange.com/about/1'
+        request = spider._add_splash_meta(Request(empty_url))
+        response = HtmlResponse(url=empty_url, body=empty_body,
+                                request=request)
+        retry = list(spider.parse(response))[-1]
+        response = HtmlResponse(url=empty_url, body=empty_body,
+                                request=retry)
+        self.assertEqual(list(spider.parse(response)), [])
+        response = HtmlResponse(url=empty_url, body=empty_body,
+                                request=request)
+        self.assertEqual(list(spider.parse(response)), [])
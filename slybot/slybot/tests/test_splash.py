@@ -0,0 +1,85 @@
+import json
+from os.path import exists, join
+from shutil import rmtree
+from tempfile import mkdtemp
+from unittest import TestCase
+
+from scrapy import Request, Spider
+from scrapy.http import Response, HtmlResponse
+from scrapy.utils.test import get_crawler
+
+from slybot.splash import SlybotJsMiddleware, js_profile, js_source
+
+
+def mkreq(endpoint='render.html'):
+    return Request('http://test.com', meta={
+        "splash": {
+            "endpoint": endpoint,
+            "args": {
+                "url": "http://test.com",
+            }
+        }
+    })
+
+
+class SplashMiddlewareTest(TestCase):
+    def setUp(self):
+        self.profiles_path = mkdtemp()
+        self.spider = Spider('test_spider')
+
+    def tearDown(self):
+        rmtree(self.profiles_path)
+
+    def create_middleware(self, **settings):
+        settings.setdefault('SPLASH_URL', 'http://localhost:8050')
+        settings.setdefault('SPLASH_SLOT_POLICY', 'scrapy_default')
+        return SlybotJsMiddleware.from_crawler(get_crawler(
+            settings_dict=settings))
+
+    def test_inline_script(self):
+        mw = self.create_middleware()
+        req = mw.process_request(mkreq(), self.spider)
+        args = json.loads(req.body)
+        self.assertTrue(args['js_source'].startswith(js_source))
+        self.assertNotIn('js', args)
+
+    def test_js_profile(self):
+        mw = self.create_middleware(
+            SPLASH_JS_PROFILES_PATH=self.profiles_path)
+        self.assertEqual(mw.js_profile, js_profile)
+        with open(join(self.profiles_path, js_profile, 'slybot.js')) as f:
+            self.assertEqual(f.read(), js_source)
+
+        req = mw.process_request(mkreq(), self.spider)
+        args = json.loads(req.body)
+        self.assertEqual(args['js'], js_profile)
+        self.assertNotIn('js_source', args)
+
+        # Lua scripts can't use profiles
+        req = mw.process_request(mkreq('execute'), self.spider)
+        args = json.loads(req.body)
+        self.assertNotIn('js', args)
+        self.assertTrue(args['js_source'].startswith(js_source))
+
+        req = mw.process_request(mkreq(), self.spider)
+        response = HtmlResponse(req.url, body='<html></html>', request=req)
+        response = mw.process_response(req, response, self.spider)
+        self.assertEqual(response.url, 'http://test.com')
+
+    def test_js_profile_fallback(self):
+        mw = self.create_middleware(
+            SPLASH_JS_PROFILES_PATH=join(self.profiles_path, 'not_shared'))
+        self.assertTrue(exists(join(self.profiles_path, 'not_shared',
+                                    js_profile)))
+        req = mw.process_request(mkreq(), self.spider)
+        response = Response(req.url, status=400, request=req,
+                            body='Nonexistent profile: %s' % js_profile)
+        retry = mw.process_response(req, response, self.spider)
+        self.assertIsNone(mw.js_profile)
+        self.assertEqual(retry.url, 'http://test.com')
+        self.assertEqual(retry.method, 'GET')
+
+        req = mw.process_request(retry, self.spider)
+        args = json.loads(req.body)
+        self.assertNotIn('js', args)
+        self.assertTrue(args['js_source'].startswith(js_source))
@@ -1,9 +1,14 @@
 from six.moves.urllib_parse import urlparse
 import os
 import json
+import hashlib
 import re
 
 from collections import OrderedDict
+try:
+    from collections.abc import Mapping
+except ImportError:
+    from collections import Mapping
 
 from scrapy.utils.misc import load_object
 
@@ -21,62 +26,141 @@ def iter_unique_scheme_hostname(urls):
     return list(scheme_hostname)
 
 
-def open_project_from_dir(project_dir):
+def content_hash(obj):
+    """Hash of the JSON serializable `obj`"""
+    return hashlib.sha1(json.dumps(obj, sort_keys=True)).hexdigest()
+
+
+def open_project_from_dir(project_dir, lazy=False, cache=None):
+    """Load the specs of the project in `project_dir`.
+
+    If `lazy` is True spiders are only read when they are accessed. Samples
+    are built through `cache`, an `AnnotatedBodyCache`, when given.
+    """
+    return _open_project(project_dir, os.listdir, open, lazy, cache)
+
+
+def open_project_from_zip(zipfile, lazy=False, cache=None):
+    """Load the specs of the project stored at the root of `zipfile`, an
+    open `ZipFile`, without extracting it.
+
+    If `lazy` is True spiders are only read when they are accessed. Samples
+    are built through `cache`, an `AnnotatedBodyCache`, when given.
+    """
+    members = zipfile.namelist()
+
+    def listdir(path):
+        prefix = path.replace(os.sep, '/').rstrip('/') + '/'
+        return [name[len(prefix):] for name in members
+                if name.startswith(prefix) and
+                '/' not in name[len(prefix):]]
+
+    def open_member(path):
+        try:
+            return zipfile.open(path.replace(os.sep, '/'))
+        except KeyError:
+            raise IOError('No such file in project archive: %s' % path)
+
+    return _open_project('', listdir, open_member, lazy, cache)
+
+
+def _open_project(project_dir, listdir, open_file, lazy, cache=None):
     specs = {"spiders": {}}
     try:
-        with open(os.path.join(project_dir, "project.json")) as f:
+        with open_file(os.path.join(project_dir, "project.json")) as f:
             specs["project"] = json.load(f)
     except IOError:
         specs["project"] = {}
-    with open(os.path.join(project_dir, "items.json")) as f:
+    with open_file(os.path.join(project_dir, "items.json")) as f:
         specs["items"] = json.load(f)
-    with open(os.path.join(project_dir, "extractors.json")) as f:
+    with open_file(os.path.join(project_dir, "extractors.json")) as f:
         specs["extractors"] = json.load(f)
 
-    spec_base = os.path.join(project_dir, "spiders")
-    for fname in os.listdir(spec_base):
-        if fname.endswith(".json"):
-            spider_name = os.path.splitext(fname)[0]
-            with open(os.path.join(spec_base, fname)) as f:
-                try:
-                    spec = json.load(f)
-                    template_names = spec.get("template_names")
-                    if template_names:
-                        templates = load_external_templates(spec_base,
-                                                            spider_name,
-                                                            template_names)
-                        spec.setdefault("templates", []).extend(templates)
-                    else:
-                        templates = []
-                        for template in spec.get('templates', []):
-                            if template.get('version') < '0.13.0':
-                                templates.append(template)
-                            else:
-                                templates.append(_build_sample(template))
-                    specs["spiders"][spider_name] = spec
-                except ValueError as e:
-                    raise ValueError(
-                        "Error parsing spider (invalid JSON): %s: %s" %
-                        (fname, e)
-                    )
+    spiders = SpiderSpecs(os.path.join(project_dir, "spiders"), listdir,
+                          open_file, cache)
+    specs["spiders"] = spiders if lazy else dict(spiders.items())
     return specs
 
 
-def load_external_templates(spec_base, spider_name, template_names):
+def load_spider_spec(spec_base, spider_name, open_file=open, cache=None):
+    """Load the spec of `spider_name` and build its templates"""
+    fname = spider_name + ".json"
+    with open_file(os.path.join(spec_base, fname)) as f:
+        try:
+            spec = json.load(f)
+            template_names = spec.get("template_names")
+            if template_names:
+                templates = load_external_templates(spec_base,
+                                                    spider_name,
+                                                    template_names,
+                                                    open_file, cache)
+                spec.setdefault("templates", []).extend(templates)
+            else:
+                for template in spec.get('templates', []):
+                    if template.get('version') >= '0.13.0':
+                        _build_sample(template, cache)
+        except ValueError as e:
+            raise ValueError(
+                "Error parsing spider (invalid JSON): %s: %s" %
+                (fname, e)
+            )
+    return spec
+
+
+class SpiderSpecs(Mapping):
+    """Mapping of the spiders in `spec_base` to their specs.
+
+    Spiders are indexed from the directory listing and each spec is only
+    loaded, and its templates built, the first time it is accessed.
+    """
+    def __init__(self, spec_base, listdir=os.listdir, open_file=open,
+                 cache=None):
+        self.spec_base = spec_base
+        self.open_file = open_file
+        self.cache = cache
+        self._names = set(os.path.splitext(fname)[0]
+                          for fname in listdir(spec_base)
+                          if fname.endswith(".json"))
+        self._loaded = {}
+
+    def __getitem__(self, spider_name):
+        if spider_name not in self._names:
+            raise KeyError(spider_name)
+        try:
+            return self._loaded[spider_name]
+        except KeyError:
+            spec = load_spider_spec(self.spec_base, spider_name,
+                                    self.open_file, self.cache)
+            self._loaded[spider_name] = spec
+            return spec
+
+    def __contains__(self, spider_name):
+        return spider_name in self._names
+
+    def __iter__(self):
+        return iter(sorted(self._names))
+
+    def __len__(self):
+        return len(self._names)
+
+
+def load_external_templates(spec_base, spider_name, template_names,
+                            open_file=open, cache=None):
     """A generator yielding the content of all passed `template_names` for
     `spider_name`.
     """
     for name in template_names:
-        with open(os.path.join(spec_base, spider_name, name + ".json")) as f:
+        path = os.path.join(spec_base, spider_name, name + ".json")
+        with open_file(path) as f:
             sample = json.load(f)
-            yield _build_sample(sample)
+            yield _build_sample(sample, cache)
 
 
-def _build_sample(sample):
+def _build_sample(sample, cache=None):
     from slybot.plugins.scrapely_annotations.builder import Annotations
     data = sample.get('plugins', {}).get('annotations-plugin')
     if data:
-        Annotations().save_extraction_data(data, sample)
+        Annotations().save_extraction_data(data, sample, cache=cache)
     return sample
 
 
@@ -1,5 +1,6 @@
 """Simple validation of specifications passed to slybot"""
 from __future__ import absolute_import
+from collections import OrderedDict
 from os.path import dirname, join
 import json
 import re
@@ -14,6 +15,8 @@ from jsonschema import (Draft3Validator, RefResolver, FormatChecker,
                         ValidationError)
 import six
 
+from slybot.utils import content_hash
+
 
 _PATH = dirname(__file__)
 
@@ -68,44 +71,96 @@ def get_url_re():
 
 URL_RE = get_url_re()
 
-def get_schema_validator(schema):
-    resolver = RefResolver("", schema, _SCHEMAS)
+@FormatChecker.cls_checks('url', (ValueError, UnicodeError))
+def is_valid_uri(url):
+    if not isinstance(url, six.string_types):
+        return False
+    if isinstance(url, six.binary_type):
+        url = url.decode('utf-8')
 
-    @FormatChecker.cls_checks('url', (ValueError, UnicodeError))
-    def is_valid_uri(url):
-        if not isinstance(url, six.string_types):
-            return False
-        if isinstance(url, six.binary_type):
-            url = url.decode('utf-8')
+    scheme, netloc, path, query, fragment = urlsplit(url)
+    netloc = netloc.encode('idna').decode('ascii')  # IDN -> ACE
+    url = urlunsplit((scheme, netloc, path, query, fragment))
 
-        scheme, netloc, path, query, fragment = urlsplit(url)
-        netloc = netloc.encode('idna').decode('ascii')  # IDN -> ACE
-        url = urlunsplit((scheme, netloc, path, query, fragment))
+    if not URL_RE.match(url):
+        return False
 
-        if not URL_RE.match(url):
+    # Validate IPv6
+    ipv6_match = re.search(r'^\[(.+)\](?::\d{2,5})?$', netloc)
+    if ipv6_match:
+        potential_ip = ipv6_match.groups()[0]
+        if not is_valid_ipv6_address(potential_ip):
             return False
+    return True
 
-        # Validate IPv6
-        ipv6_match = re.search(r'^\[(.+)\](?::\d{2,5})?$', netloc)
-        if ipv6_match:
-            potential_ip = ipv6_match.groups()[0]
-            if not is_valid_ipv6_address(potential_ip):
-                return False
-        return True
 
-    # Workaround for https://github.com/Julian/jsonschema/pull/272
-    @FormatChecker.cls_checks('regex', (Exception))
-    def is_valid_re(re_source):
-        if not isinstance(re_source, six.string_types):
-            return False
-        if isinstance(re_source, six.binary_type):
-            re_source = re_source.decode('utf-8')
+# Workaround for https://github.com/Julian/jsonschema/pull/272
+@FormatChecker.cls_checks('regex', (Exception))
+def is_valid_re(re_source):
+    if not isinstance(re_source, six.string_types):
+        return False
+    if isinstance(re_source, six.binary_type):
+        re_source = re_source.decode('utf-8')
+
+    re.compile(re_source)
+    return True
 
-        re.compile(re_source)
+
+_VALIDATORS = {}
+
+
+def get_schema_validator(schema):
+    """Validator for the schema with id `schema`, built once per schema"""
+    try:
+        return _VALIDATORS[schema]
+    except KeyError:
+        resolver = RefResolver("", schema, _SCHEMAS)
+        validator = SlybotJsonSchemaValidator(_SCHEMAS[schema],
+                                              resolver=resolver,
+                                              format_checker=FormatChecker())
+        _VALIDATORS[schema] = validator
+        return validator
+
+
+class IncrementalValidator(object):
+    """Validate resources only when their content changed since the last
+    time they were validated successfully.
+
+    The hashes of the last `max_entries` resources validated are kept.
+    """
+    max_entries = 4096
+
+    def __init__(self, max_entries=None):
+        if max_entries is not None:
+            self.max_entries = max_entries
+        self._validated = OrderedDict()
+
+    def validate(self, schema, obj, key=None):
+        """Validate `obj`, identified by `key`, against `schema`.
+
+        Returns True if `obj` was validated and False if it was skipped
+        because it hadn't changed. Raises ValidationError like
+        `get_schema_validator(schema).validate`.
+        """
+        key = (schema, schema if key is None else key)
+        digest = content_hash(obj)
+        if self._validated.pop(key, None) == digest:
+            self._validated[key] = digest  # Mark as recently used
+            return False
+        get_schema_validator(schema).validate(obj)
+        self._validated[key] = digest
+        while len(self._validated) > self.max_entries:
+            self._validated.popitem(last=False)
         return True
 
-    return SlybotJsonSchemaValidator(_SCHEMAS[schema], resolver=resolver,
-                                     format_checker=FormatChecker())
+    def validate_project(self, specs):
+        """Like `validate_project_schema` but only validates the resources
+        of `specs` that changed."""
+        for schema in ("project", "items", "extractors"):
+            self.validate(schema, specs[schema])
+        for name, spider in specs["spiders"].items():
+            self.validate("spider", spider, name)
+        return True
 
 
 def validate_project_schema(specs):
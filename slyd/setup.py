@@ -10,7 +10,8 @@ setup(name='slyd',
       url='http://github.com/scrapinghub/portia',
       packages=find_packages(),
       platforms=['Any'],
-      scripts=['bin/sh2sly', 'bin/slyd', 'bin/init_mysql_db'],
+      scripts=['bin/sh2sly', 'bin/slyd', 'bin/init_mysql_db',
+               'bin/gc_repos'],
       classifiers=[
           'Development Status :: 4 - Beta',
           'License :: OSI Approved :: BSD License',
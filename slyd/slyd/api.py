@@ -110,6 +110,9 @@ class APIResource(object):
 
     def deferred_finished(self, request, api_response, data):
         data = self.format_response(request, api_response, data)
+        if data is NOT_DONE_YET:
+            # The response is finished by whoever is writing it
+            return
         request.write(data)
         request.finish()
 
@@ -16,16 +16,18 @@ error to display. Otherwise you will find the following fields:
 import json
 import errno
 
+from collections import OrderedDict
 from functools import partial
+from twisted.internet.defer import DeferredSemaphore
 from twisted.web.http import RESPONSES
 from twisted.web.resource import Resource
 from twisted.web.server import failure, NOT_DONE_YET
 from scrapy.http import Request
 from scrapy.item import DictItem
 from scrapy import signals, log
-from scrapy.crawler import CrawlerRunner
+from scrapy.crawler import Crawler, CrawlerRunner
 from scrapy.http import HtmlResponse, XmlResponse
-from scrapy.exceptions import DontCloseSpider
+from scrapy.exceptions import DontCloseSpider, IgnoreRequest
 from scrapy.utils.request import request_fingerprint
 from scrapy.utils.serialize import ScrapyJSONEncoder
 try:
@@ -48,24 +50,100 @@ class SlydSpider(Spider):
     name = 'slyd'
 
 
+class CancelledFetchMiddleware(object):
+    """Drop fetches whose client disconnected before they were downloaded"""
+
+    def process_request(self, request, spider):
+        if fetch_cancelled(request.meta.get('twisted_request')):
+            raise IgnoreRequest('Client disconnected')
+
+
+def fetch_cancelled(twisted_request):
+    return getattr(twisted_request, 'fetch_cancelled', False)
+
+
 class Bot(Resource):
     spider = SlydSpider()
+    # Number of spiders kept for extracting data from fetched pages
+    spider_cache_size = 32
 
     def __init__(self, settings, spec_manager):
         # twisted base class is old-style so we cannot user super()
         Resource.__init__(self)
         self.spec_manager = spec_manager
         settings.set('PLUGINS', [p['bot'] for p in settings.get('PLUGINS')])
+        middlewares = dict(settings.getdict('DOWNLOADER_MIDDLEWARES'))
+        middlewares['slyd.bot.CancelledFetchMiddleware'] = 0
+        settings.set('DOWNLOADER_MIDDLEWARES', middlewares)
         self.runner = CrawlerRunner(settings)
+        self._crawler = None
+        self._fetch_concurrency = settings.getint(
+            'BOT_CONCURRENT_FETCHES_PER_USER', 4)
+        self._fetch_slots = {}
+        self._spiders = OrderedDict()
         log.msg("bot initialized", level=log.DEBUG)
 
+    @property
+    def crawler(self):
+        """Crawler all fetches are scheduled in, started on first use"""
+        if self._crawler is None or not self._crawler.crawling:
+            crawler = Crawler(SlydSpider, self.runner.settings)
+            crawler.signals.connect(self.keep_spider_alive,
+                                    signals.spider_idle)
+            self.runner.crawl(crawler)
+            self._crawler = crawler
+        return self._crawler
+
+    def run_in_fetch_slot(self, twisted_request, f, *args):
+        """Run `f` once the user has a free fetch slot, which limits the
+        number of concurrent fetches of each user.
+
+        The slots of a user are dropped once none of them is in use.
+        """
+        username = twisted_request.auth_info.get('username')
+        slot = self._fetch_slots.get(username)
+        if slot is None:
+            slot = DeferredSemaphore(self._fetch_concurrency)
+            self._fetch_slots[username] = slot
+        return slot.run(f, *args).addBoth(self._release_fetch_slot,
+                                          username, slot)
+
+    def _release_fetch_slot(self, result, username, slot):
+        if (slot.tokens == slot.limit and not slot.waiting and
+                self._fetch_slots.get(username) is slot):
+            del self._fetch_slots[username]
+        return result
+
+    def cached_spider(self, key, version, create):
+        """Return the spider and templates cached for `key` if they were
+        created at the same `version`, otherwise create them calling
+        `create` and cache them.
+
+        Spiders are keyed by project and spider name. The version is the
+        cheap token returned by `spider_version` of the project spec, which
+        changes whenever the spider, its templates, items or extractors are
+        saved, so specs are only read when a spider has to be created again.
+        """
+        try:
+            cached_version, spider = self._spiders.pop(key)
+        except KeyError:
+            cached_version = None
+        if cached_version != version:
+            spider = create()
+        self._spiders[key] = version, spider
+        while len(self._spiders) > self.spider_cache_size:
+            self._spiders.popitem(last=False)
+        return spider
+
     def keep_spider_alive(self, spider):
         raise DontCloseSpider("keeping it open")
 
     def stop(self):
         """Stop the crawler"""
-        self.runner.stop()
+        stopped = self.runner.stop()
+        self._crawler = None
         log.msg("bot stopped", level=log.DEBUG)
+        return stopped
 
 
 class BotResource(SlydJsonResource):
@@ -91,24 +169,29 @@ class Fetch(BotResource):
                 slyd_request_params=params
             )
         )
-        request.notifyFinish().addErrback(self._requestDisconnect)
-
         scrapy_request_kwargs.setdefault('headers', {})
         user_agent = request.requestHeaders.getRawHeaders('user-agent')
         if user_agent:
             scrapy_request_kwargs['headers'].setdefault('user-agent',
                                                         user_agent[0])
         scrapy_request = Request(**scrapy_request_kwargs)
-        self.bot.runner.crawl(SlydSpider)
-        crawler = list(self.bot.runner.crawlers)[0]
-        crawler.signals.connect(self.bot.keep_spider_alive,
-                                signals.spider_idle)
-        crawler.engine.schedule(scrapy_request, crawler.spider)
+        # Fired once the response is written or the client disconnects
+        finished = request.notifyFinish()
+        finished.addErrback(self._requestDisconnect, request)
+        self.bot.run_in_fetch_slot(request, self._schedule, scrapy_request,
+                                   finished)
 
         return NOT_DONE_YET
 
-    def _requestDisconnect(self, result):
-        self.bot.runner.stop()
+    def _schedule(self, scrapy_request, finished):
+        # The fetch slot is released when `finished` fires
+        if not fetch_cancelled(scrapy_request.meta['twisted_request']):
+            crawler = self.bot.crawler
+            crawler.engine.schedule(scrapy_request, crawler.spider)
+        return finished
+
+    def _requestDisconnect(self, failure, request):
+        request.fetch_cancelled = True
 
     def _get_template_name(self, template_id, templates):
         for template in templates:
@@ -117,6 +200,8 @@ class Fetch(BotResource):
 
     def fetch_callback(self, response):
         request = response.meta['twisted_request']
+        if fetch_cancelled(request):
+            return
         result_response = dict(status=response.status,
                                headers=response.headers.to_string())
         if response.status != 200:
@@ -173,12 +258,10 @@ class Fetch(BotResource):
             return None, None
         pspec = self.bot.spec_manager.project_spec(project, auth_info)
         try:
-            spider_spec = pspec.spider_with_templates(spider)
-            items_spec = pspec.resource('items')
-            extractors = pspec.resource('extractors')
-            return (IblSpider(spider, spider_spec, items_spec, extractors,
-                              self.bot.runner.settings, **kwargs),
-                    spider_spec['templates'])
+            key = (project, auth_info.get('username'), spider)
+            version = (pspec.spider_version(spider), kwargs)
+            return self.bot.cached_spider(key, version, partial(
+                self._load_spider, pspec, spider, **kwargs))
         except IOError as ex:
             if ex.errno == errno.ENOENT:
                 log.msg("skipping extraction, no spec: %s" % ex.filename)
@@ -186,7 +269,17 @@ class Fetch(BotResource):
             else:
                 raise
 
+    def _load_spider(self, pspec, spider, **kwargs):
+        spider_spec = pspec.spider_with_templates(spider)
+        items_spec = pspec.resource('items')
+        extractors = pspec.resource('extractors')
+        ibl_spider = IblSpider(spider, spider_spec, items_spec, extractors,
+                               self.bot.runner.settings, **kwargs)
+        return ibl_spider, spider_spec['templates']
+
     def fetch_errback(self, twisted_request, failure):
+        if fetch_cancelled(twisted_request):
+            return
         msg = "The request to the web-server failed. " \
               "The crawler engine returned an error: %s" \
               % failure.getErrorMessage()
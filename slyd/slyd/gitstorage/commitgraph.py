@@ -0,0 +1,119 @@
+from __future__ import absolute_import
+from collections import OrderedDict
+from heapq import heappush, heappop
+from threading import Lock
+
+
+class CommitGraph(object):
+    '''A process wide LRU index of the parents and generation number of
+    commits.
+
+    The generation number of a root commit is 1 and the one of any other
+    commit is one more than the highest generation of its parents, so an
+    ancestor always has a lower generation than its descendants. This bounds
+    the traversals needed to answer ancestry and merge base queries to the
+    commits between the two generations.
+
+    Commits are indexed the first time they are seen, only the commits that
+    are not in the index yet are read from the object store. Commits never
+    change, so the index is shared by every repository. It holds at most
+    `max_size` commits, evicted ones are indexed again from the store when
+    they are needed.
+    '''
+    max_size = 100000
+
+    def __init__(self, max_size=None):
+        if max_size is not None:
+            self.max_size = max_size
+        self._commits = OrderedDict()
+        self._lock = Lock()
+
+    def __contains__(self, sha):
+        return sha in self._commits
+
+    def __len__(self):
+        return len(self._commits)
+
+    def get(self, store, sha):
+        '''Returns the generation number and parents of a commit.'''
+        with self._lock:
+            entry = self._commits.pop(sha, None)
+            if entry is not None:
+                self._commits[sha] = entry
+                return entry
+        return self._index(store, sha)
+
+    def _index(self, store, sha):
+        commit = sha
+        # Generations are kept until the walk ends as indexed commits may be
+        # evicted during it
+        generations = {}
+        parents = {}
+        stack = [sha]
+        while stack:
+            sha = stack[-1]
+            if sha in generations:
+                stack.pop()
+                continue
+            if sha not in parents:
+                parents[sha] = tuple(store[sha].parents)
+            for parent in parents[sha]:
+                entry = self._commits.get(parent)
+                if parent not in generations and entry is not None:
+                    generations[parent] = entry[0]
+            missing = [p for p in parents[sha] if p not in generations]
+            if missing:
+                stack.extend(missing)
+                continue
+            stack.pop()
+            generations[sha] = 1 + max(
+                [generations[p] for p in parents[sha]] or [0])
+            self._add(sha, (generations[sha], parents[sha]))
+        return generations[commit], parents[commit]
+
+    def _add(self, sha, entry):
+        with self._lock:
+            self._commits.pop(sha, None)
+            self._commits[sha] = entry
+            while len(self._commits) > self.max_size:
+                self._commits.popitem(last=False)
+
+    def is_ancestor(self, store, descendant, ancestor):
+        '''Returns True if ancestor is reachable from descendant.'''
+        generation = self.get(store, ancestor)[0]
+        seen = set([descendant])
+        pending = [descendant]
+        while pending:
+            sha = pending.pop()
+            if sha == ancestor:
+                return True
+            for parent in self.get(store, sha)[1]:
+                if (parent not in seen and
+                        self.get(store, parent)[0] >= generation):
+                    seen.add(parent)
+                    pending.append(parent)
+        return False
+
+    def merge_base(self, store, one, other):
+        '''Returns the newest common ancestor of two commits or None.
+
+        Commits are visited from the highest generation down, so the first
+        one reached from both commits is a best common ancestor.
+        '''
+        reached = {one: 1}
+        reached[other] = reached.get(other, 0) | 2
+        queue = []
+        for sha in reached:
+            heappush(queue, (-self.get(store, sha)[0], sha))
+        while queue:
+            _, sha = heappop(queue)
+            flags = reached[sha]
+            if flags == 3:
+                return sha
+            for parent in self.get(store, sha)[1]:
+                if parent not in reached:
+                    reached[parent] = flags
+                    heappush(queue, (-self.get(store, parent)[0], parent))
+                else:
+                    reached[parent] |= flags
+        return None
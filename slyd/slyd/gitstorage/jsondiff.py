@@ -4,6 +4,16 @@ from collections import namedtuple
 from six.moves import zip_longest
 
 _BLANK = object()
+_DICT = object()
+
+
+def _hashable(item):
+    """Hashable value that is equal for equal json items"""
+    if isinstance(item, dict):
+        return _DICT, tuple(sorted((k, _hashable(v)) for k, v in item.items()))
+    if isinstance(item, list):
+        return tuple(_hashable(v) for v in item)
+    return item
 
 
 class Conflict(object):
@@ -43,9 +53,10 @@ class Conflict(object):
             return self.mine
         if self.other == self.mine:
             return self.mine
-        combined = set(self.mine or []) | set(self.other or [])
+        combined = {_hashable(i)
+                    for i in (self.mine or []) + (self.other or [])}
         if (self.base is not None and
-                not any(i in combined for i in self.base)):
+                not any(_hashable(i) in combined for i in self.base)):
             return [self]
         mine = self.mine if self.mine else []
         other = self.other if self.other else []
@@ -94,35 +105,97 @@ class Conflict(object):
 
 
 def merge_lists(base, mine, other):
+    """
+    Performs a 3-way merge of the lists mine and other using base as the
+    common ancestor.
+
+    Both lists are aligned with base like diff3 does, so an item inserted in
+    one of them doesn't shift the rest of the list into conflicts. Regions
+    changed only in one list are taken from it and regions changed in both
+    are merged item by item. A base that isn't a list, like a field added in
+    both mine and other, is taken as an empty list.
+    """
+    if not isinstance(base, list):
+        base = []
     if mine == other:
         return mine
     if other == base:
         return mine
     if mine == base:
         return other
+    base_keys, my_keys, other_keys = ([_hashable(item) for item in items]
+                                      for items in (base, mine, other))
+    result = []
+    b = m = o = 0
+    for b_start, b_end, m_start, m_end, o_start, o_end in _sync_regions(
+            base_keys, my_keys, other_keys):
+        base_chunk = base_keys[b:b_start]
+        my_chunk, other_chunk = my_keys[m:m_start], other_keys[o:o_start]
+        if my_chunk == base_chunk:
+            result.extend(other[o:o_start])
+        elif other_chunk == base_chunk or my_chunk == other_chunk:
+            result.extend(mine[m:m_start])
+        else:
+            result.extend(_merge_positional(base[b:b_start], mine[m:m_start],
+                                            other[o:o_start]))
+        result.extend(mine[m_start:m_end])
+        b, m, o = b_end, m_end, o_end
+    return result
+
+
+def _sync_regions(base, mine, other):
+    """
+    Yields the (base_start, base_end, mine_start, mine_end, other_start,
+    other_end) ranges where the three lists are equal, ending with an empty
+    region at the end of the lists.
+    """
+    my_blocks, other_blocks = (
+        difflib.SequenceMatcher(None, base, x,
+                                autojunk=False).get_matching_blocks()
+        for x in (mine, other))
+    i = j = 0
+    while i < len(my_blocks) and j < len(other_blocks):
+        my_base, my_start, my_len = my_blocks[i]
+        other_base, other_start, other_len = other_blocks[j]
+        start = max(my_base, other_base)
+        end = min(my_base + my_len, other_base + other_len)
+        if start < end:
+            yield (start, end,
+                   my_start + start - my_base, my_start + end - my_base,
+                   other_start + start - other_base,
+                   other_start + end - other_base)
+        if my_base + my_len < other_base + other_len:
+            i += 1
+        else:
+            j += 1
+    yield len(base), len(base), len(mine), len(mine), len(other), len(other)
+
+
+def _merge_positional(base, mine, other):
+    """Merge the items of the lists at the same positions"""
+    # When items were only replaced each position can be merged on its own
+    in_place = len(base) == len(mine) == len(other)
     result = []
-    last_conflict = False
-    for i, (m, o, b) in enumerate(zip_longest(mine, other, base,
-                                              fillvalue=_BLANK)):
-        if (m == o and _BLANK not in (m, o) or
+    conflict = None
+    for m, o, b in zip_longest(mine, other, base, fillvalue=_BLANK):
+        if in_place and m == b:
+            item = o
+        elif (in_place and o == b or
+                m == o and _BLANK not in (m, o) or
                 isinstance(m, dict) and isinstance(o, dict)):
-            result.append(m)
+            item = m
         else:  # Conflict
-            if last_conflict:
-                c = result[-1]
-                c.update(m, o, b)
+            if conflict is None:
+                conflict = Conflict(m, o, b)
             else:
-                c = Conflict(m, o, b)
-                result.append(c)
-            last_conflict = True
+                conflict.update(m, o, b)
             continue
-        last_conflict = False
-    offset = 0
-    for i, r in enumerate(result[:]):
-        if isinstance(r, Conflict):
-            c = r.resolve_conflict()
-            result = result[:i + offset] + c + result[i + offset + 1:]
-            offset += len(c) - 1
+        if conflict is not None:
+            result.extend(conflict.resolve_conflict())
+            conflict = None
+        result.append(item)
+    if conflict is not None:
+        result.extend(conflict.resolve_conflict())
     return result
 
 
@@ -188,7 +261,7 @@ def merge_jsons(base, mine, other):
                 base.get(k, {}), mine.get(k), other.get(k))
             if isinstance(my_val, dict) and isinstance(other_val, dict):
                 merge_dict[k] = build_merge_dict(base_val, my_val, other_val)
-            if isinstance(my_val, list) and isinstance(other_val, list):
+            elif isinstance(my_val, list) and isinstance(other_val, list):
                 merge_dict[k] = merge_lists(base_val, my_val, other_val)
             else:
                 merge_dict[k] = FieldDiff(base_val=base.get(k),
@@ -211,7 +284,7 @@ def merge_jsons(base, mine, other):
             if isinstance(diff, dict):
                 out_json[key], rconflict = resolve_json(diff)
                 had_conflict = had_conflict or rconflict
-            if isinstance(diff, list):
+            elif isinstance(diff, list):
                 for i, item in enumerate(diff):
                     if isinstance(item, Conflict):
                         if (item.mine and isinstance(item.mine[0], dict) and
@@ -0,0 +1,141 @@
+from __future__ import absolute_import
+from collections import Counter, OrderedDict
+from threading import Lock
+
+
+class ObjectCache(object):
+    '''A process wide LRU cache of git objects keyed by sha.
+
+    Git objects never change once stored, so they can be shared by every
+    repository and request. The cache holds at most `max_size` bytes of
+    raw object data. Cached objects are shared and must not be modified,
+    callers that need to change one must work on a copy.
+    '''
+    max_size = 64 * 1024 * 1024
+
+    def __init__(self, max_size=None):
+        if max_size is not None:
+            self.max_size = max_size
+        self.size = 0
+        self.counts = Counter()
+        self._objects = OrderedDict()
+        self._lock = Lock()
+
+    def __contains__(self, sha):
+        return sha in self._objects
+
+    def get(self, sha):
+        with self._lock:
+            try:
+                obj, size = self._objects.pop(sha)
+            except KeyError:
+                self.counts['misses'] += 1
+                return None
+            self._objects[sha] = (obj, size)
+            self.counts['hits'] += 1
+            return obj
+
+    def add(self, obj):
+        size = obj.raw_length()
+        if size > self.max_size:
+            return
+        with self._lock:
+            previous = self._objects.pop(obj.id, None)
+            if previous is not None:
+                self.size -= previous[1]
+            self._objects[obj.id] = (obj, size)
+            self.size += size
+            while self.size > self.max_size:
+                _, (_, evicted_size) = self._objects.popitem(last=False)
+                self.size -= evicted_size
+                self.counts['evictions'] += 1
+
+    def discard(self, shas):
+        with self._lock:
+            for sha in shas:
+                entry = self._objects.pop(sha, None)
+                if entry is not None:
+                    self.size -= entry[1]
+
+    def clear(self):
+        with self._lock:
+            self._objects.clear()
+            self.size = 0
+            self.counts.clear()
+
+    def stats(self):
+        '''Hit ratio of the object and ref caches.
+
+        Every hit is a round trip to the storage backend that was saved.
+        '''
+        counts = self.counts
+        lookups = counts['hits'] + counts['misses']
+        ref_lookups = counts['ref_hits'] + counts['ref_misses']
+        return {
+            'objects': len(self._objects),
+            'size': self.size,
+            'hits': counts['hits'],
+            'misses': counts['misses'],
+            'evictions': counts['evictions'],
+            'hit_ratio': counts['hits'] / float(lookups) if lookups else None,
+            'ref_hits': counts['ref_hits'],
+            'ref_misses': counts['ref_misses'],
+            'ref_hit_ratio': (counts['ref_hits'] / float(ref_lookups)
+                              if ref_lookups else None),
+            'round_trips_saved': counts['hits'] + counts['ref_hits'],
+        }
+
+
+class CachedObjectStore(object):
+    '''Object store that looks objects up in an ObjectCache before asking
+    the storage backend.
+
+    Everything else is delegated to the wrapped store.
+    '''
+
+    def __init__(self, store, cache):
+        self.store = store
+        self.cache = cache
+
+    def __getitem__(self, sha):
+        obj = self.cache.get(sha)
+        if obj is None:
+            obj = self.store[sha]
+            self.cache.add(obj)
+        return obj
+
+    def __contains__(self, sha):
+        return sha in self.cache or sha in self.store
+
+    def __iter__(self):
+        return iter(self.store)
+
+    def prefetch(self, shas):
+        '''Load the objects missing from the cache.
+
+        They are read with a single `iter_shas` call, which backends can
+        implement with one query instead of one per object.
+        '''
+        missing = [(sha, None) for sha in set(shas)
+                   if sha is not None and sha not in self.cache]
+        if missing:
+            for obj, _ in self.store.iter_shas(missing):
+                self.cache.add(obj)
+
+    def add_objects(self, objects, *args, **kwargs):
+        result = self.store.add_objects(objects, *args, **kwargs)
+        for obj, _ in objects:
+            self.cache.add(obj)
+        return result
+
+    def add_object(self, obj):
+        result = self.store.add_object(obj)
+        self.cache.add(obj)
+        return result
+
+    def delete_objects(self, shas):
+        self.cache.discard(shas)
+        return self.store.delete_objects(shas)
+
+    def __getattr__(self, name):
+        return getattr(self.store, name)
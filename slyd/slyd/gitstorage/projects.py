@@ -6,13 +6,17 @@ from twisted.internet.threads import deferToThread
 from twisted.internet.task import deferLater
 from twisted.internet.defer import inlineCallbacks
 from twisted.internet import reactor
+from twisted.web.http import CACHED, datetimeToString
+from twisted.web.server import NOT_DONE_YET
 
+from slybot import __version__ as slybot_version
 from slyd.projects import ProjectsManager
 from slyd.projecttemplates import templates
 from slyd.errors import BadRequest
 from .repoman import Repoman
 from slyd.utils.copy import GitSpiderCopier
-from slyd.utils.download import GitProjectArchiver
+from slyd.utils.download import (GitProjectArchiver, ArchiveStreamer,
+                                 ArchiveCache)
 
 
 def run_in_thread(func):
@@ -84,9 +88,18 @@ class GitProjectMixin(object):
 
 class GitProjectsManager(ProjectsManager, GitProjectMixin):
 
+    # Archives of downloaded revisions, set with the archive_cache_dir param
+    archive_cache = None
+
     @classmethod
-    def setup(cls, storage_backend, location):
-        Repoman.setup(storage_backend, location)
+    def setup(cls, storage_backend, location, object_cache_size=None,
+              coalesce_window=None, archive_cache_dir=None,
+              archive_cache_size=None, commit_graph_size=None):
+        Repoman.setup(storage_backend, location, object_cache_size,
+                      coalesce_window, commit_graph_size)
+        if archive_cache_dir is not None:
+            cls.archive_cache = ArchiveCache(archive_cache_dir,
+                                             archive_cache_size)
 
     def __init__(self, *args, **kwargs):
         ProjectsManager.__init__(self, *args, **kwargs)
@@ -189,8 +202,14 @@ class GitProjectsManager(ProjectsManager, GitProjectMixin):
         copier = GitSpiderCopier(source, destination, branch)
         return json.dumps(copier.copy(spiders, items))
 
-    @run_in_thread
-    def download_project(self, name, spiders=None, version=None):
+    def download_project(self, name, spiders=None, version=None,
+                         stream=False):
+        # When streaming, the repository lookups are still done in a thread
+        # and the archive is built in another one while it is sent
+        return deferToThread(self._download_project, name, spiders, version,
+                             stream)
+
+    def _download_project(self, name, spiders, version, stream=False):
         if version is None:
             version = (0, 9)
         else:
@@ -201,15 +220,56 @@ class GitProjectsManager(ProjectsManager, GitProjectMixin):
             request = self.request
             etag_str = (request.getHeader('If-None-Match') or '').split(',')
             etags = [etag.strip() for etag in etag_str]
-            if self._gen_etag({'args': [name, spiders]}) in etags:
+            etag = self._gen_etag({'args': [name, spiders]})
+            if etag in etags:
                 return ''
-            branch = self._get_branch(name=name, read_only=True)
-            return GitProjectArchiver(Repoman.open_repo(name), version=version,
-                                      branch=branch).archive(spiders).read()
+            repoman = Repoman.open_repo(name)
+            branch = self._get_branch(repoman, read_only=True)
+            archiver = GitProjectArchiver(repoman, version=version,
+                                          branch=branch)
+            revisions = self._archive_revisions(repoman)
+            cache, key = self.archive_cache, None
+            if cache is not None:
+                if spiders is None or spiders == '*':
+                    selection = '*'
+                else:
+                    selection = sorted(spiders)
+                key = cache.key(name, revisions, selection, version,
+                                slybot_version)
+            if stream:
+                last_modified = max(repoman.commit_time(revision)
+                                    for revision in revisions)
+                return ArchiveStreamer(archiver, spiders, cache, key,
+                                       last_modified, etag)
+            if cache is not None:
+                archive = cache.get(key)
+                if archive is not None:
+                    with archive:
+                        return archive.read()
+            archive = archiver.archive(spiders).read()
+            if cache is not None:
+                cache.add(key, archive)
+            return archive
         return json.dumps({'status': 404,
                            'error': 'Project "%s" not found' % name})
 
     def _render_file(self, request, request_data, body):
+        if isinstance(body, ArchiveStreamer):
+            request.setHeader('ETag', body.etag)
+            if body.last_modified is not None:
+                if request.getHeader('If-None-Match') is not None:
+                    # The ETag didn't match, so If-Modified-Since is ignored.
+                    # Discarded changes leave an archive of older commits
+                    request.setHeader('Last-Modified',
+                                      datetimeToString(body.last_modified))
+                elif request.setLastModified(body.last_modified) == CACHED:
+                    return ''
+            request.setHeader('Content-Type', 'application/zip')
+            request.setHeader('Content-Disposition', 'attachment; '
+                              'filename="%s.zip"' % self._archive_name(
+                                  request_data))
+            body.stream(request)
+            return NOT_DONE_YET
         if len(body) == 0:
             request.setHeader('ETag', self._gen_etag(request_data))
             request.setResponseCode(304)
@@ -220,21 +280,32 @@ class GitProjectsManager(ProjectsManager, GitProjectMixin):
                 request.setResponseCode(404)
                 request.setHeader('Content-Type', 'application/json')
         except (TypeError, ValueError):
-            try:
-                id = request_data.get('args')[0]
-                name = self._get_project_name(id).encode('utf-8')
-            except (TypeError, ValueError, IndexError):
-                name = 'archive'
             request.setHeader('ETag', self._gen_etag(request_data))
             request.setHeader('Content-Type', 'application/zip')
             request.setHeader('Content-Disposition', 'attachment; '
-                              'filename="%s.zip"' % name)
+                              'filename="%s.zip"' % self._archive_name(
+                                  request_data))
             request.setHeader('Content-Length', len(body))
         return body
 
+    def _archive_name(self, request_data):
+        try:
+            id = request_data.get('args')[0]
+            return self._get_project_name(id).encode('utf-8')
+        except (TypeError, ValueError, IndexError):
+            return 'archive'
+
     def _gen_etag(self, request_data):
         args = request_data.get('args')
         id = args[0]
-        last_commit = self._open_repo(id).refs['refs/heads/master']
+        revisions = self._archive_revisions(self._open_repo(id))
         spiders = args[1] if len(args) > 1 and args[1] else []
-        return (last_commit + '.' + '.'.join(spiders)).encode('utf-8')
+        return ('.'.join(revisions) + '.' + '.'.join(spiders)).encode('utf-8')
+
+    def _archive_revisions(self, repoman):
+        """The commits that the archive of a project is built from"""
+        revisions = [repoman.get_branch('master')]
+        branch = self._get_branch(repoman, read_only=True)
+        if branch != 'master':
+            revisions.append(repoman.get_branch(branch))
+        return revisions
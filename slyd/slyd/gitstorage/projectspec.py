@@ -9,8 +9,16 @@ from slyd.errors import BadRequest
 
 class GitProjectSpec(GitProjectMixin, ProjectSpec):
     @classmethod
-    def setup(cls, storage_backend, location, **kwargs):
-        Repoman.setup(storage_backend, location)
+    def setup(cls, storage_backend, location, object_cache_size=None,
+              coalesce_window=None, commit_graph_size=None, **kwargs):
+        Repoman.setup(storage_backend, location, object_cache_size,
+                      coalesce_window, commit_graph_size)
+
+    def spider_version(self, spider):
+        """Head of the branch the spider is read from, it changes whenever
+        any file of the project is saved."""
+        repo = self._open_repo()
+        return repo.get_branch(self._get_branch(repo, read_only=True))
 
     def _rfile_contents(self, resources):
         return self._open_repo().file_contents_for_branch(
@@ -66,3 +74,10 @@ class GitProjectSpec(GitProjectMixin, ProjectSpec):
         self._open_repo().save_file(self._rfile_name(*resources),
                                     json.dumps(obj, sort_keys=True, indent=4),
                                     self._get_branch())
+
+    @retry_operation(catches=(KeyError,), seconds=0.5)
+    def savejsons(self, resources):
+        self._open_repo().save_files(
+            {self._rfile_name(*path): json.dumps(obj, sort_keys=True, indent=4)
+             for obj, path in resources},
+            self._get_branch())
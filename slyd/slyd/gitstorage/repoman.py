@@ -1,5 +1,6 @@
 from __future__ import absolute_import
 from time import time
+from stat import S_ISDIR
 from collections import defaultdict
 from json import dumps, loads
 from itertools import chain
@@ -11,6 +12,8 @@ from dulwich.diff_tree import tree_changes, RenameDetector
 from dulwich.mysqlconnection import retry_operation
 
 from .jsondiff import merge_jsons
+from .objectcache import ObjectCache, CachedObjectStore
+from .commitgraph import CommitGraph
 
 
 CHANGE_ADD = 'add'
@@ -47,12 +50,29 @@ class Repoman(object):
         * User B resolves the pending conflicts.
         * User B publishes his changes using publish_branch.
         * User B deletes his edit branch.
+
+    Objects read from and written to the storage backend are kept in an
+    ObjectCache shared by every repo of the process, and each Repoman
+    remembers the refs it has looked up until it changes one. Ancestry and
+    merge base queries use the generation numbers of a shared CommitGraph.
     '''
+    object_cache = ObjectCache()
+    commit_graph = CommitGraph()
+    # Seconds during which consecutive file operations on a branch are
+    # squashed into one commit, 0 to create a commit for each of them
+    coalesce_window = 0
 
     @classmethod
-    def setup(cls, storage_backend, location):
+    def setup(cls, storage_backend, location, object_cache_size=None,
+              coalesce_window=None, commit_graph_size=None):
         cls.storage = load_object(storage_backend)
         cls.storage.setup(location)
+        if object_cache_size is not None:
+            cls.object_cache = ObjectCache(object_cache_size)
+        if commit_graph_size is not None:
+            cls.commit_graph = CommitGraph(commit_graph_size)
+        if coalesce_window is not None:
+            cls.coalesce_window = coalesce_window
 
     @classmethod
     def init_backend(cls):
@@ -64,7 +84,7 @@ class Repoman(object):
         if cls.storage.repo_exists(repo_name):
             raise NameError()
         repoman = cls(author)
-        repoman._repo = cls.storage.init_bare(repo_name)
+        repoman._repo = cls._cached_repo(cls.storage.init_bare(repo_name))
         tree = Tree()
         commit = repoman._create_commit()
         commit.tree = tree.id
@@ -76,9 +96,21 @@ class Repoman(object):
     def open_repo(cls, repo_name, author=None):
         '''Opens an existing repository.'''
         repoman = cls(author)
-        repoman._repo = cls.storage.open(repo_name)
+        repoman._repo = cls._cached_repo(cls.storage.open(repo_name))
         return repoman
 
+    @classmethod
+    def _cached_repo(cls, repo):
+        if not isinstance(repo.object_store, CachedObjectStore):
+            repo.object_store = CachedObjectStore(repo.object_store,
+                                                  cls.object_cache)
+        return repo
+
+    @classmethod
+    def cache_stats(cls):
+        '''Returns the hit ratios of the object and ref caches.'''
+        return cls.object_cache.stats()
+
     @classmethod
     def repo_exists(cls, repo_name):
         '''Returns true iff a repository named repo_name can be opened.'''
@@ -101,6 +133,7 @@ class Repoman(object):
         self._time_zone = parse_timezone('+0000')[0]
         self.commit = sentinel
         self.tree = sentinel
+        self._refs = {}
 
     @property
     def refs(self):
@@ -113,7 +146,7 @@ class Repoman(object):
         commit in master.
         '''
         at_revision = at_revision or self._get_head()
-        self._repo.refs['refs/heads/%s' % branch_name] = at_revision
+        self._set_ref('refs/heads/%s' % branch_name, at_revision)
 
     def delete_branch(self, branch_name):
         '''Deletes an existing branch.
@@ -121,15 +154,17 @@ class Repoman(object):
         Only the reference to the branch is deleted, all commits trees and
         blobs are left untouched.
         '''
+        self._refs.clear()
         del self._repo.refs['refs/heads/%s' % branch_name]
 
     def has_branch(self, branch_name):
         '''Returns true iff the specified branch exists in this repo.'''
-        return 'refs/heads/%s' % branch_name in self._repo.refs
+        name = 'refs/heads/%s' % branch_name
+        return name in self._refs or name in self._repo.refs
 
     def get_branch(self, branch_name):
         '''Returns the branch with name branch_name'''
-        return self._repo.refs['refs/heads/%s' % branch_name]
+        return self._get_ref('refs/heads/%s' % branch_name)
 
     def save_file(self, file_path, contents, branch_name, commit_message=None):
         '''Saves a file into the repo and advances the specified branch head.
@@ -175,6 +210,10 @@ class Repoman(object):
                                      old_folder_path, new_folder_path,
                                      commit_message)
 
+    def commit_time(self, revision):
+        '''Returns the timestamp of the commit revision.'''
+        return self._repo.get_object(revision).commit_time
+
     def blob_for_branch(self, file_path, branch_name):
         '''Returns the blob with the contents of file_path.
 
@@ -250,7 +289,8 @@ class Repoman(object):
             return False
         else:
             # We need to merge and maybe deal with conflicts.
-            common_ancestor = self.get_branch_checkpoints(branch_name)[-1]
+            common_ancestor = self.commit_graph.merge_base(
+                self._repo.object_store, branch, head)
             merge_tree, conflicts = self._merge_branches(
                 common_ancestor, branch, head, take_mine=force)
             commit = self._create_commit()
@@ -361,6 +401,44 @@ class Repoman(object):
             list(b_blob_ids | b_tree_ids) + b_commit_ids)
         self.delete_branch(branch_name)
 
+    def collect_garbage(self):
+        '''Deletes the objects that can't be reached from any ref.
+
+        These are the objects of deleted branches and the commits replaced
+        when coalescing file operations. Objects are written before the ref
+        that points to them, so this must not run while the repo is being
+        modified. Returns the number of deleted objects.
+        '''
+        repo = self._repo
+        pending = []
+        for name in repo.refs.allkeys():
+            try:
+                pending.append(repo.refs[name])
+            except KeyError:  # Symbolic ref to a deleted branch
+                pass
+        reachable = set()
+        while pending:
+            sha = pending.pop()
+            if sha in reachable:
+                continue
+            reachable.add(sha)
+            obj = repo.get_object(sha)
+            if isinstance(obj, Commit):
+                pending.append(obj.tree)
+                pending.extend(obj.parents)
+            elif isinstance(obj, Tag):
+                pending.append(obj.object[1])
+            elif isinstance(obj, Tree):
+                for _, mode, item_sha in obj.iteritems():
+                    if S_ISDIR(mode):
+                        pending.append(item_sha)
+                    else:
+                        reachable.add(item_sha)
+        garbage = [sha for sha in repo.object_store if sha not in reachable]
+        if garbage:
+            repo.object_store.delete_objects(garbage)
+        return len(garbage)
+
     def add_tag(self, tag_name):
         commit = self._repo['refs/heads/master']
         tag = Tag()
@@ -371,7 +449,7 @@ class Repoman(object):
         tag.tag_time = int(time())
         tag.tag_timezone = self._time_zone
         self._update_store(tag)
-        self._repo.refs['refs/tags/%s' % tag_name] = tag.id
+        self._set_ref('refs/tags/%s' % tag_name, tag.id)
 
     def checkout_tag(self, tag_name, remove=False):
         if ('refs/tags/%s' % tag_name) not in self._repo.refs:
@@ -380,18 +458,10 @@ class Repoman(object):
         tag = self._repo[tag_ref]
         self._advance_branch('master', self._repo.get_object(tag.object[1]))
         if remove:
+            self._refs.clear()
             del self._repo.refs['refs/tags/%s' % tag_name]
 
     def _merge_branches(self, base, mine, other, take_mine=False):
-
-        def load_json(path, branch):
-            try:
-                blob = self.blob(path, branch)
-            except (KeyError, TypeError):
-                return {}
-            else:
-                return loads(blob.as_raw_string())
-
         merge_tree = Tree()
         base_tree, my_tree, other_tree = (self._get_tree(x)
                                           for x in (base, mine, other))
@@ -414,8 +484,16 @@ class Repoman(object):
             else:
                 path = change.new.path
             changes_by_path[path].append(change)
-        had_conflict = False
 
+        def sha_at(tree, path):
+            try:
+                return tree[path][1]
+            except KeyError:
+                return None
+
+        # Decide what to do with each path from the blob ids alone, so that
+        # only the blobs that really need merging are read
+        merges = []
         for path, changes in changes_by_path.items():
             if len(changes) == 2:
                 my_changes, other_changes = changes
@@ -423,48 +501,86 @@ class Repoman(object):
                     if other_changes.type in (CHANGE_RENAME, CHANGE_MODIFY):
                         merge_tree.add(other_changes.new.path,
                                        FILE_MODE, other_changes.new.sha)
-                    else:
-                        continue
+                    continue
                 elif other_changes.type == CHANGE_DELETE:
                     if my_changes.type in (CHANGE_RENAME, CHANGE_MODIFY):
                         merge_tree.add(my_changes.new.path,
                                        FILE_MODE, my_changes.new.sha)
-                    else:
-                        continue
+                    continue
+                shas = [sha_at(x, path)
+                        for x in (base_tree, my_tree, other_tree)]
+                base_sha, my_sha, other_sha = shas
+                # When dealing with renames, file contents are under the
+                # 'new' path. Note that the file will be finally stored
+                # under the name given by the last rename.
+                if other_changes.type == CHANGE_RENAME:
+                    other_sha = other_changes.new.sha
+                    path = other_changes.new.path
+                if my_changes.type == CHANGE_RENAME:
+                    my_sha = my_changes.new.sha
+                    path = my_changes.new.path
+                if take_mine:
+                    merges.append((path, None, [my_sha, other_sha, base_sha]))
+                    continue
+                # A side that didn't change the file takes the other side
+                if shas[1] == shas[2] or shas[2] == base_sha:
+                    merged_sha = shas[1]
+                elif shas[1] == base_sha:
+                    merged_sha = shas[2]
                 else:
-                    jsons = [load_json(path, x) for x in (base, mine, other)]
-                    base_json, my_json, other_json = jsons
-                    # When dealing with renames, file contents are under the
-                    # 'new' path. Note that the file will be finally stored
-                    # under the name given by the last rename.
-                    if other_changes.type == CHANGE_RENAME:
-                        other_json = load_json(other_changes.new.path, other)
-                        path = other_changes.new.path
-                    if my_changes.type == CHANGE_RENAME:
-                        my_json = load_json(my_changes.new.path, mine)
-                        path = my_changes.new.path
-                    if take_mine:
-                        merged_json = my_json or other_json or base_json
-                    else:
-                        merged_json, merge_conflict = merge_jsons(*jsons)
-                        if merge_conflict:
-                            conflicts[path] = merged_json
-                        had_conflict = had_conflict or merge_conflict
-                    merged_blob = Blob.from_string(
-                        dumps(merged_json, sort_keys=True, indent=4))
-                    self._update_store(merged_blob)
-                    merge_tree.add(path, FILE_MODE, merged_blob.id)
+                    merges.append((path, shas, shas[1:]))
+                    continue
+                if merged_sha is not None:
+                    merge_tree.add(path, FILE_MODE, merged_sha)
+                else:
+                    merges.append((path, None, [None]))
             else:
-                data = (load_json(path, mine) or load_json(path, other) or
-                        load_json(path, base))
-                blob = Blob.from_string(dumps(data, sort_keys=True, indent=4))
-                self._update_store(blob)
+                merges.append((path, None, [sha_at(x, path) for x in
+                                            (my_tree, other_tree, base_tree)]))
+
+        object_store = self._repo.object_store
+        if hasattr(object_store, 'prefetch'):
+            object_store.prefetch(chain(*[(shas or []) + candidates
+                                          for _, shas, candidates in merges]))
+        parsed = {}
+
+        def load_json(sha):
+            if sha is None:
+                return {}
+            if sha not in parsed:
+                parsed[sha] = loads(
+                    self._repo.get_object(sha).as_raw_string())
+            return parsed[sha]
+
+        had_conflict = False
+        blobs = []
+        for path, shas, candidates in merges:
+            if shas is None:
+                jsons = [load_json(sha) for sha in candidates]
+                merged_json = next((x for x in jsons if x), jsons[-1])
+            else:
+                merged_json, merge_conflict = merge_jsons(
+                    *[load_json(sha) for sha in shas])
+                if merge_conflict:
+                    conflicts[path] = merged_json
+                had_conflict = had_conflict or merge_conflict
+            # Keep the existing blob if the result is one of the versions
+            for sha in candidates:
+                if sha is not None and load_json(sha) == merged_json:
+                    merge_tree.add(path, FILE_MODE, sha)
+                    break
+            else:
+                blob = Blob.from_string(
+                    dumps(merged_json, sort_keys=True, indent=4))
+                blobs.append(blob)
                 merge_tree.add(path, FILE_MODE, blob.id)
-        self._update_store(merge_tree)
+        self._update_store(merge_tree, *blobs)
         return merge_tree, conflicts
 
     @retry_operation(retries=3)
     def _perform_file_operation(self, branch_name, operation, *args):
+        # Read the branch again in case it changed since it was looked up
+        self._refs.clear()
         if not self.has_branch(branch_name):
             self.create_branch(branch_name)
         parent_commit = self.get_branch(branch_name)
@@ -477,39 +593,33 @@ class Repoman(object):
             parent_commit, {file_path: contents}, commit_message)
 
     def _save_files(self, parent_commit, files, commit_message):
-        tree = self._get_tree(parent_commit)
+        tree = self._get_tree(parent_commit).copy()
         blobs = []
         for file_path, contents in files.items():
             blob = Blob.from_string(contents)
             tree.add(file_path, FILE_MODE, blob.id)
             blobs.append(blob)
-        commit = self._create_commit()
-        commit.parents = [parent_commit]
-        commit.tree = tree.id
-        commit.message = commit_message or 'Saving multiple files'
+        commit = self._create_file_commit(
+            parent_commit, tree, commit_message or 'Saving multiple files')
         self._update_store(commit, tree, *blobs)
         return commit
 
     def _delete_file(self, parent_commit, file_path, commit_message):
-        tree = self._get_tree(parent_commit)
+        tree = self._get_tree(parent_commit).copy()
         del tree[file_path]
-        commit = self._create_commit()
-        commit.parents = [parent_commit]
-        commit.tree = tree.id
-        commit.message = commit_message or 'Deleting %s' % file_path
+        commit = self._create_file_commit(
+            parent_commit, tree, commit_message or 'Deleting %s' % file_path)
         self._update_store(commit, tree)
         return commit
 
     def _rename_file(self, parent_commit, old_file_path, new_file_path,
                      commit_message):
-        tree = self._get_tree(parent_commit)
+        tree = self._get_tree(parent_commit).copy()
         tree[new_file_path] = tree[old_file_path]
         del tree[old_file_path]
-        commit = self._create_commit()
-        commit.parents = [parent_commit]
-        commit.tree = tree.id
-        commit.message = (commit_message or
-                          'Renaming %s to %s' % (old_file_path, new_file_path))
+        commit = self._create_file_commit(
+            parent_commit, tree, commit_message or
+            'Renaming %s to %s' % (old_file_path, new_file_path))
         self._update_store(commit, tree)
         return commit
 
@@ -519,18 +629,15 @@ class Repoman(object):
             old_folder_path += '/'
         if new_folder_path[-1] != '/':
             new_folder_path += '/'
-        tree = self._get_tree(parent_commit)
+        tree = self._get_tree(parent_commit).copy()
         for path in tree:
             if path.startswith(old_folder_path):
                 file_path = new_folder_path + path.split(old_folder_path, 1)[1]
                 tree[file_path] = tree[path]
                 del tree[path]
-        commit = self._create_commit()
-        commit.parents = [parent_commit]
-        commit.tree = tree.id
-        commit.message = (commit_message or
-                          'Renaming %s to %s' % (old_folder_path,
-                                                 new_folder_path))
+        commit = self._create_file_commit(
+            parent_commit, tree, commit_message or
+            'Renaming %s to %s' % (old_folder_path, new_folder_path))
         self._update_store(commit, tree)
         return commit
 
@@ -539,12 +646,32 @@ class Repoman(object):
         self._repo.object_store.add_objects(objects)
 
     def _advance_branch(self, branch_name, commit):
-        self._repo.refs['refs/heads/%s' % branch_name] = commit.id
+        self._set_ref('refs/heads/%s' % branch_name, commit.id)
+
+    def _get_ref(self, name):
+        counts = self.object_cache.counts
+        try:
+            sha = self._refs[name]
+        except KeyError:
+            counts['ref_misses'] += 1
+            sha = self._refs[name] = self._repo.refs[name]
+        else:
+            counts['ref_hits'] += 1
+        return sha
+
+    def _set_ref(self, name, sha):
+        # Symbolic refs like HEAD may point to the changed ref
+        self._refs.clear()
+        self._repo.refs[name] = sha
 
     def _get_branch_tree(self, branch_name):
         return self._get_tree(self.get_branch(branch_name))
 
     def _get_tree(self, revision):
+        '''Returns the tree of the commit revision.
+
+        The tree is shared with the object cache, use a copy to modify it.
+        '''
         repo = self._repo
         return repo.get_object(repo.get_object(revision).tree)
 
@@ -556,15 +683,37 @@ class Repoman(object):
         commit.encoding = self._encoding
         return commit
 
+    def _create_file_commit(self, parent_commit, tree, message):
+        '''Creates the commit of a file operation on top of parent_commit.
+
+        If parent_commit is an unpublished commit by the same author started
+        less than coalesce_window seconds ago, the new commit replaces it
+        instead. The replaced commit is left for collect_garbage.
+        '''
+        commit = self._create_commit()
+        commit.parents = [parent_commit]
+        commit.tree = tree.id
+        commit.message = message
+        if self.coalesce_window:
+            parent = self._repo.get_object(parent_commit)
+            head = self._get_head()
+            if (len(parent.parents) == 1 and
+                    parent.author == commit.author and
+                    parent.message != 'Resolve merge conflicts' and
+                    commit.commit_time - parent.author_time <
+                    self.coalesce_window and
+                    (head is None or
+                     not self._is_ancestor_commit(head, parent_commit))):
+                commit.parents = parent.parents
+                commit.author_time = parent.author_time
+        return commit
+
     def _get_head(self):
         try:
-            return self._repo.head()
+            return self._get_ref('HEAD')
         except KeyError:
             return None
 
     def _is_ancestor_commit(self, descendant, ancestor):
-        walker = self._repo.get_walker(include=descendant)
-        for entry in walker:
-            if entry.commit.id == ancestor:
-                return True
-        return False
+        return self.commit_graph.is_ancestor(
+            self._repo.object_store, descendant, ancestor)
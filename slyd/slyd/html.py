@@ -9,10 +9,11 @@ import re
 
 from six.moves.urllib_parse import urljoin
 
-from scrapely.htmlpage import HtmlTag, HtmlTagType, parse_html
+from scrapely.htmlpage import HtmlPage, HtmlTag, HtmlTagType, parse_html
+from slybot.baseurl import DOCTYPERE
 from slybot.utils import htmlpage_from_response
 from .splash.css_utils import process_css, wrap_url, unescape
-from .utils import serialize_tag, add_tagids
+from .utils import serialize_tag, _must_add_tagid, TAGID
 
 URI_ATTRIBUTES = ("action", "background", "cite", "classid", "codebase",
                   "data", "href", "longdesc", "profile", "src", "usemap")
@@ -29,9 +30,7 @@ def html4annotation(htmlpage, baseurl=None, proxy_resources=None):
 
     This adds tags, removes scripts and optionally adds a base url
     """
-    htmlpage = add_tagids(htmlpage)
-    cleaned_html = descriptify(htmlpage, baseurl, proxy=proxy_resources)
-    return cleaned_html
+    return rewrite_html(htmlpage, baseurl, proxy_resources, tagids=True)
 
 
 def extract_html(response):
@@ -43,11 +42,32 @@ def extract_html(response):
 def descriptify(doc, base=None, proxy=None):
     """Clean JavaScript in a html source string.
     """
-    parsed = parse_html(doc)
+    return rewrite_html(doc, base, proxy)
+
+
+def rewrite_html(doc, base=None, proxy=None, tagids=False, insert_base=False):
+    """Rewrite a html document in a single pass over its tokens.
+
+    Scripts and intrinsic events are removed and URIs are made absolute to
+    `base`, or proxied when `proxy` is set. If `tagids` is set tags are
+    numbered like `add_tagids` does and if `insert_base` is set a base tag
+    for `base` is inserted like `insert_base_url` does.
+    """
+    if isinstance(doc, HtmlPage):
+        doc, parsed = doc.body, doc.parsed_body
+    else:
+        parsed = parse_html(doc)
     newdoc = []
+    tagcount = 0
     inserted_comment = False
+    head_position = html_position = None
     for element in parsed:
         if isinstance(element, HtmlTag):
+            if tagids and _must_add_tagid(element):
+                element.attributes[TAGID] = str(tagcount)
+                tagcount += 1
+                # Same attribute order as if the numbered tag had been parsed
+                element.attributes = dict(element.attributes.items())
             if element.tag in BLOCKED_TAGNAMES:
                 # Asumes there are no void elements in BLOCKED_TAGNAMES
                 # http://www.w3.org/TR/html5/syntax.html#void-elements
@@ -80,6 +100,11 @@ def descriptify(doc, base=None, proxy=None):
                             elif base:
                                 element.attributes[key] = urljoin(base, val)
                 newdoc.append(serialize_tag(element))
+                if element.tag_type == HtmlTagType.OPEN_TAG:
+                    if element.tag == 'head':
+                        head_position = len(newdoc)
+                    elif element.tag == 'html':
+                        html_position = len(newdoc)
         else:
             text = doc[element.start:element.end]
             if inserted_comment and text.strip():
@@ -87,4 +112,16 @@ def descriptify(doc, base=None, proxy=None):
             else:
                 newdoc.append(text)
 
+    if insert_base:
+        # Existing base tags have been emptied, so a new one is always needed
+        basetag = '<base href="%s" />' % base
+        if head_position is not None:
+            newdoc.insert(head_position, basetag)
+        elif html_position is not None:
+            newdoc.insert(html_position, "\n<head>%s</head>\n" % basetag)
+        else:
+            cleaned = ''.join(newdoc)
+            doctype_match = DOCTYPERE.search(cleaned)
+            insertpos = doctype_match.end() if doctype_match else 0
+            return cleaned[:insertpos] + basetag + cleaned[insertpos:]
     return ''.join(newdoc)
@@ -7,8 +7,9 @@ from twisted.web.server import NOT_DONE_YET
 from .errors import BaseError, BaseHTTPError, BadRequest
 from .projecttemplates import templates
 from .resource import SlydJsonResource, SlydJsonErrorPage
+from .utils.cache import resource_cache
 from .utils.copy import FileSystemSpiderCopier
-from .utils.download import FileSystemProjectArchiver
+from .utils.download import FileSystemProjectArchiver, ArchiveStreamer
 
 
 # stick to alphanum . and _. Do not allow only .'s (so safe for FS path)
@@ -176,9 +177,12 @@ class ProjectsManager(object):
         self.validate_project_name(to_name)
         os.rename(self.project_filename(from_name),
                   self.project_filename(to_name))
+        resource_cache.invalidate(self.project_filename(from_name))
+        resource_cache.invalidate(self.project_filename(to_name))
 
     def remove_project(self, name):
         shutil.rmtree(self.project_filename(name))
+        resource_cache.invalidate(self.project_filename(name))
 
     def project_filename(self, name):
         return join(self.projectsdir, name)
@@ -191,8 +195,11 @@ class ProjectsManager(object):
         copier = FileSystemSpiderCopier(source, destination, self.projectsdir)
         return json.dumps(copier.copy(spiders, items))
 
-    def download_project(self, name, spiders=None, version=None):
+    def download_project(self, name, spiders=None, version=None,
+                         stream=False):
         archiver = FileSystemProjectArchiver(name, base_dir=self.projectsdir)
+        if stream:
+            return ArchiveStreamer(archiver, spiders)
         return archiver.archive(spiders).read()
 
     def _render_file(self, request, request_data, body):
@@ -200,5 +207,8 @@ class ProjectsManager(object):
         request.setHeader('Content-Type', 'application/zip')
         request.setHeader('Content-Disposition', 'attachment; '
                           'filename="%s.zip"' % name)
+        if isinstance(body, ArchiveStreamer):
+            body.stream(request)
+            return NOT_DONE_YET
         request.setHeader('Content-Length', len(body))
         return body
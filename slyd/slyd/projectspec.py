@@ -5,12 +5,14 @@ import slyd.errors
 
 from os.path import join, splitext
 from scrapy.http import HtmlResponse
+from scrapy.settings import Settings
 from twisted.web.resource import NoResource, ForbiddenResource
 from twisted.web.server import NOT_DONE_YET
 from jsonschema.exceptions import ValidationError
 from .resource import SlydJsonResource
 from .html import html4annotation
 from .errors import BaseHTTPError
+from .utils.cache import resource_cache
 from .utils.projects import allowed_file_name, ProjectModifier
 from .utils.extraction import extract_items
 
@@ -30,6 +32,7 @@ class ProjectSpec(object):
     resources = ('project', 'items', 'extractors')
     base_dir = '.'
     plugins = []
+    settings = Settings()
 
     @classmethod
     def setup(cls, location, **kwargs):
@@ -67,6 +70,34 @@ class ProjectSpec(object):
         spider_spec['templates'] = templates
         return spider_spec
 
+    def spider_version(self, spider):
+        """Cheap token that changes whenever the spider, its templates, items
+        or extractors are saved.
+
+        It is built from the modification time and size of their files,
+        without reading them.
+        """
+        paths = [self._rfilename('items'), self._rfilename('extractors'),
+                 self._rfilename('spiders', spider)]
+        templates_dir = join(self.project_dir, 'spiders', spider)
+        try:
+            paths.extend(join(templates_dir, fname)
+                         for fname in sorted(os.listdir(templates_dir)))
+        except OSError as ex:
+            if ex.errno != errno.ENOENT:
+                raise
+        version = []
+        for path in paths:
+            try:
+                stat = os.stat(path)
+            except OSError as ex:
+                if ex.errno != errno.ENOENT:
+                    raise
+                version.append((path, None))
+            else:
+                version.append((path, stat.st_mtime, stat.st_size))
+        return tuple(version)
+
     def spider_json(self, name):
         """Loads the spider spec for the given spider name."""
         try:
@@ -104,9 +135,13 @@ class ProjectSpec(object):
         dirname = self._rdirname('spiders', from_name)
         if os.path.isdir(dirname):
             os.rename(dirname, self._rdirname('spiders', to_name))
+        for name in (from_name, to_name):
+            resource_cache.invalidate(self._rfilename('spiders', name))
+            resource_cache.invalidate(join(self.project_dir, 'spiders', name))
 
     def remove_spider(self, name):
         os.remove(self._rfilename('spiders', name))
+        resource_cache.invalidate(self._rfilename('spiders', name))
 
     def rename_template(self, spider_name, from_name, to_name):
         template = self.resource('spiders', spider_name, from_name)
@@ -122,6 +157,8 @@ class ProjectSpec(object):
             os.remove(self._rfilename('spiders', spider_name, name))
         except OSError:
             pass
+        resource_cache.invalidate(
+            self._rfilename('spiders', spider_name, name))
         spider = self.spider_json(spider_name)
         try:
             spider['template_names'].remove(name)
@@ -150,11 +187,11 @@ class ProjectSpec(object):
 
     def extract_data(self, spider_name, url_info, request):
         urls = self._process_extraction_urls(url_info)
-        extract_items(self, spider_name, urls, request)
+        extract_items(self, spider_name, urls, request, self.settings)
 
     def resource(self, *resources):
         with self._rfile(resources) as f:
-            return json.load(f)
+            return resource_cache.load(f)
 
     def writejson(self, outf, *resources):
         """Write json for the resource specified
@@ -179,6 +216,12 @@ class ProjectSpec(object):
             pass
         with self._rfile(*resources, mode='wb') as ouf:
             json.dump(obj, ouf, sort_keys=True, indent=4)
+        resource_cache.invalidate(ouf.name)
+
+    def savejsons(self, resources):
+        """Save several (obj, resources) pairs together"""
+        for obj, path in resources:
+            self.savejson(obj, path)
 
     def json(self, out):
         """Write spec as json to the file-like object
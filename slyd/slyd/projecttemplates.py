@@ -8,7 +8,10 @@ _SETTINGS_TEMPLATE = """\
 import os
 
 SPIDER_MANAGER_CLASS = 'slybot.spidermanager.ZipfileSlybotSpiderManager'
-EXTENSIONS = {'slybot.closespider.SlybotCloseSpider': 1}
+EXTENSIONS = {
+    'slybot.closespider.SlybotCloseSpider': 1,
+    'slybot.monitor.SlybotMonitor': 2
+}
 ITEM_PIPELINES = ['slybot.dupefilter.DupeFilterPipeline']
 SPIDER_MIDDLEWARES = {'slybot.spiderlets.SpiderletsMiddleware': 999}  # as close as possible to spider output
 DOWNLOADER_MIDDLEWARES = {
@@ -21,5 +21,6 @@ def download(manager, spider_id=None, attributes=None):
         'args': [project_id, spider_ids]
     }
 
-    file_content = manager.pm.download_project(project_id, spider_ids)
+    file_content = manager.pm.download_project(project_id, spider_ids,
+                                               stream=True)
     return ProjectsManagerFileResponse(file_content, command, manager.pm)
@@ -10,6 +10,14 @@ EXTENSIONS = {
 
 LOG_LEVEL = 'DEBUG'
 
+# maximum number of pages each user can fetch through the bot at once
+BOT_CONCURRENT_FETCHES_PER_USER = 4
+
+# limits for the pages fetched to test a spider through the extract endpoint
+EXTRACTION_CONCURRENT_REQUESTS = 8
+EXTRACTION_CONCURRENT_REQUESTS_PER_HOST = 2
+EXTRACTION_DOWNLOAD_TIMEOUT = 30
+
 # location of slybot projects - assumes a subdir per project
 DATA_DIR = join(dirname(dirname(__file__)), 'data')
 SPEC_DATA_DIR = join(DATA_DIR, 'projects')
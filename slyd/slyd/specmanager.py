@@ -16,6 +16,7 @@ class SpecManager(object):
 
         self.spec_class.setup(**factory_settings['PARAMS'])
         self.spec_class.plugins = plugins
+        self.spec_class.settings = settings
         self.manager_class = load_object(factory_settings['PROJECT_MANAGER'])
         self.manager_class.setup(**factory_settings['PARAMS'])
         self.capabilities = factory_settings.get('CAPABILITIES', {})
@@ -17,6 +17,7 @@ from jsonschema.exceptions import ValidationError
 
 from splash.browser_tab import JsError
 
+from slyd.utils.cache import copy_json
 from slyd.utils.projects import ProjectModifier
 from .utils import open_tab, extract_data, BaseWSError, BadRequest, NotFound
 
@@ -180,6 +181,8 @@ def log_event(data, socket):
 
 class ProjectData(ProjectModifier):
     errors = slyd.splash.utils
+    # Resources verified by save_data while saving a batch
+    _batch = None
 
     def save_spider(self, data, socket):
         spider, meta = data.get('spider'), data.get('_meta')
@@ -216,6 +219,41 @@ class ProjectData(ProjectModifier):
         items, meta = data.get('items'), data.pop('_meta', None)
         return self.save_data(['items'], data=items, socket=socket, meta=meta)
 
+    def save_batch(self, data, socket):
+        """Save several resources of a spider in a single write.
+
+        Each resource is a message of one of the other save types. They are
+        all verified before any of them is written, and the spider is only
+        rebuilt once.
+        """
+        resources, meta = data.get('resources'), data.get('_meta')
+        if not resources or meta is None:
+            raise BadRequest('No data provided')
+        self._batch = []
+        try:
+            saved = []
+            for resource in resources:
+                option = resource.get('type', '')
+                if option not in ('spider', 'template', 'extractors', 'items'):
+                    raise BadRequest('Unknown option "%s" received' % option)
+                resource['_meta'] = dict(meta, type=option)
+                command = getattr(self, 'save_%s' % option)
+                saved.append(command(resource, socket))
+            batch = self._batch
+        finally:
+            self._batch = None
+        spec = socket.spec_manager.project_spec(meta['project'],
+                                                socket.user.auth)
+        spec.savejsons([(obj, path) for path, _, obj in batch])
+        updates, templates = {}, []
+        for _, type, obj in batch:
+            if type == 'template':
+                templates.append(obj)
+            else:
+                updates[type] = obj
+        socket.update_spider(meta, templates=templates, **updates)
+        return saved
+
     def save_data(self, path, type=None, data=None, socket=None, meta=None):
         if type is None:
             type = path[0]
@@ -233,10 +271,14 @@ class ProjectData(ProjectModifier):
         except BaseWSError as ex:
             print(('Other: %s' % ex))
             raise ex
-        else:
-            spec.savejson(obj, [s.encode('utf-8') for s in path])
-            socket.update_spider(meta, **{type: obj})
+        path = [s.encode('utf-8') for s in path]
+        if self._batch is not None:
+            # The caller may still change obj before the batch is written
+            self._batch.append((path, type, copy_json(obj)))
             return obj
+        spec.savejson(obj, path)
+        socket.update_spider(meta, **{type: obj})
+        return obj
 
     def _decode(self, html, default=None):
         if default is None:
@@ -353,7 +353,7 @@ class FerryServerProtocol(WebSocketServerProtocol):
                                                    extractors)
 
     def update_spider(self, meta, spider=None, template=None, items=None,
-                      extractors=None):
+                      extractors=None, templates=None):
         if not hasattr(self.factory[self], 'spiderspec'):
             return self.open_spider(meta)
         spec = self.factory[self].spiderspec
@@ -365,13 +365,17 @@ class FerryServerProtocol(WebSocketServerProtocol):
             spider['templates'] = spec.spider['templates']
         else:
             spider = spec.spider
+        templates = list(templates or [])
         if template:
+            templates.append(template)
+        for template in templates:
             for idx, tmpl in enumerate(spider['templates']):
                 if template['original_body'] == tmpl['original_body']:
                     spider['templates'][idx] = template
                     break
             else:
                 spider['templates'].append(template)
+        if templates:
             spider['template_names'] = [t['name'] for t in spider['templates']]
         self.factory[self].spider = IblSpider(meta['spider'], spider, items,
                                               extractors, self.settings)
@@ -1,13 +1,12 @@
 from scrapy.http import HtmlResponse, Request
 from scrapy.item import DictItem
 
-from slyd.html import descriptify
+from slyd.html import rewrite_html
 from slyd.errors import BaseHTTPError
-from slybot.baseurl import insert_base_url
 
 
 def clean(html, url):
-    return insert_base_url(descriptify(html, url), url)
+    return rewrite_html(html, url, insert_base=True)
 
 
 def open_tab(func):
@@ -0,0 +1,67 @@
+"""
+Process wide cache of the parsed JSON resources of filesystem projects
+"""
+from __future__ import absolute_import
+import json
+import os
+
+from collections import OrderedDict
+
+
+def copy_json(obj):
+    """Copy the containers of a parsed JSON document.
+
+    Strings and numbers are immutable so they are shared with `obj`.
+    """
+    if isinstance(obj, dict):
+        return {key: copy_json(value) for key, value in obj.items()}
+    if isinstance(obj, list):
+        return [copy_json(value) for value in obj]
+    return obj
+
+
+class ResourceCache(object):
+    """Parsed resources keyed by path.
+
+    A cached resource is reused while the modification time and size of its
+    file don't change. Writers should also call `invalidate` as a file can
+    be rewritten with the same size within the resolution of its mtime.
+    Callers get a copy of the cached document, which they are free to
+    modify.
+    """
+    max_entries = 512
+
+    def __init__(self):
+        self._resources = OrderedDict()
+
+    def load(self, f):
+        """Return the resource parsed from the open file `f`"""
+        path = os.path.abspath(f.name)
+        stat = os.fstat(f.fileno())
+        version = (stat.st_mtime, stat.st_size)
+        try:
+            cached_version, obj = self._resources.pop(path)
+        except KeyError:
+            cached_version = obj = None
+        if cached_version != version:
+            obj = json.load(f)
+        self._resources[path] = (version, obj)
+        while len(self._resources) > self.max_entries:
+            self._resources.popitem(last=False)
+        return copy_json(obj)
+
+    def invalidate(self, path):
+        """Forget the resource at `path`, or every resource below it if it
+        is a directory"""
+        path = os.path.abspath(path)
+        prefix = os.path.join(path, '')
+        for cached_path in list(self._resources):
+            if cached_path == path or cached_path.startswith(prefix):
+                del self._resources[cached_path]
+
+    def clear(self):
+        self._resources.clear()
+
+
+# Shared by every filesystem ProjectSpec
+resource_cache = ResourceCache()
@@ -3,6 +3,8 @@ import os
 import json
 import six
 
+from .cache import resource_cache
+
 
 class CopyError(Exception):
     pass
@@ -245,6 +247,7 @@ class FileSystemSpiderCopier(SpiderCopier):
             file_path = os.path.join(self.base_dir, location, filename)
             with open(file_path, 'w') as f:
                 f.write(data)
+            resource_cache.invalidate(file_path)
 
 
 class GitSpiderCopier(SpiderCopier):
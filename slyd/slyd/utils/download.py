@@ -1,12 +1,21 @@
 from __future__ import absolute_import
+import hashlib
 import itertools
 import json
 import os
+import tempfile
 import zipfile
 
 from collections import defaultdict
 from six import StringIO
 from datetime import datetime
+from threading import Lock
+
+from twisted.internet import reactor
+from twisted.internet.threads import blockingCallFromThread, deferToThread
+from twisted.python import log
+from twisted.python.failure import Failure
+from twisted.protocols.basic import FileSender
 
 from slyd.projecttemplates import templates
 from slybot.plugins.scrapely_annotations.builder import Annotations
@@ -45,12 +54,21 @@ class ProjectArchiver(object):
         Zip the contents or a subset of the contents in this project together
         """
         zbuff = StringIO()
-        self._archive = zipfile.ZipFile(zbuff, "w", zipfile.ZIP_DEFLATED)
-        self._add_files(spiders)
-        self._archive.close()
+        self.write_archive(zbuff, spiders)
         zbuff.seek(0)
         return zbuff
 
+    def write_archive(self, out, spiders=None):
+        """
+        Write the zip archive to the file object `out`.
+
+        Each file is read, compressed and written before the next one is read
+        so `out` only needs to support `write`, `tell` and `flush`.
+        """
+        self._archive = zipfile.ZipFile(out, "w", zipfile.ZIP_DEFLATED)
+        self._add_files(spiders)
+        self._archive.close()
+
     def _add_files(self, spiders):
         """
         Add all selected spiders and other files to the project
@@ -223,6 +241,228 @@ class ProjectArchiver(object):
         raise NotImplementedError
 
 
+class ArchiveStream(object):
+    """
+    Write only file object that passes the data written to it to `write` in
+    chunks of about `chunk_size` bytes. The last chunk is passed on when the
+    stream is closed.
+    """
+    chunk_size = 64 * 1024
+
+    def __init__(self, write):
+        self._write = write
+        self._chunks = []
+        self._buffered = 0
+        self._position = 0
+
+    def write(self, data):
+        self._chunks.append(data)
+        self._buffered += len(data)
+        self._position += len(data)
+        if self._buffered >= self.chunk_size:
+            self._send()
+
+    def tell(self):
+        return self._position
+
+    def flush(self):
+        # zipfile flushes after every file, data is passed on in chunks instead
+        pass
+
+    def close(self):
+        self._send()
+
+    def _send(self):
+        if self._chunks:
+            data = ''.join(self._chunks)
+            self._chunks, self._buffered = [], 0
+            self._write(data)
+
+
+class ArchiveCache(object):
+    """
+    Archives stored as files in `directory`.
+
+    An archive never changes once built for a given key, so keys must
+    include everything the archive depends on. When the archives take more
+    than `max_size` bytes the least recently used ones are deleted.
+    """
+    max_size = 512 * 1024 * 1024
+
+    def __init__(self, directory, max_size=None):
+        self.directory = directory
+        if max_size is not None:
+            self.max_size = max_size
+        try:
+            os.makedirs(directory)
+        except OSError:
+            if not os.path.isdir(directory):
+                raise
+        self._lock = Lock()
+
+    @staticmethod
+    def key(*parts):
+        return hashlib.sha1(json.dumps(parts, sort_keys=True)).hexdigest()
+
+    def get(self, key):
+        """
+        Open file of the archive for `key`, or None if it is not cached.
+
+        The archive is opened here so it can still be read if it is evicted
+        before the caller is done with it.
+        """
+        path = self._path(key)
+        try:
+            archive = open(path, 'rb')
+        except IOError:
+            return None
+        try:
+            os.utime(path, None)  # Mark as recently used
+        except OSError:
+            pass
+        return archive
+
+    def writer(self, key):
+        """
+        File object to build the archive for `key` in. It is only added to
+        the cache when it is committed.
+        """
+        fd, path = tempfile.mkstemp(suffix='.tmp', dir=self.directory)
+        return CachedArchiveWriter(self, key, os.fdopen(fd, 'wb'), path)
+
+    def add(self, key, data):
+        writer = self.writer(key)
+        writer.write(data)
+        writer.commit()
+
+    def _path(self, key):
+        return os.path.join(self.directory, key + '.zip')
+
+    def _commit(self, key, temp_path):
+        os.rename(temp_path, self._path(key))
+        self._evict()
+
+    def _evict(self):
+        with self._lock:
+            archives = []
+            for filename in os.listdir(self.directory):
+                if not filename.endswith('.zip'):
+                    continue
+                path = os.path.join(self.directory, filename)
+                try:
+                    stat = os.stat(path)
+                except OSError:
+                    continue
+                archives.append((stat.st_mtime, stat.st_size, path))
+            size = sum(archive[1] for archive in archives)
+            for _, archive_size, path in sorted(archives):
+                if size <= self.max_size:
+                    break
+                try:
+                    os.remove(path)
+                except OSError:
+                    pass
+                size -= archive_size
+
+
+class CachedArchiveWriter(object):
+
+    def __init__(self, cache, key, fileobj, path):
+        self.cache = cache
+        self.key = key
+        self._file = fileobj
+        self._path = path
+
+    def write(self, data):
+        self._file.write(data)
+
+    def commit(self):
+        self._file.close()
+        self.cache._commit(self.key, self._path)
+
+    def discard(self):
+        self._file.close()
+        try:
+            os.remove(self._path)
+        except OSError:
+            pass
+
+
+class ArchiveStreamer(object):
+    """
+    Stream the archive of a project to a request while it is being built.
+
+    If a `cache` is given, the archive is sent from it when it has already
+    been built for `key`, and added to it otherwise. `last_modified` and
+    `etag` identify the revision of the archive for the response headers.
+    """
+
+    def __init__(self, archiver, spiders=None, cache=None, key=None,
+                 last_modified=None, etag=None):
+        self.archiver = archiver
+        self.spiders = spiders
+        self.cache = cache
+        self.key = key
+        self.last_modified = last_modified
+        self.etag = etag
+
+    def stream(self, request):
+        """
+        Write the archive to `request`, which is finished once the archive
+        is complete. Archives that aren't cached are built in a thread, which
+        stops if the client disconnects.
+        """
+        finished = []
+        request.notifyFinish().addBoth(finished.append)
+        cached = None
+        if self.cache is not None:
+            archive = self.cache.get(self.key)
+            if archive is not None:
+                return self._send_file(request, archive, finished)
+            cached = self.cache.writer(self.key)
+
+        def write(data):
+            if finished:
+                raise IOError('Connection lost while streaming the archive')
+            if cached is not None:
+                cached.write(data)
+            blockingCallFromThread(reactor, request.write, data)
+
+        def done(result):
+            if isinstance(result, Failure) and cached is not None:
+                cached.discard()
+            if not finished:
+                if isinstance(result, Failure):
+                    log.err(result, 'Failed to stream project archive')
+                    request.transport.loseConnection()
+                else:
+                    request.finish()
+
+        def build():
+            out = ArchiveStream(write)
+            self.archiver.write_archive(out, self.spiders)
+            out.close()
+            if cached is not None:
+                cached.commit()
+
+        d = deferToThread(build)
+        d.addBoth(done)
+        return d
+
+    def _send_file(self, request, archive, finished):
+        request.setHeader('Content-Length',
+                          str(os.fstat(archive.fileno()).st_size))
+
+        def done(result):
+            archive.close()
+            if not finished:
+                request.finish()
+
+        d = FileSender().beginFileTransfer(archive, request)
+        d.addBoth(done)
+        return d
+
+
 class FileSystemProjectArchiver(ProjectArchiver):
     def __init__(self, project, version=None, required_files=None,
                  base_dir='.'):
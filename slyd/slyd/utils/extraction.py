@@ -1,9 +1,11 @@
 import json
 import traceback
 
-from twisted.internet.defer import inlineCallbacks
+from collections import defaultdict
+from six.moves.urllib_parse import urlparse
+from twisted.internet.defer import (inlineCallbacks, DeferredList,
+                                    DeferredSemaphore)
 from twisted.web.client import getPage
-from twisted.web.error import Error
 
 from scrapy.item import DictItem
 from scrapy.settings import Settings
@@ -13,29 +15,34 @@ from slybot.spider import IblSpider
 from ..errors import BadRequest, BaseError
 
 
+class ExtractionFetcher(object):
+    """Fetch pages limiting the number of concurrent requests overall and
+    to each host"""
+
+    def __init__(self, settings):
+        self.timeout = settings.getint('EXTRACTION_DOWNLOAD_TIMEOUT', 30)
+        self.slots = DeferredSemaphore(
+            settings.getint('EXTRACTION_CONCURRENT_REQUESTS', 8))
+        per_host = settings.getint('EXTRACTION_CONCURRENT_REQUESTS_PER_HOST',
+                                   2)
+        self.host_slots = defaultdict(lambda: DeferredSemaphore(per_host))
+
+    def fetch(self, url):
+        # Wait for the host before taking one of the shared slots
+        host_slot = self.host_slots[urlparse(url).netloc]
+        return host_slot.run(self.slots.run, getPage, url,
+                             timeout=self.timeout)
+
+
 @inlineCallbacks
-def extract_items(spec, spider_name, urls, request):
+def extract_items(spec, spider_name, urls, request, settings=None):
+    """Fetch `urls` and write the items extracted from them by the spider.
+
+    Pages are fetched concurrently and the result for each one is written
+    as soon as it is extracted.
+    """
     try:
         spider = load_spider(spec, spider_name)
-        items = []
-        for url in urls:
-            if isinstance(url, unicode):
-                url = url.encode('utf-8')
-            try:
-                body = yield getPage(url)
-                responses = spec._process_extraction_response(url, body)
-            except (AssertionError, Error):
-                traceback.print_exc()
-            else:
-                for key, resp in responses:
-                    item = {'key': key, 'items': None, 'templates': None}
-                    extracted_items = [dict(x) for x in spider.parse(resp)
-                                       if isinstance(x, DictItem)]
-                    if extracted_items:
-                        item['items'] = extracted_items
-                        item['templates'] = [i['_template']
-                                             for i in extracted_items]
-                    items.append(item)
     except BaseError as e:
         request.setResponseCode(e.status)
         request.write(json.dumps({
@@ -48,14 +55,57 @@ def extract_items(spec, spider_name, urls, request):
             'error': 'An unexpected error has occurred'
         }))
     else:
-        request.write(json.dumps({
-            'status': 'ok',
-            'subitems': items
-        }))
+        fetcher = ExtractionFetcher(settings or Settings())
+        writer = _SubitemWriter(request)
+        yield DeferredList([_extract_url(spec, spider, fetcher, url, writer)
+                            for url in urls])
+        writer.close()
     if not request.finished:
         request.finish()
 
 
+class _SubitemWriter(object):
+    """Stream `{"status": "ok", "subitems": [...]}` one subitem at a time"""
+
+    def __init__(self, request):
+        self.request = request
+        self.separator = ''
+        request.write('{"status": "ok", "subitems": [')
+
+    def write(self, subitem):
+        self.request.write(self.separator + json.dumps(subitem))
+        self.separator = ', '
+
+    def close(self):
+        self.request.write(']}')
+
+
+@inlineCallbacks
+def _extract_url(spec, spider, fetcher, url, writer):
+    if isinstance(url, unicode):
+        url = url.encode('utf-8')
+    try:
+        body = yield fetcher.fetch(url)
+        responses = spec._process_extraction_response(url, body)
+        subitems = [_extract_response(spider, key, resp)
+                    for key, resp in responses]
+    except Exception:
+        traceback.print_exc()
+    else:
+        for subitem in subitems:
+            writer.write(subitem)
+
+
+def _extract_response(spider, key, response):
+    subitem = {'key': key, 'items': None, 'templates': None}
+    extracted_items = [dict(x) for x in spider.parse(response)
+                       if isinstance(x, DictItem)]
+    if extracted_items:
+        subitem['items'] = extracted_items
+        subitem['templates'] = [i['_template'] for i in extracted_items]
+    return subitem
+
+
 def load_spider(spec, spider_name):
     try:
         spider = spec.spider_with_templates(spider_name)
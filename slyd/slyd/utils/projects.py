@@ -3,11 +3,13 @@ import re
 
 from collections import OrderedDict as ODict
 
-from slybot.validation.schema import get_schema_validator
+from slybot.validation.schema import IncrementalValidator
 
 from slyd.utils import short_guid
 # stick to alphanum . and _. Do not allow only .'s (so safe for FS path)
 _INVALID_FILE_RE = re.compile('[^A-Za-z0-9._\-~]|^\.*$')
+# Resources saved again without changes are not validated again
+_validator = IncrementalValidator()
 
 
 def allowed_file_name(name):
@@ -64,7 +66,8 @@ class ProjectModifier:
                     templ = project_spec.template_json(path[1], path[2])
                     obj['original_body'] = templ.get('original_body', '')
                 obj = add_plugin_data(obj, project_spec.plugins)
-        get_schema_validator(resource).validate(obj)
+        _validator.validate(resource, obj, (project_spec.project_name,
+                                            project_spec.user) + tuple(path))
         return obj
 
     def handle_spider_command(self, project_spec, command_spec):
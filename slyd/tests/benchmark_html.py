@@ -0,0 +1,52 @@
+"""
+Benchmark the conversion of large pages for the annotation UI
+
+Compares the single pass `rewrite_html` with parsing and serializing the
+page once for each of `add_tagids`, `descriptify` and `insert_base_url`.
+
+Run from the slyd directory with:
+
+    python -m tests.benchmark_html [repetitions]
+"""
+import sys
+import timeit
+
+from os.path import join
+
+from slybot.baseurl import insert_base_url
+from slyd.html import rewrite_html, descriptify
+from slyd.utils import add_tagids
+from .settings import RESOURCE_DIR
+
+URL = 'http://www.pinterest.com/pin/339740365610932893/'
+
+
+def multipass(html, tagids=False, insert_base=False):
+    if tagids:
+        html = add_tagids(html)
+    html = descriptify(html, URL, proxy=True)
+    if insert_base:
+        html = insert_base_url(html, URL)
+    return html
+
+
+def main(repetitions=5):
+    with open(join(RESOURCE_DIR, 'docroot', 'pin1.html')) as f:
+        page = f.read().decode('utf-8')
+    for copies in (1, 10):
+        html = page * copies
+        for name, options in (('html4annotation', {'tagids': True}),
+                              ('clean', {'insert_base': True})):
+            assert (rewrite_html(html, URL, True, **options) ==
+                    multipass(html, **options))
+            old = min(timeit.repeat(lambda: multipass(html, **options),
+                                    number=1, repeat=repetitions))
+            new = min(timeit.repeat(
+                lambda: rewrite_html(html, URL, True, **options),
+                number=1, repeat=repetitions))
+            print('%-16s %5dKB  multipass %.3fs  single pass %.3fs  (%.1fx)'
+                  % (name, len(html) // 1024, old, new, old / new))
+
+
+if __name__ == '__main__':
+    main(*[int(arg) for arg in sys.argv[1:]])
@@ -0,0 +1,81 @@
+"""
+Benchmark the merge of templates with thousands of annotations
+
+Each scenario adds an annotation at the top of the list in one branch and
+changes others further down in the other branch. The merge is compared with
+merging the items at the same positions, as merge_lists used to do.
+
+Run from the slyd directory with:
+
+    python -m tests.benchmark_jsondiff [annotations]
+"""
+import sys
+import time
+
+from slyd.gitstorage.jsondiff import (merge_jsons, merge_lists,
+                                      _merge_positional, Conflict)
+
+
+def template(annotations):
+    return {
+        'name': 'benchmark',
+        'plugins': {
+            'annotations-plugin': {
+                'extracts': [{
+                    'annotations': {'content': 'field%d' % i},
+                    'id': 'annotation-%d' % i,
+                    'required': [],
+                    'tagid': i,
+                } for i in range(annotations)]
+            }
+        },
+        'template_names': ['template-%d' % i for i in range(annotations)],
+    }
+
+
+def branches(annotations):
+    base = template(annotations)
+    mine, other = template(annotations), template(annotations)
+    mine['plugins']['annotations-plugin']['extracts'].insert(
+        0, {'annotations': {'content': 'new'}, 'id': 'new', 'tagid': -1})
+    mine['template_names'].insert(0, 'template-new')
+    for i in range(annotations // 2, annotations, 100):
+        extract = other['plugins']['annotations-plugin']['extracts'][i]
+        extract['annotations']['content'] = 'changed'
+        other['template_names'][i] = 'renamed-%d' % i
+    return base, mine, other
+
+
+def timed(func, *args):
+    start = time.time()
+    result = func(*args)
+    return result, time.time() - start
+
+
+def main(annotations=5000):
+    base, mine, other = branches(annotations)
+    merged, seconds = timed(merge_jsons, base, mine, other)
+    print('merge_jsons of %d annotations: %.3fs, conflict: %s'
+          % (annotations, seconds, merged[1]))
+    for path in (('plugins', 'annotations-plugin', 'extracts'),
+                 ('template_names',)):
+        lists = []
+        for json in (base, mine, other):
+            for key in path:
+                json = json[key]
+            lists.append(json)
+        expected = list(lists[1])
+        for i, item in enumerate(lists[2]):
+            if item != lists[0][i]:
+                expected[i + 1] = item
+        for name, merge in (('diff3', merge_lists),
+                            ('positional', _merge_positional)):
+            result, seconds = timed(merge, *lists)
+            conflicts = sum(isinstance(i, Conflict) for i in result)
+            print('  %-45s %-10s %.3fs  conflicts: %-5d both changes kept: %s'
+                  % ('/'.join(path), name, seconds, conflicts,
+                     result == expected))
+
+
+if __name__ == '__main__':
+    main(*[int(arg) for arg in sys.argv[1:]])
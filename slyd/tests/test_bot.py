@@ -1,13 +1,17 @@
 import json
+import os
 from os.path import join
 from twisted.trial import unittest
 from twisted.internet.defer import inlineCallbacks
+from twisted.internet.task import deferLater
 from twisted.web.server import Site
 from twisted.web.static import File
 from twisted.internet import reactor
+from twisted.internet.error import ConnectionDone
+from twisted.python.failure import Failure
 from slyd.bot import create_bot_resource
-from .utils import TestSite, create_spec_manager
-from .settings import RESOURCE_DIR
+from .utils import TestSite, create_spec_manager, _SlydDummyRequest
+from .settings import RESOURCE_DIR, SPEC_DATA_DIR
 
 
 class BotTest(unittest.TestCase):
@@ -59,6 +63,49 @@ class BotTest(unittest.TestCase):
         # check links
         self.assertIn('links', value)
 
+        # the spider is reused while its specs don't change
+        cached = dict(self.bot_resource._spiders)
+        self.assertEqual(len(cached), 1)
+        result = yield self._fetch(test_url, spider='pinterest.com')
+        value = json.loads(result.value())
+        self.assertEqual(value['items'][0]['name'][0], u'Luheca Designs')
+        self.assertEqual(self.bot_resource._spiders, cached)
+
+        # and created again once one of its templates is saved
+        template = join(SPEC_DATA_DIR, 'test', 'spiders', 'pinterest.com',
+                        'template.json')
+        stat = os.stat(template)
+        os.utime(template, (stat.st_atime, stat.st_mtime + 1))
+        try:
+            result = yield self._fetch(test_url, spider='pinterest.com')
+        finally:
+            os.utime(template, (stat.st_atime, stat.st_mtime))
+        value = json.loads(result.value())
+        self.assertEqual(value['items'][0]['name'][0], u'Luheca Designs')
+        (key, (version, spider)), = cached.items()
+        self.assertIsNot(self.bot_resource._spiders[key][1], spider)
+        # the fetch slots of users without fetches in progress are dropped
+        self.assertEqual(self.bot_resource._fetch_slots, {})
+
+    @inlineCallbacks
+    def test_disconnect_cancels_only_its_fetch(self):
+        test_url = "http://localhost:8997/test.html"
+        request = _SlydDummyRequest(
+            'POST', 'fetch', data=json.dumps({'request': {'url': test_url}}))
+        self.botsite.getResourceFor(request).render(request)
+        crawler = self.bot_resource._crawler
+        request.processingFailed(Failure(ConnectionDone()))
+        self.assertTrue(request.fetch_cancelled)
+        # let the engine drop the cancelled fetch
+        yield deferLater(reactor, 0.2, lambda: None)
+
+        result = yield self._fetch(test_url)
+        value = json.loads(result.value())
+        self.assertEqual(value['response']['status'], 200)
+        self.assertIs(self.bot_resource._crawler, crawler)
+        self.assertTrue(crawler.crawling)
+        self.assertFalse(request.written)
+
     def tearDown(self):
-        self.bot_resource.stop()
         self.listen_port.stopListening()
+        return self.bot_resource.stop()
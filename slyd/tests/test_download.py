@@ -0,0 +1,97 @@
+import os
+import zipfile
+
+from shutil import rmtree
+from tempfile import mkdtemp
+from six import StringIO
+from twisted.trial import unittest
+from twisted.internet.defer import inlineCallbacks
+from twisted.web.test.requesthelper import DummyRequest
+
+from slyd.utils.download import (ArchiveCache, ArchiveStream,
+                                 ArchiveStreamer, FileSystemProjectArchiver)
+from .settings import SPEC_DATA_DIR
+
+
+def zip_contents(data):
+    archive = zipfile.ZipFile(StringIO(data))
+    return {name: archive.read(name) for name in archive.namelist()}
+
+
+class BrokenArchiver(object):
+    def write_archive(self, out, spiders=None):
+        raise AssertionError('Cached archives should not be built')
+
+
+class EvictingCache(ArchiveCache):
+    def get(self, key):
+        archive = super(EvictingCache, self).get(key)
+        os.remove(self._path(key))
+        return archive
+
+
+class DownloadTest(unittest.TestCase):
+
+    def setUp(self):
+        self.archiver = FileSystemProjectArchiver('test',
+                                                  base_dir=SPEC_DATA_DIR)
+
+    def test_archive_stream(self):
+        chunks = []
+        stream = ArchiveStream(chunks.append)
+        stream.chunk_size = 1024
+        self.archiver.write_archive(stream)
+        stream.close()
+        self.assertTrue(len(chunks) > 1)
+        self.assertEqual(stream.tell(), len(''.join(chunks)))
+        self.assertEqual(zip_contents(''.join(chunks)),
+                         zip_contents(self.archiver.archive().read()))
+
+    @inlineCallbacks
+    def test_stream_to_request(self):
+        request = DummyRequest([])
+        yield ArchiveStreamer(self.archiver, '*').stream(request)
+        self.assertEqual(request.finished, 1)
+        contents = zip_contents(''.join(request.written))
+        self.assertIn('spiders/pinterest.com.json', contents)
+        self.assertEqual(contents,
+                         zip_contents(self.archiver.archive('*').read()))
+
+    @inlineCallbacks
+    def test_archive_cache(self):
+        cache_dir = mkdtemp()
+        self.addCleanup(rmtree, cache_dir)
+        cache = ArchiveCache(cache_dir)
+        key = cache.key('test', ['abc'], '*', [0, 10])
+        request = DummyRequest([])
+        yield ArchiveStreamer(self.archiver, '*', cache, key).stream(request)
+        archive = ''.join(request.written)
+        self.assertEqual(os.listdir(cache_dir), [key + '.zip'])
+
+        # The same revision is sent from the cache
+        request = DummyRequest([])
+        streamer = ArchiveStreamer(BrokenArchiver(), '*', cache, key)
+        yield streamer.stream(request)
+        self.assertEqual(request.finished, 1)
+        self.assertEqual(''.join(request.written), archive)
+        self.assertEqual(request.outgoingHeaders['content-length'],
+                         str(len(archive)))
+
+        # Archives evicted while they are sent are still sent whole
+        request = DummyRequest([])
+        streamer = ArchiveStreamer(BrokenArchiver(), '*',
+                                   EvictingCache(cache_dir), key)
+        yield streamer.stream(request)
+        self.assertEqual(''.join(request.written), archive)
+        self.assertEqual(os.listdir(cache_dir), [])
+
+        # The least recently used archives are evicted
+        cache.max_size = len(archive) * 2
+        cache.add(key, archive)
+        cache.add('other', archive)
+        os.utime(cache._path('other'), (0, 0))
+        cache.add('new', archive)
+        self.assertIsNone(cache.get('other'))
+        for name in (key, 'new'):
+            with cache.get(name) as f:
+                self.assertEqual(f.read(), archive)
@@ -0,0 +1,86 @@
+import json
+import unittest
+from tempfile import mkdtemp
+from os.path import join
+from shutil import rmtree
+from distutils.dir_util import copy_tree
+
+from slyd.splash.commands import ProjectData
+from slyd.splash.ferry import FerryServerProtocol, User
+from slyd.splash.utils import BadRequest
+from .utils import create_spec_manager
+from .settings import SPEC_DATA_DIR
+
+
+class FerryTest(unittest.TestCase):
+
+    def setUp(self):
+        self.temp_projects_dir = mkdtemp(dir=SPEC_DATA_DIR,
+                                         prefix='test-run-')
+        copy_tree(join(SPEC_DATA_DIR, 'test'),
+                  join(self.temp_projects_dir, 'test'))
+        self.socket = FerryServerProtocol()
+        user = User({'username': 'test', 'staff': False})
+        self.socket.factory = {self.socket: user}
+        self.socket.spec_manager = create_spec_manager(self.temp_projects_dir)
+        # Spiders are built with the bot plugins, like the bot resource does
+        settings = self.socket.spec_manager.settings.copy()
+        settings.set('PLUGINS', [p['bot'] for p in settings.get('PLUGINS')])
+        self.socket.settings = settings
+        self.meta = {'project': 'test', 'spider': 'pinterest.com'}
+        self.spec = self.socket.spec_manager.project_spec('test', user.auth)
+
+    def tearDown(self):
+        rmtree(self.temp_projects_dir)
+
+    def test_update_spider_templates(self):
+        self.socket.open_spider(self.meta)
+        template = self.spec.template_json('pinterest.com', 'template')
+        template['scrapes'] = 'changed'
+        new_template = dict(template, name='new',
+                            original_body=template['original_body'] + ' ')
+        self.socket.update_spider(self.meta,
+                                  templates=[template, new_template])
+        spider = self.socket.spiderspec.spider
+        # Existing templates are replaced and new ones appended
+        self.assertEqual([t['name'] for t in spider['templates']],
+                         ['template', 'new'])
+        self.assertEqual(spider['templates'][0]['scrapes'], 'changed')
+        self.assertEqual(spider['template_names'], ['template', 'new'])
+
+    def test_save_batch(self):
+        self.socket.open_spider(self.meta)
+        spider = self.spec.spider_json('pinterest.com')
+        spider['start_urls'] = ['http://saved.com']
+        items = self.spec.resource('items')
+        items['new_item'] = {'fields': {}}
+        ProjectData().save_batch({
+            '_meta': self.meta,
+            'resources': [{'type': 'spider', 'spider': spider},
+                          {'type': 'items', 'items': items}]}, self.socket)
+        self.assertEqual(self.spec.spider_json('pinterest.com')['start_urls'],
+                         ['http://saved.com'])
+        self.assertIn('new_item', self.spec.resource('items'))
+        self.assertEqual(self.socket.spiderspec.spider['start_urls'],
+                         ['http://saved.com'])
+        self.assertIn('new_item', self.socket.spiderspec.items)
+
+    def test_invalid_batch(self):
+        self.socket.open_spider(self.meta)
+        path = join(self.temp_projects_dir, 'test', 'spiders',
+                    'pinterest.com.json')
+        with open(path) as f:
+            saved_spider = f.read()
+        spider = json.loads(saved_spider)
+        spider['start_urls'] = ['http://saved.com']
+        spiderspec = self.socket.spiderspec
+        # Nothing is written when any of the resources is not valid
+        with self.assertRaises(BadRequest):
+            ProjectData().save_batch({
+                '_meta': self.meta,
+                'resources': [{'type': 'spider', 'spider': spider},
+                              {'type': 'items', 'items': {'item': []}}]},
+                self.socket)
+        with open(path) as f:
+            self.assertEqual(f.read(), saved_spider)
+        self.assertIs(self.socket.spiderspec, spiderspec)
@@ -1,5 +1,8 @@
 import unittest
-from slyd.html import descriptify
+from slybot.baseurl import insert_base_url
+from slyd.html import descriptify, html4annotation
+from slyd.splash.utils import clean
+from slyd.utils import add_tagids
 
 JAVASCRIPT_URLS = (
     "javascript:alert();",
@@ -76,3 +79,15 @@ class HtmlTest(unittest.TestCase):
         for markup in SAFE_MARKUP:
             self.assertEqual(descriptify(markup), markup)
 
+    def test_single_pass(self):
+        base = "https://x.es/home/about.html"
+        page = (u'<html><head><base href="/"><script>alert(xss)</script>'
+                '</head><body onload="xss()"><ins><a href="/a">a</a></ins>'
+                '<img src="b.png" style="background: url(c.png)"></body>'
+                '</html>')
+        for proxy in (False, True):
+            self.assertEqual(html4annotation(page, base, proxy),
+                             descriptify(add_tagids(page), base, proxy))
+        for markup in (page, '<div><head/></div>', '<!DOCTYPE html><p>'):
+            self.assertEqual(clean(markup, base),
+                             insert_base_url(descriptify(markup, base), base))
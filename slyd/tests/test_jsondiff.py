@@ -1,5 +1,6 @@
 import unittest
-from slyd.gitstorage.jsondiff import merge_jsons, FieldDiff
+from slyd.gitstorage.jsondiff import (merge_jsons, merge_lists, FieldDiff,
+                                      Conflict)
 
 
 class JSONDiffTest(unittest.TestCase):
@@ -109,3 +110,37 @@ class JSONDiffTest(unittest.TestCase):
                              other_op='CHANGED')._asdict()
         self.assertEqual(({'b': {'__CONFLICT': conflict}}, True),
                          merge_jsons(base, mine, other))
+
+    def test_merge_nested(self):
+        base = {'a': {'b': 1, 'c': 2}}
+        mine = {'a': {'b': 11, 'c': 2}}
+        other = {'a': {'b': 1, 'c': 22}}
+        self.assertEqual(({'a': {'b': 11, 'c': 22}}, False),
+                         merge_jsons(base, mine, other))
+
+    def test_merge_lists(self):
+        base = ['a%d' % i for i in range(100)]
+        mine = ['new'] + base
+        other = base[:50] + ['changed'] + base[51:] + ['appended']
+        expected = ['new'] + other
+        self.assertEqual(expected, merge_lists(base, mine, other))
+        self.assertEqual(expected, merge_lists(base, other, mine))
+        # items replaced in both lists are merged one by one
+        base = [{'id': 1}, {'id': 2}, 'x']
+        mine = [{'id': 1, 'v': 1}, {'id': 2}, 'y']
+        other = [{'id': 1}, {'id': 2, 'v': 2}, 'x']
+        self.assertEqual([{'id': 1, 'v': 1}, {'id': 2, 'v': 2}, 'y'],
+                         merge_lists(base, mine, other))
+        # the same item changed in both lists is a conflict
+        merged = merge_lists(['a', 'b', 'c'], ['a', 'x', 'c'],
+                             ['a', 'y', 'c'])
+        self.assertEqual(['a', Conflict('x', 'y', 'b'), 'c'], merged)
+
+    def test_merge_lists_added_in_both(self):
+        # a list added in both jsons is merged against an empty list
+        self.assertEqual(({'a': [1, 2, 3]}, False),
+                         merge_jsons({}, {'a': [1, 2]}, {'a': [1, 2, 3]}))
+        merged, had_conflict = merge_jsons({}, {'a': [1, 2]}, {'a': [3]})
+        self.assertTrue(had_conflict)
+        self.assertEqual([1, 2], merged['a'][1:])
+        self.assertEqual([3], merged['a'][0]['__CONFLICT']['other_val'])
@@ -4,10 +4,25 @@ from os.path import join
 from shutil import rmtree
 from json import dumps, loads
 import copy
+import zipfile
+
+from six import StringIO
+from twisted.internet import defer
+from twisted.internet.defer import Deferred, inlineCallbacks
+from twisted.trial import unittest as trial
+from twisted.web import http
+from twisted.web.server import NOT_DONE_YET
+from twisted.web.test.requesthelper import DummyRequest
 
 from .settings import SPEC_DATA_DIR
 
+from slyd.api import APIResource
 from slyd.gitstorage.repoman import Repoman
+from slyd.gitstorage.commitgraph import CommitGraph
+from slyd.gitstorage.projects import GitProjectsManager
+from slyd.gitstorage.projectspec import GitProjectSpec
+from slyd.resources.projects import ProjectsManagerFileResponse
+from slyd.utils.download import ArchiveStreamer
 
 
 def j(json):
@@ -216,3 +231,221 @@ class RepomanTest(unittest.TestCase):
         # the file in b2 has an unresolved conflict
         self.assertIn('__CONFLICT',
                       j(repoman.file_contents_for_branch('f1', 'b2')))
+
+    def test_merge_reads_only_changed_blobs(self):
+        repoman = Repoman.create_repo(self.get_full_name('my_repo'))
+        for i in range(10):
+            repoman.save_file('f%d' % i, j({'a': i}), 'b1')
+        repoman.publish_branch('b1')
+        repoman.delete_branch('b1')
+        # b2 changes every file, b3 changes f0 and publishes first
+        for i in range(10):
+            repoman.save_file('f%d' % i, j({'a': i, 'b': i}), 'b2')
+        repoman.save_file('f0', j({'a': 0, 'c': 0}), 'b3')
+        repoman.publish_branch('b3')
+
+        store = repoman._repo.object_store
+        prefetched = []
+        store.prefetch = lambda shas: prefetched.extend(shas)
+        self.assertTrue(repoman.publish_branch('b2'))
+        # only the versions of f0 needed merging
+        self.assertEqual(3, len(set(prefetched)))
+        self.assertEqual(j({'a': 0, 'b': 0, 'c': 0}),
+                         repoman.file_contents_for_branch('f0', 'master'))
+        # the other files keep the blobs from b2
+        for i in range(1, 10):
+            self.assertEqual(repoman.blob_for_branch('f%d' % i, 'b2').id,
+                             repoman.blob_for_branch('f%d' % i, 'master').id)
+
+    def test_commit_graph(self):
+        repoman = Repoman.create_repo(self.get_full_name('my_repo'))
+        root = repoman.get_branch('master')
+        repoman.save_file('f1', j({'a': 1}), 'b1')
+        repoman.publish_branch('b1')
+        fork = repoman.get_branch('master')
+        repoman.save_file('f1', j({'a': 2}), 'b2')
+        repoman.save_file('f1', j({'a': 3}), 'b3')
+        repoman.save_file('f2', j({'b': 3}), 'b3')
+        b2, b3 = repoman.get_branch('b2'), repoman.get_branch('b3')
+
+        graph, store = Repoman.commit_graph, repoman._repo.object_store
+        self.assertTrue(repoman._is_ancestor_commit(b3, fork))
+        self.assertTrue(repoman._is_ancestor_commit(b3, root))
+        self.assertFalse(repoman._is_ancestor_commit(b3, b2))
+        self.assertFalse(repoman._is_ancestor_commit(fork, b3))
+        self.assertEqual(graph.get(store, root)[0] + 3,
+                         graph.get(store, b3)[0])
+        self.assertEqual(fork, graph.merge_base(store, b2, b3))
+        self.assertEqual(fork, graph.merge_base(store, fork, b3))
+        self.assertEqual(b3, graph.merge_base(store, b3, b3))
+
+        # Merges are based on the fork point
+        self.assertTrue(repoman.publish_branch('b2'))
+        self.assertFalse(repoman.publish_branch('b3'))
+        self.assertEqual(fork, graph.merge_base(
+            store, repoman.get_branch('b3'), repoman.get_branch('master')))
+
+        # A bounded graph indexes evicted commits again when needed
+        small = CommitGraph(max_size=2)
+        self.assertEqual(graph.get(store, b3), small.get(store, b3))
+        self.assertEqual(2, len(small))
+        self.assertTrue(small.is_ancestor(store, b3, root))
+        self.assertEqual(fork, small.merge_base(store, b2, b3))
+        self.assertEqual(2, len(small))
+
+    def test_coalesce_saves(self):
+        repoman = Repoman.create_repo(self.get_full_name('my_repo'))
+        repoman.coalesce_window = 60
+        repoman.save_file('f1', j({'a': 1}), 'b1')
+        repoman.save_file('f2', j({'b': 2}), 'b1')
+        repoman.save_file('f3', j({'c': 3}), 'b1')
+        repoman.delete_file('f3', 'b1')
+        self.assertEqual(len(repoman.get_branch_checkpoints('b1')), 2)
+        self.assertItemsEqual(['f1', 'f2'],
+                              repoman.list_files_for_branch('b1'))
+        self.assertTrue(repoman.publish_branch('b1'))
+        # Published commits are kept
+        repoman.save_file('f1', j({'a': 2}), 'b2')
+        self.assertEqual(len(repoman.get_branch_checkpoints('b2')), 2)
+        # So are the commits of other authors
+        other = Repoman.open_repo(self.get_full_name('my_repo'), 'other')
+        other.coalesce_window = 60
+        other.save_file('f2', j({'b': 3}), 'b2')
+        self.assertEqual(len(other.get_branch_checkpoints('b2')), 3)
+
+    def test_collect_garbage(self):
+        repoman = Repoman.create_repo(self.get_full_name('my_repo'))
+        repoman.coalesce_window = 60
+        for i in range(3):
+            repoman.save_file('f1', j({'a': i}), 'b1')
+        repoman.save_file('f2', j({'b': 1}), 'b2')
+        repoman.delete_branch('b2')
+        # 2 replaced commits, trees and blobs and the commit, tree and blob
+        # of the deleted branch
+        self.assertEqual(9, repoman.collect_garbage())
+        self.assertEqual(0, repoman.collect_garbage())
+        self.assertEqual(j({'a': 2}),
+                         repoman.file_contents_for_branch('f1', 'b1'))
+        self.assertTrue(repoman.publish_branch('b1'))
+        self.assertEqual(j({'a': 2}),
+                         repoman.file_contents_for_branch('f1', 'master'))
+
+    def test_savejsons(self):
+        name = self.get_full_name('my_repo')
+        repoman = Repoman.create_repo(name)
+        repoman.save_file('spiders/s1.json', j({'start_urls': []}), 'master')
+        commits = len(repoman.get_branch_checkpoints('master'))
+        spec = GitProjectSpec(name, {'username': 'user'})
+        spec.savejsons([({'start_urls': ['http://a.com']}, ['spiders', 's1']),
+                        ({'name': 't1'}, ['spiders', 's1', 't1']),
+                        ({'item': {}}, ['items'])])
+        # All the resources are saved in a single commit
+        repoman = Repoman.open_repo(name)
+        self.assertEqual(len(repoman.get_branch_checkpoints('user')),
+                         commits + 1)
+        self.assertEqual({'start_urls': ['http://a.com']},
+                         spec.resource('spiders', 's1'))
+        self.assertEqual({'name': 't1'}, spec.resource('spiders', 's1', 't1'))
+        self.assertEqual({'item': {}}, spec.resource('items'))
+
+    def test_object_cache(self):
+        Repoman.object_cache.clear()
+        repoman = Repoman.create_repo(self.get_full_name('my_repo'))
+        repoman.save_file('f1', j({'a': 1}), 'b1')
+        tree = repoman._get_branch_tree('b1')
+        repoman.save_file('f2', j({'b': 2}), 'b1')
+        # cached trees are not modified by later saves
+        self.assertEqual(['f1'], [i.path for i in tree.items()])
+
+        repoman = Repoman.open_repo(self.get_full_name('my_repo'))
+        stats = Repoman.cache_stats()
+        for _ in range(3):
+            self.assertEqual(j({'b': 2}),
+                             repoman.file_contents_for_branch('f2', 'b1'))
+        new_stats = Repoman.cache_stats()
+        # the commit, tree and blob were saved through the cache
+        self.assertEqual(new_stats['misses'], stats['misses'])
+        self.assertEqual(new_stats['hits'], stats['hits'] + 9)
+        # the branch is only looked up once
+        self.assertEqual(new_stats['ref_misses'], stats['ref_misses'] + 1)
+        self.assertEqual(new_stats['ref_hits'], stats['ref_hits'] + 2)
+
+
+class ConditionalRequest(DummyRequest):
+    lastModified = None
+
+    def setLastModified(self, when):
+        cached = http.Request.setLastModified.__func__(self, when)
+        self.setHeader('Last-Modified', http.datetimeToString(when))
+        return cached
+
+
+class NamedProjectsManager(GitProjectsManager):
+    def _get_project_name(self, name):
+        return name
+
+
+class GitDownloadTest(trial.TestCase):
+
+    def setUp(self):
+        self.temp_repos_dir = mkdtemp(dir=SPEC_DATA_DIR,
+                                      prefix='test-run-')
+        self.addCleanup(rmtree, self.temp_repos_dir)
+        GitProjectsManager.setup('dulwich.fsrepo.FsRepo', self.temp_repos_dir)
+        self.manager = NamedProjectsManager({'username': 'test',
+                                             'staff': True})
+        self.manager.request = DummyRequest([])
+        self.manager.create_project('p1')
+
+    @inlineCallbacks
+    def test_stream_download(self):
+        # The repository is read in a thread
+        result = self.manager.download_project('p1', '*', stream=True)
+        self.assertIsInstance(result, Deferred)
+        streamer = yield result
+        self.assertIsInstance(streamer, ArchiveStreamer)
+        command = {'cmd': 'download', 'args': ['p1', '*']}
+        self.assertEqual(streamer.etag, self.manager._gen_etag(command))
+
+        request = DummyRequest([])
+        response = ProjectsManagerFileResponse(streamer, command,
+                                               self.manager)
+        APIResource(None).deferred_finished(request, response, streamer)
+        yield request.notifyFinish()
+        self.assertEqual(request.outgoingHeaders['etag'], streamer.etag)
+        archive = zipfile.ZipFile(StringIO(''.join(request.written)))
+        self.assertIn('project.json', archive.namelist())
+
+    @inlineCallbacks
+    def test_download_discarded_changes(self):
+        command = {'cmd': 'download', 'args': ['p1', '*']}
+
+        @inlineCallbacks
+        def download(headers):
+            request = ConditionalRequest([])
+            request.headers.update(headers)
+            self.manager.request = request
+            streamer = yield self.manager.download_project('p1', '*',
+                                                           stream=True)
+            response = ProjectsManagerFileResponse(streamer, command,
+                                                   self.manager)
+            body = response.format_response(request, streamer)
+            if body is NOT_DONE_YET:
+                yield request.notifyFinish()
+            defer.returnValue(request)
+
+        self.manager.save_file('p1', 'items.json', {'changed': {}})
+        request = yield download({})
+        headers = {'if-none-match': request.outgoingHeaders['etag'],
+                   'if-modified-since':
+                       request.outgoingHeaders['last-modified']}
+        request = yield download(headers)
+        self.assertEqual(request.responseCode, http.NOT_MODIFIED)
+
+        # The archive is sent again even though it is built from older
+        # commits once the changes are discarded
+        Repoman.open_repo('p1').delete_branch('test')
+        request = yield download(headers)
+        self.assertNotEqual(request.responseCode, http.NOT_MODIFIED)
+        archive = zipfile.ZipFile(StringIO(''.join(request.written)))
+        self.assertEqual(loads(archive.read('items.json')), {})
@@ -4,10 +4,14 @@ from os.path import join, basename
 from shutil import rmtree
 from distutils.dir_util import copy_tree
 from twisted.trial import unittest
+from twisted.internet import reactor
 from twisted.internet.defer import inlineCallbacks
-from slyd.projectspec import create_project_resource
+from twisted.web.server import Site
+from twisted.web.static import File
+from slyd.projectspec import create_project_resource, ProjectSpec
+from slyd.utils.cache import resource_cache
 from .utils import TestSite, create_spec_manager
-from .settings import SPEC_DATA_DIR
+from .settings import SPEC_DATA_DIR, RESOURCE_DIR
 import unittest as pyunittest
 
 class CrawlerSpecTest(unittest.TestCase):
@@ -99,5 +103,63 @@ class CrawlerSpecTest(unittest.TestCase):
         result = yield self.specsite.get('spiders/c2')
         self.assertEqual(result.value(), '{}\n')
 
+    def test_resource_cache(self):
+        spec = ProjectSpec(self.project, {'username': 'test'})
+        spider = spec.resource('spiders', 'pinterest.com')
+        # callers get their own copy of the cached spider
+        spider['start_urls'].append('http://modified.com')
+        spider['templates'] = []
+        cached = spec.resource('spiders', 'pinterest.com')
+        self.assertNotIn('http://modified.com', cached['start_urls'])
+        self.assertNotIn('templates', cached)
+
+        spider = spec.resource('spiders', 'pinterest.com')
+        spider['start_urls'] = ['http://saved.com']
+        spec.savejson(spider, ['spiders', 'pinterest.com'])
+        self.assertEqual(spec.resource('spiders', 'pinterest.com'), spider)
+
+        # changes made to the file by others are picked up too
+        path = join(self.temp_project_dir, 'spiders', 'pinterest.com.json')
+        with open(path, 'w') as f:
+            json.dump({'start_urls': []}, f)
+        self.assertEqual(spec.resource('spiders', 'pinterest.com'),
+                         {'start_urls': []})
+
+        spec.remove_spider('pinterest.com')
+        self.assertEqual(spec.spider_json('pinterest.com'), {})
+        resource_cache.invalidate(self.temp_project_dir)
+        self.assertFalse([path for path in resource_cache._resources
+                          if path.startswith(self.temp_project_dir)])
+
+    def test_savejsons(self):
+        spec = ProjectSpec(self.project, {'username': 'test'})
+        spider = spec.resource('spiders', 'pinterest.com')
+        spider['start_urls'] = ['http://saved.com']
+        items = spec.resource('items')
+        items['new_item'] = {'fields': {}}
+        spec.savejsons([(spider, ['spiders', 'pinterest.com']),
+                        (items, ['items'])])
+        self.assertEqual(spec.resource('spiders', 'pinterest.com'), spider)
+        self.assertEqual(spec.resource('items'), items)
+
+    @inlineCallbacks
+    def test_extract(self):
+        docroot = Site(File(join(RESOURCE_DIR, 'docroot')))
+        port = reactor.listenTCP(0, docroot)
+        self.addCleanup(port.stopListening)
+        base_url = 'http://localhost:%d/' % port.getHost().port
+        urls = [base_url + path
+                for path in ('pin1.html', 'notexists', 'test.html')]
+        result = yield self.specsite.post('extract/pinterest.com',
+                                          data=json.dumps(urls))
+        value = json.loads(result.value())
+        self.assertEqual(value['status'], 'ok')
+        # pages that can't be fetched are skipped
+        subitems = {s['key']: s for s in value['subitems']}
+        self.assertEqual(sorted(subitems), [urls[0], urls[2]])
+        items = subitems[urls[0]]['items']
+        self.assertEqual(items[0]['name'], [u'Luheca Designs'])
+        self.assertIsNone(subitems[urls[2]]['items'])
+
     def tearDown(self):
         rmtree(self.temp_project_dir)